@@ -1,3 +1,8 @@
 from django.contrib import admin
 
+from .models import Historial, PasoHistorial, Trabajo
+
 # Register your models here.
+admin.site.register(Trabajo)
+admin.site.register(Historial)
+admin.site.register(PasoHistorial)
@@ -0,0 +1,99 @@
+"""
+Almacenamiento de las subidas direccionado por contenido.
+
+FileSystemStorage guarda cada subida con el nombre del archivo y le agrega un
+sufijo si ya existe, así que subir la misma imagen varias veces deja varias
+copias, cada una con su propia entrada en las cachés de imágenes
+decodificadas y de resultados. AlmacenContenido guarda cada archivo como
+DIRECTORIO/ab/cd/<sha256><extensión>: el mismo contenido siempre tiene el
+mismo nombre y se escribe una sola vez. Los dos primeros niveles de
+subdirectorios mantienen pequeños los directorios aunque haya millones de
+archivos.
+
+Cada archivo tiene una fila Archivo en la base de datos con su tamaño, las
+veces que se subió y la última vez que se usó (registrar_uso), que es lo que
+el comando limpiar_media consulta para borrar por antigüedad o LRU sin
+recorrer el disco.
+"""
+import hashlib
+import os
+import uuid
+from datetime import timedelta
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Archivo
+from .utils import ingesta
+
+# Subdirectorio de MEDIA_ROOT con los archivos subidos
+DIRECTORIO = 'originales'
+
+# Segundos entre dos actualizaciones de Archivo.usado del mismo archivo, para
+# no escribir en la base de datos en cada edición
+INTERVALO_USO = 60
+
+
+class AlmacenContenido(FileSystemStorage):
+    """
+    FileSystemStorage que nombra cada archivo por el sha256 de su contenido.
+    """
+
+    def __init__(self, *args, directorio=DIRECTORIO, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.directorio = directorio
+
+    def nombre_contenido(self, sha256, nombre):
+        extension = os.path.splitext(nombre)[1].lower()
+        return f'{self.directorio}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+    def save(self, name, content, max_length=None):
+        """
+        Guarda content con su nombre por contenido (name solo aporta la
+        extensión) y devuelve ese nombre. Si el contenido ya estaba, no se
+        escribe de nuevo.
+        """
+        if name is None:
+            name = content.name
+        resumen = hashlib.sha256()
+        tamano = 0
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for bloque in (content.chunks() if hasattr(content, 'chunks') else iter(lambda: content.read(1 << 20), b'')):
+            resumen.update(bloque)
+            tamano += len(bloque)
+        sha256 = resumen.hexdigest()
+        nombre = self.nombre_contenido(sha256, name)
+        if not self.exists(nombre):
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            # se escribe con otro nombre y se renombra: otra subida del mismo
+            # contenido al mismo tiempo nunca ve un archivo a medias
+            temporal = super().save(f'{self.directorio}/tmp/{uuid.uuid4().hex}.tmp', content, max_length)
+            os.makedirs(os.path.dirname(self.path(nombre)), exist_ok=True)
+            os.replace(self.path(temporal), self.path(nombre))
+        ahora = timezone.now()
+        registro, creado = Archivo.objects.get_or_create(
+            nombre=nombre, defaults={'sha256': sha256, 'bytes': tamano, 'usado': ahora})
+        if not creado:
+            Archivo.objects.filter(pk=registro.pk).update(subidas=F('subidas') + 1, usado=ahora)
+        return nombre
+
+    def delete(self, name):
+        """
+        Borra el archivo, su pirámide de resoluciones y su registro.
+        """
+        ingesta.borrar_piramide(self.path(name))
+        super().delete(name)
+        Archivo.objects.filter(nombre=name).delete()
+
+
+def registrar_uso(nombre):
+    """
+    Marca como usado ahora el archivo nombre (relativo a MEDIA_ROOT), como
+    mucho una vez cada INTERVALO_USO segundos. Los nombres que no son del
+    almacenamiento por contenido se ignoran.
+    """
+    ahora = timezone.now()
+    Archivo.objects.filter(nombre=nombre, usado__lt=ahora - timedelta(seconds=INTERVALO_USO)).update(usado=ahora)
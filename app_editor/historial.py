@@ -0,0 +1,215 @@
+"""
+Historial de ediciones por sesión con deshacer y rehacer.
+
+Cada paso se guarda como la descripción de su operación (los mismos
+parámetros JSON de utils/acciones.py), no como una imagen, así que agregar,
+deshacer o rehacer un paso no escribe píxeles. La imagen del paso N se
+reconstruye aplicando en una sola cadena de bloques los pasos que faltan
+desde el punto de control más cercano anterior a N (o desde la base, que es
+el original mientras no se descarten pasos).
+
+Los puntos de control se materializan al renderizar: si el paso pedido
+queda a PASOS_ENTRE_PUNTOS o más del punto anterior, la imagen de ese paso
+se guarda en el formato crudo de utils/crudo.py (se vuelve a abrir con
+mmap, sin decodificar) en EDITOR_HISTORIAL['DIRECTORIO']. El resultado codificado se
+sirve desde la caché de resultados, con una clave que incluye la base y
+todos los pasos, así que ir y volver entre pasos ya vistos no procesa nada.
+
+El espacio queda acotado por sesión:
+- cada historial conserva como mucho PASOS_MAXIMOS pasos; al superarlos, un
+  punto de control pasa a ser la nueva base y los pasos anteriores se
+  descartan (ya no se pueden deshacer)
+- los puntos de control de una sesión ocupan como mucho BYTES_SESION; se
+  borran primero los más antiguos y después los historiales de otras
+  imágenes de la sesión, empezando por el menos usado
+"""
+import os
+import tempfile
+
+import numpy as np
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Historial, PasoHistorial
+from .utils import acciones
+from .utils import bloques
+from .utils import crudo
+from .utils import decodificadas
+from .utils import salida as politica_salida
+
+
+def obtener(sesion, ruta_original):
+    """
+    Historial de la imagen en la sesión; se crea vacío si no existe.
+    """
+    historial, _ = Historial.objects.get_or_create(sesion=sesion, ruta_original=ruta_original)
+    return historial
+
+def agregar(historial, parametros):
+    """
+    Agrega un paso tras la posición actual. Los pasos que se podían rehacer
+    se descartan, como en cualquier editor.
+    """
+    with transaction.atomic():
+        _borrar_pasos(historial.pasos.filter(numero__gt=historial.posicion))
+        historial.posicion += 1
+        PasoHistorial.objects.create(historial=historial, numero=historial.posicion,
+                                     parametros={k: v for k, v in parametros.items() if k != 'salida'})
+        historial.save()
+    if historial.posicion > settings.EDITOR_HISTORIAL['PASOS_MAXIMOS']:
+        _rebasar(historial)
+    return historial
+
+def mover(historial, posicion):
+    """
+    Deshace o rehace pasos hasta posicion (se ajusta al rango 0..total).
+    """
+    historial.posicion = min(max(int(posicion), 0), historial.total())
+    historial.save()
+    return historial
+
+def renderizar(historial, cache, salida=None, abrir=decodificadas.decodificar, medicion=None):
+    """
+    Codifica en la caché de resultados la imagen de la posición actual y
+    devuelve su nombre. abrir(ruta) decodifica el original (por ejemplo
+    desde la caché de imágenes decodificadas). medicion (opcional) marca las
+    mismas etapas que render_to_cache.
+    """
+    pasos = list(historial.pasos.filter(numero__lte=historial.posicion))
+    parametros = {'operacion': 'historial', 'pasos': [paso.parametros for paso in pasos], 'salida': salida}
+    clave = cache.clave(historial.ruta_base or historial.ruta_original, parametros)
+    extension = politica_salida.extension(salida)
+    nombre = cache.buscar(clave, extension)
+    if medicion is not None:
+        medicion.marcar('cache')
+    if nombre is not None:
+        return nombre
+
+    fuente, pendientes = reconstruir(historial, pasos, abrir)
+    if medicion is not None:
+        medicion.marcar('decodificacion')
+    with cache.escribir(clave, extension) as archivo:
+        acciones.codificar(fuente, operaciones(pendientes), archivo, settings.EDITOR_MEGAPIXELES_POR_BANDAS,
+                           salida, medicion, settings.EDITOR_HILOS_BANDAS)
+    if medicion is not None:
+        medicion.marcar('escritura')
+    return cache.nombre(clave, extension)
+
+def operaciones(pasos):
+    """
+    Cadena de operaciones de bloques de varios pasos seguidos.
+    """
+    cadena = []
+    for paso in pasos:
+        cadena += acciones.construir_operaciones(paso.parametros)
+    return cadena
+
+def reconstruir(historial, pasos, abrir=decodificadas.decodificar):
+    """
+    (fuente, pasos pendientes) para llegar al último de pasos: la fuente es
+    el punto de control más cercano (o la base) y los pendientes son los
+    pasos que hay que aplicarle. Si quedan PASOS_ENTRE_PUNTOS o más, se
+    materializa un punto de control nuevo y no queda ninguno pendiente.
+    """
+    inicio = 0
+    fuente = None
+    for indice in range(len(pasos) - 1, -1, -1):
+        if pasos[indice].punto_control and os.path.exists(pasos[indice].punto_control):
+            inicio = indice + 1
+            fuente = _abrir_punto(pasos[indice].punto_control)
+            break
+    if fuente is None:
+        fuente = _abrir_punto(historial.ruta_base) if historial.ruta_base else abrir(historial.ruta_original)
+    pendientes = pasos[inicio:]
+    if len(pendientes) >= settings.EDITOR_HISTORIAL['PASOS_ENTRE_PUNTOS']:
+        fuente = bloques.procesar_completa(fuente, operaciones(pendientes))
+        ultimo = pendientes[-1]
+        ultimo.punto_control, ultimo.bytes_punto_control = _guardar_punto(fuente)
+        ultimo.save(update_fields=['punto_control', 'bytes_punto_control'])
+        ajustar_presupuesto(historial, ultimo.punto_control)
+        pendientes = []
+    return fuente, pendientes
+
+def ajustar_presupuesto(historial, conservar=''):
+    """
+    Borra puntos de control de la sesión de historial hasta que quepan en
+    BYTES_SESION: primero los de los pasos más antiguos (salvo el punto
+    conservar) y después los historiales de otras imágenes de la sesión.
+    """
+    maximo = settings.EDITOR_HISTORIAL['BYTES_SESION']
+    historiales = Historial.objects.filter(sesion=historial.sesion)
+    puntos = PasoHistorial.objects.filter(historial__sesion=historial.sesion).exclude(punto_control='')
+    ocupado = ((puntos.aggregate(total=Sum('bytes_punto_control'))['total'] or 0)
+               + (historiales.aggregate(total=Sum('bytes_base'))['total'] or 0))
+    for paso in puntos.exclude(punto_control=conservar).order_by('creado'):
+        if ocupado <= maximo:
+            return
+        _borrar_archivo(paso.punto_control)
+        ocupado -= paso.bytes_punto_control
+        PasoHistorial.objects.filter(pk=paso.pk).update(punto_control='', bytes_punto_control=0)
+    for otro in historiales.exclude(pk=historial.pk).order_by('actualizado'):
+        if ocupado <= maximo:
+            return
+        ocupado -= otro.bytes_base
+        borrar(otro)
+
+def borrar(historial):
+    """
+    Borra un historial con sus puntos de control en disco.
+    """
+    _borrar_pasos(historial.pasos.all())
+    _borrar_archivo(historial.ruta_base)
+    historial.delete()
+
+def _rebasar(historial):
+    # la nueva base es el primer punto de control que deja como mucho
+    # PASOS_MAXIMOS pasos; si no hay ninguno, se materializa
+    corte = historial.posicion - settings.EDITOR_HISTORIAL['PASOS_MAXIMOS']
+    pasos = list(historial.pasos.all())
+    nueva = next((paso for paso in pasos[corte - 1:] if paso.punto_control and os.path.exists(paso.punto_control)),
+                 None)
+    if nueva is None:
+        nueva = pasos[corte - 1]
+        fuente, pendientes = reconstruir(historial, pasos[:corte])
+        if pendientes:
+            nueva.punto_control, nueva.bytes_punto_control = _guardar_punto(
+                bloques.procesar_completa(fuente, operaciones(pendientes)))
+    with transaction.atomic():
+        _borrar_archivo(historial.ruta_base)
+        historial.ruta_base, historial.bytes_base = nueva.punto_control, nueva.bytes_punto_control
+        PasoHistorial.objects.filter(pk=nueva.pk).update(punto_control='') # ahora es la base
+        _borrar_pasos(historial.pasos.filter(numero__lte=nueva.numero))
+        for paso in historial.pasos.all():
+            PasoHistorial.objects.filter(pk=paso.pk).update(numero=paso.numero - nueva.numero)
+        historial.posicion -= nueva.numero
+        historial.save()
+
+def _abrir_punto(ruta):
+    """
+    Imagen de un punto de control (o de la base) sin decodificar. Los .npy son
+    de antes de que se guardaran en formato crudo.
+    """
+    return np.load(ruta, mmap_mode='r') if ruta.endswith('.npy') else crudo.abrir(ruta)
+
+def _guardar_punto(img):
+    directorio = FileSystemStorage().path(settings.EDITOR_HISTORIAL['DIRECTORIO'])
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, ruta = tempfile.mkstemp(suffix=crudo.EXTENSION, dir=directorio)
+    try:
+        with os.fdopen(descriptor, 'wb') as archivo:
+            crudo.escribir(archivo, img)
+    except Exception:
+        os.remove(ruta)
+        raise
+    return ruta, os.path.getsize(ruta)
+
+def _borrar_pasos(pasos):
+    for ruta in pasos.exclude(punto_control='').values_list('punto_control', flat=True):
+        _borrar_archivo(ruta)
+    pasos.delete()
+
+def _borrar_archivo(ruta):
+    if ruta and os.path.exists(ruta):
+        os.remove(ruta)
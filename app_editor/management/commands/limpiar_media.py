@@ -0,0 +1,146 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.utils import timezone
+
+from app_editor import almacenamiento, historial
+from app_editor.models import Archivo, Historial, PasoHistorial, Trabajo
+from app_editor.utils import ingesta
+from app_editor.views import raw_cache, result_cache
+
+# Los temporales de subidas y los puntos de control sin fila se conservan al
+# menos este tiempo aunque --dias sea menor: pueden ser de una petición en curso
+GRACIA_HUERFANOS = timedelta(hours=1)
+
+class Command(BaseCommand):
+    help = ("Borra de MEDIA_ROOT lo que no se usa: historiales de edición de sesiones cerradas, resultados "
+            "procesados, copias crudas de imágenes decodificadas, imágenes subidas y archivos sueltos de "
+            "versiones anteriores que llevan más de --dias sin usarse y, con --bytes-resultados o "
+            "--bytes-originales, los menos usados hasta quedar dentro de ese tamaño. También borra los "
+            "temporales de subidas interrumpidas y los puntos de control que ya no son de ningún historial. No se "
+            "borra nada que use un trabajo en curso o el historial de una sesión abierta.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=float, default=7, help='antigüedad máxima desde el último uso (7 por defecto)')
+        parser.add_argument('--bytes-resultados', type=int, help='tamaño máximo de la caché de resultados (LRU)')
+        parser.add_argument('--bytes-originales', type=int, help='tamaño máximo de las imágenes subidas (LRU)')
+
+    def handle(self, *args, **options):
+        if options['dias'] < 0:
+            raise CommandError('--dias no puede ser negativo.')
+        limite = timezone.now() - timedelta(days=options['dias'])
+
+        # el historial de una sesión abierta se puede seguir deshaciendo, por viejo que sea
+        abiertas = Session.objects.filter(expire_date__gt=timezone.now()).values('session_key')
+        viejos = Historial.objects.filter(actualizado__lt=limite).exclude(sesion__in=abiertas)
+        total_historiales = len(viejos)
+        for registro in viejos:
+            historial.borrar(registro)
+        self.stdout.write(f'{total_historiales} historiales de edición borrados')
+
+        recientes = Trabajo.objects.filter(actualizado__gte=limite).exclude(resultado='')
+        archivos, tamano = result_cache().limpiar(limite.timestamp(), options['bytes_resultados'],
+                                                 set(recientes.values_list('resultado', flat=True)))
+        self.stdout.write(f'{archivos} resultados borrados ({tamano / 2**20:.1f} MiB)')
+
+        archivos, tamano = raw_cache().limpiar(limite.timestamp())
+        self.stdout.write(f'{archivos} copias crudas borradas ({tamano / 2**20:.1f} MiB)')
+
+        en_uso = set(Historial.objects.values_list('ruta_original', flat=True))
+        en_uso.update(Trabajo.objects.filter(estado__in=[Trabajo.PENDIENTE, Trabajo.EN_PROCESO])
+                      .values_list('ruta_original', flat=True))
+        archivos, tamano = self.limpiar_originales(limite, options['bytes_originales'], en_uso)
+        self.stdout.write(f'{archivos} imágenes subidas borradas ({tamano / 2**20:.1f} MiB)')
+
+        archivos, tamano = self.limpiar_huerfanos(min(limite, timezone.now() - GRACIA_HUERFANOS))
+        self.stdout.write(f'{archivos} temporales y puntos de control huérfanos borrados ({tamano / 2**20:.1f} MiB)')
+
+        archivos, tamano = self.limpiar_sueltos(limite, en_uso)
+        self.stdout.write(self.style.SUCCESS(f'{archivos} archivos sueltos borrados ({tamano / 2**20:.1f} MiB)'))
+
+    def limpiar_originales(self, limite, bytes_maximos, en_uso):
+        """
+        Borra las subidas sin usar desde limite y después las menos usadas
+        hasta bytes_maximos, salvo las de en_uso (rutas completas).
+        """
+        almacen = almacenamiento.AlmacenContenido()
+        ocupado = Archivo.objects.aggregate(total=Sum('bytes'))['total'] or 0
+        borrados = [0, 0]
+        # se lee la lista entera antes de borrar filas de la misma tabla
+        for nombre, tamano, usado in list(Archivo.objects.order_by('usado').values_list('nombre', 'bytes', 'usado')):
+            viejo = usado < limite
+            if not viejo and (bytes_maximos is None or ocupado <= bytes_maximos):
+                break
+            if almacen.path(nombre) in en_uso:
+                continue
+            almacen.delete(nombre)
+            ocupado -= tamano
+            borrados[0] += 1
+            borrados[1] += tamano
+        return tuple(borrados)
+
+    def limpiar_huerfanos(self, limite):
+        """
+        Borra los temporales de AlmacenContenido (subidas que no llegaron a
+        renombrarse) y los archivos del directorio del historial que no son
+        punto de control ni base de ningún historial, si no se modificaron
+        desde limite.
+        """
+        fs = FileSystemStorage()
+        puntos = set(PasoHistorial.objects.exclude(punto_control='').values_list('punto_control', flat=True))
+        puntos.update(Historial.objects.exclude(ruta_base='').values_list('ruta_base', flat=True))
+        borrados = [0, 0]
+        for directorio, conservar in ((fs.path(f'{almacenamiento.DIRECTORIO}/tmp'), set()),
+                                      (fs.path(settings.EDITOR_HISTORIAL['DIRECTORIO']), puntos)):
+            archivos, tamano = self.borrar_viejos(directorio, limite, conservar)
+            borrados[0] += archivos
+            borrados[1] += tamano
+        return tuple(borrados)
+
+    def borrar_viejos(self, directorio, limite, conservar):
+        """
+        Borra los archivos de directorio que no están en conservar (rutas
+        completas) y no se modificaron desde limite.
+        """
+        borrados = [0, 0]
+        if not os.path.isdir(directorio):
+            return tuple(borrados)
+        with os.scandir(directorio) as iterador:
+            for entrada in iterador:
+                if not entrada.is_file() or entrada.path in conservar:
+                    continue
+                info = entrada.stat()
+                if info.st_mtime >= limite.timestamp():
+                    continue
+                os.remove(entrada.path)
+                borrados[0] += 1
+                borrados[1] += info.st_size
+        return tuple(borrados)
+
+    def limpiar_sueltos(self, limite, en_uso):
+        """
+        Borra los archivos de la raíz de MEDIA_ROOT (subidas y resultados de
+        antes del almacenamiento por contenido) que no se modificaron desde
+        limite, con su pirámide.
+        """
+        fs = FileSystemStorage()
+        borrados = [0, 0]
+        if not os.path.isdir(fs.location):
+            return tuple(borrados)
+        with os.scandir(fs.location) as iterador:
+            for entrada in iterador:
+                if not entrada.is_file() or entrada.path in en_uso:
+                    continue
+                info = entrada.stat()
+                if info.st_mtime >= limite.timestamp():
+                    continue
+                ingesta.borrar_piramide(entrada.path)
+                os.remove(entrada.path)
+                borrados[0] += 1
+                borrados[1] += info.st_size
+        return tuple(borrados)
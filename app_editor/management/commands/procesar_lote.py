@@ -0,0 +1,95 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app_editor.utils import composicion, lotes, salida
+
+
+class Command(BaseCommand):
+    help = ("Aplica una receta JSON de operaciones de imgPro a un directorio o lista de imágenes, "
+            "en paralelo. Ejemplo de receta: "
+            '\'[{"op": "luminosity"}, {"op": "bright", "brillo": 0.1}, {"op": "binarize", "umbral": 0.5}]\'')
+
+    def add_arguments(self, parser):
+        parser.add_argument('receta', help='receta JSON, en línea o como ruta a un archivo .json')
+        parser.add_argument('entradas', nargs='+', help='directorios o archivos de imagen')
+        parser.add_argument('--salida', required=True, help='directorio donde se guardan las imágenes procesadas')
+        parser.add_argument('--formato', choices=sorted(salida.FORMATOS),
+                            help='formato de salida (por defecto el de EDITOR_SALIDA)')
+        parser.add_argument('--calidad', type=int, help='calidad JPEG/WebP (1-100)')
+        parser.add_argument('--compresion', type=int, help='nivel de compresión PNG (0-9)')
+        parser.add_argument('--procesos', type=int, default=None, help='procesos del pool (por defecto, uno por núcleo)')
+        parser.add_argument('--capa', action='append', default=[], metavar='RUTA[:PESO[:MODO]]',
+                            help='imagen que se compone sobre cada resultado al final de la receta; se puede '
+                                 f'repetir. PESO entre 0 y 1 (1 por defecto), MODO: {", ".join(composicion.MODOS)}')
+        parser.add_argument('--mezcla', choices=composicion.MEZCLAS, default='capas',
+                            help="cómo se combinan las capas: apiladas por opacidad o 'promedio' ponderado")
+
+    def handle(self, *args, **options):
+        receta = options['receta']
+        try:
+            if os.path.isfile(receta):
+                with open(receta) as archivo:
+                    receta = archivo.read()
+            pasos = json.loads(receta)
+        except (OSError, json.JSONDecodeError) as error:
+            raise CommandError(f'No se pudo leer la receta: {error}')
+        if options['capa']:
+            if not isinstance(pasos, list):
+                raise CommandError('La receta debe ser una lista de pasos.')
+            pasos = pasos + [{'op': 'fusion_images', 'capas': [self.capa(valor) for valor in options['capa']],
+                              'mezcla': options['mezcla']}]
+
+        rutas = lotes.listar_imagenes(options['entradas'])
+        if not rutas:
+            raise CommandError('No se encontraron imágenes para procesar.')
+
+        def progreso(hechos, total, ruta, error):
+            if error is None:
+                self.stdout.write(f'[{hechos}/{total}] {ruta}')
+            else:
+                self.stderr.write(f'[{hechos}/{total}] {ruta}: {error}')
+
+        config = dict(settings.EDITOR_SALIDA, FORMATOS=tuple(salida.FORMATOS)) # en la consola se permiten todos
+        politica = salida.politica(options, config)
+
+        inicio = time.perf_counter()
+        try:
+            resultados = lotes.procesar_lote(rutas, pasos, options['salida'], options['procesos'],
+                                             settings.EDITOR_MEGAPIXELES_POR_BANDAS, progreso, politica)
+        except ValueError as error:
+            raise CommandError(str(error))
+        duracion = time.perf_counter() - inicio
+
+        errores = sum(1 for _, _, error in resultados if error)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(resultados) - errores} imágenes procesadas, {errores} con error, '
+            f'{duracion:.1f} s ({len(resultados) / duracion:.1f} imágenes/s)'))
+
+    def capa(self, valor):
+        """
+        Interpreta RUTA[:PESO[:MODO]]; la ruta puede contener ':' (se separa por la derecha).
+        """
+        partes = valor.rsplit(':', 2)
+        while len(partes) > 1 and not self._opcion_capa(partes[1:]):
+            partes = [':'.join(partes[:2])] + partes[2:]
+        ruta = os.path.abspath(partes[0])
+        if not os.path.isfile(ruta):
+            raise CommandError(f'No existe la capa {partes[0]}')
+        capa = {'imagen': ruta}
+        if len(partes) > 1:
+            capa['peso'] = float(partes[1])
+        if len(partes) > 2:
+            capa['modo'] = partes[2]
+        return capa
+
+    @staticmethod
+    def _opcion_capa(opciones):
+        try:
+            float(opciones[0])
+        except ValueError:
+            return False
+        return len(opciones) == 1 or opciones[1] in composicion.MODOS
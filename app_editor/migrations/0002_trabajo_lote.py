@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_editor', '0001_trabajo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajo',
+            name='lote',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_editor', '0002_trabajo_lote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Historial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sesion', models.CharField(db_index=True, max_length=40)),
+                ('ruta_original', models.CharField(max_length=500)),
+                ('ruta_base', models.CharField(blank=True, max_length=500)),
+                ('bytes_base', models.BigIntegerField(default=0)),
+                ('posicion', models.PositiveIntegerField(default=0)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PasoHistorial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField()),
+                ('parametros', models.JSONField()),
+                ('punto_control', models.CharField(blank=True, max_length=500)),
+                ('bytes_punto_control', models.BigIntegerField(default=0)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('historial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pasos', to='app_editor.historial')),
+            ],
+            options={
+                'ordering': ['numero'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_editor', '0003_historial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Archivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('bytes', models.BigIntegerField()),
+                ('subidas', models.PositiveIntegerField(default=1)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('usado', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
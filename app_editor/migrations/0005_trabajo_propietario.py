@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_editor', '0004_archivo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajo',
+            name='propietario',
+            field=models.CharField(blank=True, max_length=300),
+        ),
+    ]
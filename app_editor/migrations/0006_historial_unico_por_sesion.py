@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+def borrar_duplicados(apps, schema_editor):
+    # deja el historial usado más recientemente de cada (sesion, ruta_original)
+    Historial = apps.get_model('app_editor', 'Historial')
+    vistos = set()
+    for historial in Historial.objects.order_by('-actualizado', '-id'):
+        clave = (historial.sesion, historial.ruta_original)
+        if clave in vistos:
+            historial.delete()
+        vistos.add(clave)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_editor', '0005_trabajo_propietario'),
+    ]
+
+    operations = [
+        migrations.RunPython(borrar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='historial',
+            constraint=models.UniqueConstraint(fields=('sesion', 'ruta_original'), name='historial_unico_por_sesion'),
+        ),
+    ]
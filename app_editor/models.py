@@ -1,3 +1,101 @@
+import uuid
+
 from django.db import models
 
 # Create your models here.
+class Trabajo(models.Model):
+    """
+    Operación de imgPro ejecutada en segundo plano por el pool de procesos
+    (ver app_editor/trabajos.py). La tabla hace de cola local: no se necesita
+    un broker externo.
+    """
+    PENDIENTE = 'pendiente'
+    EN_PROCESO = 'en_proceso'
+    TERMINADO = 'terminado'
+    ERROR = 'error'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_PROCESO, 'En proceso'),
+        (TERMINADO, 'Terminado'),
+        (ERROR, 'Error'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    estado = models.CharField(max_length=16, choices=ESTADOS, default=PENDIENTE)
+    ruta_original = models.CharField(max_length=500) # ruta en disco de la imagen original
+    parametros = models.JSONField() # descripción de la operación (ver utils/acciones.py)
+    clave = models.CharField(max_length=64) # clave en la caché de resultados
+    resultado = models.CharField(max_length=255, blank=True) # nombre del archivo en la caché de resultados
+    error = models.TextField(blank=True)
+    lote = models.UUIDField(null=True, blank=True, db_index=True) # trabajos enviados juntos por /lote/
+    propietario = models.CharField(max_length=300, blank=True) # 'host:pid' del proceso del servidor que lo encoló
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.id} ({self.estado})'
+
+
+class Historial(models.Model):
+    """
+    Ediciones apiladas sobre una imagen dentro de una sesión, con deshacer y
+    rehacer (ver app_editor/historial.py). Los pasos 1..posicion están
+    aplicados; los siguientes se pueden rehacer hasta que se agregue otro.
+    """
+    sesion = models.CharField(max_length=40, db_index=True) # clave de la sesión de Django
+    ruta_original = models.CharField(max_length=500) # ruta en disco de la imagen original
+    ruta_base = models.CharField(max_length=500, blank=True) # punto de control que reemplaza al original al descartar los pasos más antiguos
+    bytes_base = models.BigIntegerField(default=0)
+    posicion = models.PositiveIntegerField(default=0)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # un solo historial por imagen y sesión, aunque dos peticiones lo creen a la vez
+            models.UniqueConstraint(fields=['sesion', 'ruta_original'], name='historial_unico_por_sesion'),
+        ]
+
+    def total(self):
+        return self.pasos.count()
+
+    def __str__(self):
+        return f'{self.ruta_original} ({self.posicion}/{self.total()})'
+
+
+class PasoHistorial(models.Model):
+    """
+    Un paso del historial: la descripción de la operación (no la imagen) y,
+    cada cierto número de pasos, un punto de control con la imagen ya
+    materializada desde el que se reconstruyen los pasos siguientes.
+    """
+    historial = models.ForeignKey(Historial, on_delete=models.CASCADE, related_name='pasos')
+    numero = models.PositiveIntegerField() # 1 es el primer paso sobre la base
+    parametros = models.JSONField() # descripción de la operación (ver utils/acciones.py)
+    punto_control = models.CharField(max_length=500, blank=True) # ruta en disco del archivo crudo (utils/crudo.py) con la imagen tras este paso
+    bytes_punto_control = models.BigIntegerField(default=0)
+    creado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['numero']
+
+    def __str__(self):
+        return f"{self.numero}. {self.parametros.get('operacion')}"
+
+
+class Archivo(models.Model):
+    """
+    Archivo subido guardado por su contenido (ver app_editor/almacenamiento.py).
+    Subir dos veces la misma imagen reutiliza el mismo archivo; usado es la
+    última vez que se subió o editó, para que limpiar_media borre primero lo
+    que lleva más tiempo sin usarse.
+    """
+    nombre = models.CharField(max_length=255, unique=True) # nombre en el almacenamiento (relativo a MEDIA_ROOT)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    bytes = models.BigIntegerField()
+    subidas = models.PositiveIntegerField(default=1) # veces que se subió este contenido
+    creado = models.DateTimeField(auto_now_add=True)
+    usado = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.nombre
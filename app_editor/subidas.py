@@ -0,0 +1,61 @@
+"""
+Ingesta de las imágenes subidas.
+
+LimiteSubida es el primer manejador de FILE_UPLOAD_HANDLERS: cuenta los
+bytes de cada archivo a medida que llegan y descarta el archivo en cuanto
+supera EDITOR_INGESTA['BYTES_MAXIMOS'], sin escribir el resto en memoria ni
+en disco. guardar() comprueba la cabecera de lo que sí llegó (ver
+utils/ingesta.py) antes de pasarlo al almacenamiento y precalcula la
+pirámide de resoluciones.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+from .utils import ingesta
+
+
+class LimiteSubida(FileUploadHandler):
+    """
+    Corta cada archivo subido que supere los bytes permitidos. Los nombres de
+    los archivos descartados quedan en request.subidas_rechazadas.
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.EDITOR_INGESTA['BYTES_MAXIMOS']:
+            if not hasattr(self.request, 'subidas_rechazadas'):
+                self.request.subidas_rechazadas = []
+            self.request.subidas_rechazadas.append(self.file_name)
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None # el archivo lo construyen los manejadores siguientes
+
+
+def rechazo(request):
+    """
+    Mensaje de error si LimiteSubida descartó algún archivo de request, o None.
+    """
+    nombres = getattr(request, 'subidas_rechazadas', None)
+    if not nombres:
+        return None
+    maximo = settings.EDITOR_INGESTA['BYTES_MAXIMOS'] / 2**20
+    return f"{', '.join(nombres)}: el archivo supera el máximo de {maximo:.1f} MiB."
+
+def guardar(fs, archivo, piramide=True):
+    """
+    Valida la imagen subida, la guarda en fs y devuelve el nombre guardado.
+    Con piramide se precalculan sus versiones reducidas. Lanza
+    ingesta.ImagenRechazada si no pasa la validación.
+    """
+    config = settings.EDITOR_INGESTA
+    ingesta.inspeccionar(archivo, config['PIXELES_MAXIMOS'], config['BYTES_MAXIMOS'])
+    nombre_archivo = fs.save(archivo.name, archivo)
+    if piramide and not ingesta.niveles_disponibles(fs.path(nombre_archivo)): # el mismo contenido ya subido la tiene
+        try:
+            ingesta.construir_piramide(fs.path(nombre_archivo), config['NIVELES'])
+        except (OSError, ValueError): # cabecera válida pero píxeles truncados o corruptos
+            ingesta.borrar_piramide(fs.path(nombre_archivo))
+            fs.delete(nombre_archivo)
+            raise ingesta.ImagenRechazada("La imagen está dañada o incompleta.")
+    return nombre_archivo
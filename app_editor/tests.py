@@ -1,3 +1,1157 @@
-from django.test import TestCase
+import io
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from PIL import Image
+
+from . import historial
+from . import trabajos
+from . import views
+from .models import Archivo, Historial, PasoHistorial, Trabajo
+from .utils import acciones
+from .utils import bloques
+from .utils import composicion
+from .utils import crudo
+from .utils import decodificadas
+from .utils import diferida
+from .utils import filtros
+from .utils import histograma
+from .utils import imgPro
+from .utils import imgPro8
+from .utils import ingesta
+from .utils import lotes
+from .utils import niveles
+from .utils import remuestreo
+from .utils import resultados
+from .utils import rotacion
+from .utils import salida
+
+
+def guardar_png(ruta, color, tamano=(8, 6)):
+    Image.new('RGB', tamano, color).save(ruta)
+
+def color_de(gris):
+    return np.repeat(gris[:, :, np.newaxis], 3, axis=2)
+
+def png_subido(semilla=0, tamano=(24, 16)):
+    archivo = io.BytesIO()
+    pixeles = np.random.default_rng(semilla).integers(0, 256, tamano[::-1] + (3,), dtype=np.uint8)
+    Image.fromarray(pixeles).save(archivo, 'PNG')
+    archivo.seek(0)
+    archivo.name = 'foto.png'
+    return archivo
+
+
+class ConMediaTemporal:
+    """
+    MEDIA_ROOT en un directorio temporal y cachés de las vistas recién
+    creadas para cada prueba.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.media = directorio.name
+        ajustes = self.settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        for nombre in ('_cache_resultados', '_cache_decodificadas', '_cache_proxies', '_escritor_crudos'):
+            parche = mock.patch.object(views, nombre, None)
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.addCleanup(lambda: views._escritor_crudos and views._escritor_crudos.shutdown()) # antes de borrar MEDIA_ROOT
+
+    def subir(self, semilla=0):
+        return self.client.post('/', {'imagen': png_subido(semilla)}).context['imagen_url']
+
+
+class MediaTemporal(ConMediaTemporal, TestCase):
+    pass
+
+
+class LotesTests(TestCase):
+    def test_destinos_sin_colisiones(self):
+        rutas = ['a/x.png', 'a/x.jpg', 'b/x.png', 'b/X.tif', 'c/y.png', 'x-2.png']
+        self.assertEqual([os.path.basename(d) for d in lotes.destinos(rutas, 'salida', '.png')],
+                         ['x.png', 'x-2.png', 'x-3.png', 'X-4.png', 'y.png', 'x-2-2.png'])
+
+    def test_procesar_lote_no_pisa_resultados(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            for carpeta, color in (('a', (255, 0, 0)), ('b', (0, 0, 255))):
+                os.makedirs(os.path.join(directorio, carpeta))
+                guardar_png(os.path.join(directorio, carpeta, 'x.png'), color)
+            guardar_png(os.path.join(directorio, 'a', 'x.jpg'), (0, 255, 0))
+            rutas = lotes.listar_imagenes([os.path.join(directorio, 'a'), os.path.join(directorio, 'b')])
+            salida = os.path.join(directorio, 'salida')
+
+            resultados = lotes.procesar_lote(rutas, [{'op': 'luminosity'}], salida, procesos=1)
+
+            self.assertEqual([error for _, _, error in resultados], [None] * 3)
+            destinos = {ruta: destino for ruta, destino, _ in resultados}
+            self.assertEqual(len(set(destinos.values())), 3)
+            self.assertEqual(sorted(os.listdir(salida)), ['x-2.png', 'x-3.png', 'x.png'])
+            # cada resultado corresponde a su entrada: la luminosidad de rojo, verde y azul es distinta
+            valores = {ruta: int(np.asarray(Image.open(destino).convert('L'))[0, 0])
+                       for ruta, destino in destinos.items()}
+            self.assertEqual(len(set(valores.values())), 3)
+
+
+class ImgPro8Tests(TestCase):
+    def test_operaciones_enteras_a_un_nivel_de_las_flotantes(self):
+        rng = np.random.default_rng(0)
+        for tipo in (np.uint8, np.uint16):
+            img = rng.integers(0, imgPro8.maximo(tipo) + 1, (31, 17, 3), dtype=tipo)
+            flotante = imgPro8.a_flotante(img)
+            for nombre, argumentos in (('reverse', ()), ('extract_layer_cmy', (1,)), ('average', ()),
+                                       ('luminosity', ()), ('midgray', ()), ('bright', (0.2,)), ('bright', (-0.3,)),
+                                       ('bright_layer', (0.4, 2)), ('contrast_dark', (1.5,)),
+                                       ('contrast_light', (0.8,))):
+                entero = getattr(imgPro8, nombre)(img, *argumentos)
+                esperado = imgPro8.a_entero(getattr(imgPro, nombre)(flotante, *argumentos), tipo)
+                self.assertEqual(entero.dtype, tipo)
+                diferencia = np.abs(entero.astype(np.int64) - esperado.astype(np.int64)).max()
+                self.assertLessEqual(diferencia, 1, f'{nombre} {argumentos} {tipo.__name__}')
+            np.testing.assert_array_equal(imgPro8.binarize(img, 0.5), imgPro.binarize(flotante, 0.5))
+            np.testing.assert_array_equal(imgPro8.crop(img, 2, 3, 9, 12), imgPro.crop(img, 2, 3, 9, 12))
+
+
+class ToneCurveTests(TestCase):
+    PASOS = [('bright', 0.1), ('contrast_dark', 1.5), ('bright_layer', -0.2, 1), ('reverse',),
+             ('contrast_light', 0.9), ('binarize', 0.4)]
+
+    def test_curva_fusionada_igual_que_las_tablas_en_secuencia(self):
+        img = np.random.default_rng(0).integers(0, 256, (23, 19, 3), dtype=np.uint8)
+        for fin in range(1, len(self.PASOS) + 1):
+            secuencial = img
+            for nombre, *argumentos in self.PASOS[:fin]:
+                if nombre == 'binarize': # umbral por canal, ver ToneCurve.binarize
+                    secuencial = np.where(secuencial > argumentos[0] * 255, 255, 0).astype(np.uint8)
+                else:
+                    secuencial = getattr(imgPro8, nombre)(secuencial, *argumentos)
+            curva = imgPro8.ToneCurve.from_steps(self.PASOS[:fin])
+            np.testing.assert_array_equal(curva.apply(img), secuencial, str(self.PASOS[:fin]))
+            self.assertEqual(curva.pasos, self.PASOS[:fin])
+
+    def test_encadenar_y_aplicar_en_el_sitio(self):
+        img = np.random.default_rng(1).integers(0, 256, (8, 9, 3), dtype=np.uint8)
+        primera = imgPro8.ToneCurve().bright(0.1).reverse()
+        segunda = imgPro8.ToneCurve().bright_layer(0.3, 0)
+        esperado = segunda.apply(primera.apply(img))
+        np.testing.assert_array_equal(primera.then(segunda).apply(img), esperado)
+        copia = img.copy()
+        self.assertIs(primera.apply(copia, out=copia), copia)
+        np.testing.assert_array_equal(copia, esperado)
+        self.assertTrue(imgPro8.ToneCurve().is_identity())
+        self.assertEqual(imgPro8.ToneCurve().bright(0.1).lut().ndim, 1)
+        with self.assertRaises(ValueError):
+            imgPro8.ToneCurve.from_steps([('rotate', 10)])
+
+
+class DiferidaTests(TestCase):
+    def cadenas(self, fuente):
+        imagen = diferida.ImagenDiferida(fuente)
+        return [
+            imagen.bright(0.1).crop(3, 2, 30, 25).contrast_dark(1.3).lower_resolution(2, 'nearest')
+                  .crop(1, 1, 12, 10).reverse(),
+            imagen.luminosity().bright(-0.1).lower_resolution(2, 'box').crop(1, 0, 14, 11).binarize(0.5),
+            imagen.reverse().extract_layer_rgb(1).crop(2, 2, 28, 26).gaussian_blur(1.0).crop(1, 1, 20, 18)
+                  .bright_layer(0.2, 0),
+            imagen.contrast_light(0.8).crop(-10, 0, 30, 20).lower_resolution(3, 'nearest').lower_resolution(2, 'nearest')
+                  .average(),
+            imagen.bright(0.3).zoom(1.5).crop(4, 4, 30, 30).midgray().rotate(10).crop(0, 0, 20, 20),
+        ]
+
+    def test_cadena_optimizada_igual_que_paso_a_paso(self):
+        img = np.random.default_rng(3).integers(0, 256, (37, 41, 3), dtype=np.uint8)
+        original = img.copy()
+        for imagen in self.cadenas(img):
+            # sin reordenar ni fusionar: cada paso es una operación sobre la imagen completa
+            paso_a_paso = [operacion for paso in imagen.pasos for operacion in diferida.compilar([paso])]
+            esperado = bloques.procesar_completa(img, paso_a_paso)
+            np.testing.assert_array_equal(imagen.evaluar(), esperado, str(imagen.pasos))
+            np.testing.assert_array_equal(imagen.evaluar(alto_banda=5), esperado, str(imagen.pasos))
+            self.assertLessEqual(len(imagen.operaciones()), len(paso_a_paso))
+        np.testing.assert_array_equal(img, original) # las curvas en el sitio nunca tocan la fuente
+
+    def test_recortes_y_submuestreos_se_adelantan(self):
+        imagen = self.cadenas(None)[0]
+        self.assertEqual([paso[0] for paso in diferida.optimizar(imagen.pasos)],
+                         [diferida.RECORTE, diferida.SUBMUESTREO, diferida.TONO, diferida.TONO, diferida.TONO])
+        operaciones = imagen.operaciones()
+        self.assertIsInstance(operaciones[0], bloques.Recorte)
+        self.assertIsInstance(operaciones[-1], diferida.Fusionada)
+        self.assertEqual(len(operaciones[-1].funciones), 1) # las tres curvas en una ToneCurve
+
+
+class BloquesTests(TestCase):
+    def cadenas(self):
+        return [
+            [bloques.Puntual(imgPro8.reverse), bloques.Recorte(3, 5, 40, 70)],
+            [bloques.Traslacion(-4, 7), bloques.Puntual(imgPro8.luminosity)],
+            [bloques.Submuestreo(3, 'box'), bloques.Puntual(imgPro8.bright, 0.2)],
+            [bloques.Submuestreo(2, 'nearest'), bloques.Traslacion(5, -3)],
+            [bloques.Redimension('lanczos', escala=0.6), bloques.Recorte(0, 2, 20, 30)],
+            [bloques.Redimension('bilinear', forma=(97, 31))],
+        ]
+
+    def test_por_bandas_igual_que_completa(self):
+        img = np.random.default_rng(0).integers(0, 256, (83, 51, 3), dtype=np.uint8)
+        for operaciones in self.cadenas():
+            completa = bloques.procesar_completa(img, operaciones)
+            for alto_banda in (1, 7, 64, 200):
+                np.testing.assert_array_equal(bloques.ensamblar(img, operaciones, alto_banda), completa,
+                                              f'{operaciones} {alto_banda}')
+
+    def test_escritor_png_se_decodifica_igual(self):
+        rng = np.random.default_rng(1)
+        # más de BYTES_IDAT comprimidos para que haya varios bloques IDAT
+        for img in (rng.integers(0, 256, (300, 200, 3), dtype=np.uint8), rng.integers(0, 256, (9, 13), dtype=np.uint8),
+                    rng.integers(0, 256, (10, 6, 4), dtype=np.uint8)):
+            archivo = io.BytesIO()
+            canales = img.shape[2] if img.ndim == 3 else 1
+            escritor = bloques.EscritorPNG(archivo, img.shape[1], img.shape[0], canales)
+            for fila in range(0, len(img), 7):
+                escritor.escribir(img[fila:fila + 7])
+            escritor.cerrar()
+            archivo.seek(0)
+            with Image.open(archivo) as decodificada:
+                np.testing.assert_array_equal(np.asarray(decodificada), img)
+
+    def test_guardar_y_trozos_por_bandas(self):
+        img = np.random.default_rng(2).integers(0, 256, (50, 40, 3), dtype=np.uint8)
+        for operaciones in self.cadenas():
+            completa = bloques.procesar_completa(img, operaciones)
+            for formato in ('PNG', 'NPY'):
+                archivo = io.BytesIO()
+                bloques.guardar(img, operaciones, archivo, formato, alto_banda=9)
+                datos = b''.join(bloques.trozos(img, operaciones, formato, alto_banda=9))
+                self.assertEqual(datos, archivo.getvalue())
+                if formato == 'PNG':
+                    leida = np.asarray(Image.open(io.BytesIO(datos)))
+                else:
+                    leida = np.load(io.BytesIO(datos))
+                np.testing.assert_array_equal(leida, completa)
+
+    def test_varios_hilos_igual_que_uno(self):
+        img = np.random.default_rng(3).integers(0, 256, (83, 51, 3), dtype=np.uint8)
+        for operaciones in self.cadenas() + [[filtros.Filtro('gaussian_blur', 1.5), bloques.Puntual(imgPro8.midgray)]]:
+            un_hilo = bloques.ensamblar(img, operaciones, 6)
+            np.testing.assert_array_equal(bloques.ensamblar(img, operaciones, 6, hilos=4), un_hilo, str(operaciones))
+            filas = [fila for fila, _ in bloques.bandas(img, operaciones, 6, hilos=4)]
+            self.assertEqual(filas, list(range(0, len(un_hilo), 6))) # en orden aunque se produzcan en paralelo
+            for formato in ('PNG', 'NPY', 'JPEG'):
+                archivos = [io.BytesIO(), io.BytesIO()]
+                for archivo, hilos in zip(archivos, (1, 4)):
+                    bloques.guardar(img, operaciones, archivo, formato, alto_banda=6, hilos=hilos)
+                self.assertEqual(archivos[1].getvalue(), archivos[0].getvalue(), f'{operaciones} {formato}')
+                self.assertEqual(b''.join(bloques.trozos(img, operaciones, formato, alto_banda=6, hilos=4)),
+                                 archivos[0].getvalue())
+
+    def test_nucleos_de_imgpro_por_bandas(self):
+        flotante = np.random.default_rng(4).random((45, 33, 3))
+        for funcion, args in ((imgPro.luminosity, ()), (imgPro.midgray, ()), (imgPro.extract_layer_cmy, (1,)),
+                              (imgPro.bright, (0.2,)), (imgPro8.luminosity, ()), (imgPro8.bright, (0.2,))):
+            img = flotante if funcion.__module__ == imgPro.__name__ else (flotante * 255).astype(np.uint8)
+            completa = funcion(img, *args)
+            for hilos in (1, 3):
+                por_bandas = bloques.por_bandas(funcion, img, *args, hilos=hilos, alto_banda=4)
+                self.assertEqual(por_bandas.dtype, completa.dtype)
+                np.testing.assert_array_equal(por_bandas, completa, f'{funcion.__name__} {hilos}')
+
+
+class RemuestreoTests(TestCase):
+    def setUp(self):
+        self.img = np.random.default_rng(0).integers(0, 256, (83, 51, 3), dtype=np.uint8)
+
+    def test_cerca_de_pil(self):
+        # imagen suave, como una foto: sobre ruido puro el orden de las pasadas y la saturación pesan más
+        y, x = np.mgrid[:83, :51]
+        suave = np.stack((y * 2, x * 4, x + y), axis=-1) + np.random.default_rng(1).integers(0, 8, (83, 51, 3))
+        suave = suave.astype(np.uint8)
+        for alto, ancho, filtro, filtro_pil in ((40, 25, 'lanczos', Image.LANCZOS), (97, 120, 'bilinear', Image.BILINEAR),
+                                                (30, 17, 'box', Image.BOX), (160, 90, 'nearest', Image.NEAREST)):
+            resultado = remuestreo.resize(suave, alto, ancho, filtro)
+            esperado = np.asarray(Image.fromarray(suave).resize((ancho, alto), filtro_pil))
+            self.assertEqual(resultado.shape, esperado.shape)
+            self.assertLessEqual(np.abs(resultado.astype(int) - esperado).max(), 2, filtro)
+
+    def test_casos_exactos(self):
+        plana = np.full((37, 29, 3), 173, dtype=np.uint8)
+        for filtro in remuestreo.FILTROS:
+            np.testing.assert_array_equal(remuestreo.resize(plana, 50, 11, filtro), 173)
+        np.testing.assert_array_equal(remuestreo.zoom(self.img, 3, 'nearest'),
+                                      np.repeat(np.repeat(self.img, 3, axis=0), 3, axis=1))
+        reducida = remuestreo.lower_resolution(self.img[:81, :51], 3)
+        bloques_3x3 = self.img[:81, :51].reshape(27, 3, 17, 3, 3).astype(float).mean(axis=(1, 3))
+        self.assertLessEqual(np.abs(reducida - bloques_3x3).max(), 0.5)
+        np.testing.assert_array_equal(remuestreo.lower_resolution(self.img, 4, 'nearest'), self.img[::4, ::4])
+        self.assertEqual(remuestreo.lower_resolution(self.img, 2.5).shape, (34, 21, 3))
+        with self.assertRaises(ValueError):
+            remuestreo.lower_resolution(self.img, 0.5)
+
+    def test_por_bandas_igual_que_completo(self):
+        # con pesos de punto fijo el producto de matrices es exacto, sea cual sea el alto de la banda
+        for operacion in (bloques.Redimension('bilinear', forma=(97, 31)), bloques.Redimension('lanczos', escala=0.6),
+                          bloques.Redimension('box', escala=0.37), bloques.Redimension('lanczos', forma=(200, 120))):
+            completa = bloques.procesar_completa(self.img, [operacion])
+            for alto_banda in (1, 2, 5, 16, 64):
+                np.testing.assert_array_equal(bloques.ensamblar(self.img, [operacion], alto_banda), completa)
+
+
+class MetricasTests(TestCase):
+    def test_accion_desconocida_se_agrupa(self):
+        self.assertEqual(views.metrics_action({'accion': 'filtrar'}, {}), 'filtrar')
+        self.assertEqual(views.metrics_action({'accion': 'aplicar_brillo_R'}, {}), 'aplicar_brillo_R')
+        self.assertEqual(views.metrics_action({'accion': 'deshacer'}, {}), 'deshacer')
+        self.assertEqual(views.metrics_action({'accion': 'x' * 1000}, {}), 'otra')
+        self.assertEqual(views.metrics_action({'accion': 'filtrar'}, {'imagen': object()}), 'subir')
+        self.assertIsNone(views.metrics_action({}, {}))
+
+
+class HistorialTests(MediaTemporal):
+    EDICIONES = [{'accion': 'negativo'}, {'accion': 'extract_R'}, {'accion': 'grayscale', 'tipo_grises': 'average'}]
+
+    def setUp(self):
+        super().setUp()
+        self.imagen_url = self.subir()
+
+    def enviar(self, **campos):
+        return self.client.post('/', dict(imagen_actual=self.imagen_url, **campos))
+
+    def apilar(self, ediciones):
+        for edicion in ediciones:
+            respuesta = self.enviar(apilar='1', **edicion)
+        return respuesta
+
+    def test_deshacer_rehacer_e_ir_a_paso(self):
+        resultados = [self.apilar([edicion]).context['procesada_url'] for edicion in self.EDICIONES]
+        respuesta = self.enviar(accion='deshacer')
+        self.assertEqual(respuesta.context['historial'].posicion, 2)
+        self.assertEqual(respuesta.context['procesada_url'], resultados[1])
+        respuesta = self.enviar(accion='rehacer')
+        self.assertEqual(respuesta.context['historial'].posicion, 3)
+        self.assertEqual(respuesta.context['procesada_url'], resultados[2])
+        respuesta = self.enviar(accion='ir_paso', paso='1')
+        self.assertEqual(respuesta.context['historial'].posicion, 1)
+        self.assertEqual(respuesta.context['procesada_url'], resultados[0])
+        self.assertEqual(self.enviar(accion='ir_paso', paso='99').context['historial'].posicion, 3)
+        self.assertEqual(self.enviar(accion='rehacer').context['historial'].posicion, 3)
+
+    def test_un_historial_por_imagen_y_sesion(self):
+        primero = historial.obtener('sesion', '/ruta/foto.png')
+        self.assertEqual(historial.obtener('sesion', '/ruta/foto.png').pk, primero.pk)
+        self.assertNotEqual(historial.obtener('otra', '/ruta/foto.png').pk, primero.pk)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Historial.objects.create(sesion='sesion', ruta_original='/ruta/foto.png')
+
+    def test_paso_invalido_se_ignora(self):
+        self.apilar(self.EDICIONES)
+        self.enviar(accion='ir_paso', paso='1')
+        for paso in ('', 'dos', '1.5', '9' * 5000):
+            respuesta = self.enviar(accion='ir_paso', paso=paso)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(respuesta.context['historial'].posicion, 1)
+        self.assertEqual(self.client.post('/', dict(imagen_actual=self.imagen_url, accion='ir_paso'))
+                         .context['historial'].posicion, 1)
+
+    def test_nuevo_paso_descarta_lo_que_se_podia_rehacer(self):
+        self.apilar(self.EDICIONES)
+        self.enviar(accion='ir_paso', paso='1')
+        registro = self.apilar([{'accion': 'rotar', 'angulo': '90'}]).context['historial']
+        self.assertEqual((registro.posicion, registro.total()), (2, 2))
+        self.assertEqual([paso.parametros['operacion'] for paso in registro.pasos.all()], ['layer', 'rotar'])
+        self.assertEqual(self.enviar(accion='rehacer').context['historial'].posicion, 2)
+
+    def test_rebasar_renumera_los_pasos(self):
+        limites = dict(settings.EDITOR_HISTORIAL, PASOS_ENTRE_PUNTOS=2, PASOS_MAXIMOS=2)
+        with self.settings(EDITOR_HISTORIAL=limites):
+            registro = self.apilar(self.EDICIONES + [{'accion': 'rotar', 'angulo': '90'}]).context['historial']
+        registro.refresh_from_db()
+        self.assertTrue(registro.ruta_base and os.path.exists(registro.ruta_base))
+        self.assertEqual(registro.posicion, 2)
+        self.assertEqual([paso.numero for paso in registro.pasos.all()], [1, 2])
+        self.assertEqual([paso.parametros['operacion'] for paso in registro.pasos.all()], ['layer', 'rotar'])
+        # deshacer todo vuelve a la base, que ya tiene aplicados los pasos descartados
+        self.assertEqual(self.enviar(accion='ir_paso', paso='0').context['historial'].posicion, 0)
+
+    def test_ajustar_presupuesto_borra_lo_mas_antiguo(self):
+        otro = historial.obtener('sesion', '/otra.png')
+        otro.ruta_base, otro.bytes_base = self.punto(), 100
+        otro.save()
+        actual = historial.obtener('sesion', '/actual.png')
+        pasos = [PasoHistorial.objects.create(historial=actual, numero=numero, parametros={},
+                                              punto_control=self.punto(), bytes_punto_control=100)
+                 for numero in (1, 2, 3)]
+        conservar = pasos[-1].punto_control
+
+        with self.settings(EDITOR_HISTORIAL=dict(settings.EDITOR_HISTORIAL, BYTES_SESION=300)):
+            historial.ajustar_presupuesto(actual, conservar)
+        self.assertEqual([os.path.exists(paso.punto_control) for paso in pasos], [False, True, True])
+        self.assertEqual(PasoHistorial.objects.get(pk=pasos[0].pk).punto_control, '')
+        self.assertTrue(Historial.objects.filter(pk=otro.pk).exists())
+
+        # sin más puntos que borrar (salvo conservar), se descartan los historiales de otras imágenes
+        with self.settings(EDITOR_HISTORIAL=dict(settings.EDITOR_HISTORIAL, BYTES_SESION=150)):
+            historial.ajustar_presupuesto(actual, conservar)
+        self.assertFalse(Historial.objects.filter(pk=otro.pk).exists())
+        self.assertFalse(os.path.exists(otro.ruta_base))
+        self.assertFalse(os.path.exists(pasos[1].punto_control))
+        self.assertTrue(os.path.exists(conservar))
+
+    def punto(self):
+        ruta, _ = historial._guardar_punto(np.zeros((2, 2, 3), dtype=np.uint8))
+        return ruta
+
+
+class AlmacenamientoTests(MediaTemporal):
+    def limpiar(self, *argumentos):
+        call_command('limpiar_media', *argumentos, stdout=io.StringIO())
+
+    def ruta(self, imagen_url):
+        return os.path.join(self.media, imagen_url.replace('/media/', ''))
+
+    def test_misma_subida_mismo_archivo(self):
+        primera, segunda, otra = self.subir(), self.subir(), self.subir(semilla=1)
+        self.assertEqual(primera, segunda)
+        self.assertNotEqual(primera, otra)
+        self.assertEqual(Archivo.objects.get(nombre=primera.replace('/media/', '')).subidas, 2)
+        self.assertEqual(Archivo.objects.count(), 2)
+        archivos = [nombre for _, _, nombres in os.walk(os.path.join(self.media, 'originales')) for nombre in nombres
+                    if nombre.endswith('.png')]
+        self.assertEqual(len(archivos), 2)
+
+    def test_limpiar_conserva_originales_en_uso(self):
+        con_historial, con_trabajo, suelta = (self.subir(semilla) for semilla in range(3))
+        # la sesión del cliente sigue abierta, así que su historial es vigente
+        self.client.post('/', {'imagen_actual': con_historial, 'accion': 'negativo', 'apilar': '1'})
+        Trabajo.objects.create(ruta_original=self.ruta(con_trabajo), parametros={}, clave='x')
+        Archivo.objects.update(usado=timezone.now() - timedelta(days=30))
+
+        self.limpiar('--dias', '0')
+
+        self.assertTrue(os.path.exists(self.ruta(con_historial)))
+        self.assertTrue(os.path.exists(self.ruta(con_trabajo)))
+        self.assertFalse(os.path.exists(self.ruta(suelta)))
+        self.assertEqual(Historial.objects.count(), 1)
+        self.assertEqual(sorted(Archivo.objects.values_list('nombre', flat=True)),
+                         sorted(url.replace('/media/', '') for url in (con_historial, con_trabajo)))
+
+        # cerrada la sesión, el historial y su original se borran
+        self.client.session.flush()
+        Trabajo.objects.update(estado=Trabajo.TERMINADO)
+        self.limpiar('--dias', '0')
+        self.assertEqual(Historial.objects.count(), 0)
+        self.assertEqual(Archivo.objects.count(), 0)
+
+    def test_limpiar_temporales_y_puntos_de_control_huerfanos(self):
+        imagen_url = self.subir()
+        self.client.post('/', {'imagen_actual': imagen_url, 'accion': 'negativo', 'apilar': '1'})
+        registro = Historial.objects.get()
+        en_uso, _ = historial._guardar_punto(np.zeros((2, 2, 3), dtype=np.uint8))
+        PasoHistorial.objects.filter(historial=registro).update(punto_control=en_uso)
+        huerfano, _ = historial._guardar_punto(np.zeros((2, 2, 3), dtype=np.uint8))
+        reciente, _ = historial._guardar_punto(np.zeros((2, 2, 3), dtype=np.uint8))
+        os.makedirs(os.path.join(self.media, 'originales', 'tmp'), exist_ok=True)
+        temporal, temporal_reciente = (os.path.join(self.media, 'originales', 'tmp', nombre) for nombre in ('a.tmp', 'b.tmp'))
+        for ruta in (temporal, temporal_reciente):
+            with open(ruta, 'wb') as archivo:
+                archivo.write(b'a medias')
+        hace_dos_horas = time.time() - 2 * 3600
+        for ruta in (en_uso, huerfano, temporal):
+            os.utime(ruta, (hace_dos_horas, hace_dos_horas))
+
+        self.limpiar('--dias', '0')
+
+        self.assertEqual([os.path.exists(ruta) for ruta in (en_uso, huerfano, reciente, temporal, temporal_reciente)],
+                         [True, False, True, False, True])
+        self.assertTrue(os.path.exists(self.ruta(imagen_url)))
+
+    def test_limpiar_por_tamano_borra_lo_menos_usado(self):
+        urls = [self.subir(semilla) for semilla in range(3)]
+        ahora = timezone.now()
+        for dias, url in zip((3, 1, 2), urls):
+            Archivo.objects.filter(nombre=url.replace('/media/', '')).update(usado=ahora - timedelta(days=dias))
+        tamanos = [os.path.getsize(self.ruta(url)) for url in urls]
+
+        self.limpiar('--bytes-originales', str(tamanos[1] + tamanos[2]))
+        self.assertEqual([os.path.exists(self.ruta(url)) for url in urls], [False, True, True])
+        self.limpiar('--bytes-originales', str(tamanos[1]))
+        self.assertEqual([os.path.exists(self.ruta(url)) for url in urls], [False, True, False])
+
+    def test_limpiar_resultados_respeta_conservar(self):
+        cache = resultados.CacheResultados(os.path.join(self.media, 'resultados'), 1 << 20, 1 << 20)
+        for clave in ('a' * 64, 'b' * 64):
+            cache.guardar(clave, io.BytesIO(b'datos'))
+        self.assertEqual(cache.limpiar(time.time() + 60, conservar={cache.nombre('a' * 64)}), (1, 5))
+        self.assertEqual(cache.buscar('a' * 64), cache.nombre('a' * 64))
+        self.assertIsNone(cache.buscar('b' * 64))
+        self.assertEqual(cache.limpiar(None, 0, conservar={cache.nombre('a' * 64)}), (0, 0))
+        self.assertEqual(cache.limpiar(None, 0), (1, 5))
+
+
+def png_con_cabecera(alto, ancho):
+    """
+    PNG de 1x1 píxel cuya cabecera IHDR declara alto x ancho.
+    """
+    datos = bytearray(png_subido(tamano=(1, 1)).getvalue())
+    datos[16:24] = struct.pack('>II', ancho, alto)
+    datos[29:33] = struct.pack('>I', zlib.crc32(bytes(datos[12:29])))
+    archivo = io.BytesIO(bytes(datos))
+    archivo.name = 'bomba.png'
+    return archivo
+
+
+class IngestaTests(MediaTemporal):
+    def guardados(self):
+        return [nombre for _, _, nombres in os.walk(self.media) for nombre in nombres]
+
+    def test_inspeccionar_solo_lee_la_cabecera(self):
+        self.assertEqual(ingesta.inspeccionar(png_subido(tamano=(24, 16)), 1000), ('PNG', 16, 24))
+        with self.assertRaisesRegex(ingesta.ImagenRechazada, 'MP'):
+            ingesta.inspeccionar(png_subido(tamano=(24, 16)), 383)
+        with self.assertRaisesRegex(ingesta.ImagenRechazada, 'MiB'):
+            ingesta.inspeccionar(png_subido(), 1000, bytes_maximos=10)
+        # cabeceras que declaran 10^8 y 2.5·10^9 píxeles: se rechazan sin decodificar nada
+        archivo = png_con_cabecera(10_000, 10_000)
+        with self.assertRaisesRegex(ingesta.ImagenRechazada, 'MP'):
+            ingesta.inspeccionar(archivo, 50_000_000)
+        self.assertEqual(archivo.tell(), 0)
+        with self.assertRaises(ingesta.ImagenRechazada):
+            ingesta.inspeccionar(png_con_cabecera(50_000, 50_000), 10 ** 10)
+        with self.assertRaisesRegex(ingesta.ImagenRechazada, 'reconocible'):
+            ingesta.inspeccionar(io.BytesIO(b'no soy una imagen'), 1000)
+
+    def test_subidas_rechazadas_no_se_guardan(self):
+        texto = io.BytesIO(b'no soy una imagen')
+        texto.name = 'foto.png'
+        truncada = io.BytesIO(png_subido(tamano=(64, 64)).getvalue()[:200])
+        truncada.name = 'truncada.png'
+        for archivo in (texto, png_con_cabecera(50_000, 50_000), truncada):
+            respuesta = self.client.post('/', {'imagen': archivo})
+            self.assertEqual(respuesta.status_code, 200, archivo.name)
+            self.assertTrue(respuesta.context['error'], archivo.name)
+            self.assertIsNone(respuesta.context['imagen_url'], archivo.name)
+        with self.settings(EDITOR_INGESTA=dict(settings.EDITOR_INGESTA, BYTES_MAXIMOS=100)):
+            respuesta = self.client.post('/', {'imagen': png_subido()})
+        self.assertIn('foto.png', respuesta.context['error'])
+        self.assertEqual(self.guardados(), [])
+        self.assertFalse(Archivo.objects.exists())
+
+    def test_subida_con_su_piramide(self):
+        imagen_url = self.client.post('/', {'imagen': png_subido(tamano=(40, 32))}).context['imagen_url']
+        original = os.path.join(self.media, imagen_url.replace('/media/', ''))
+        formas = {factor: np.asarray(crudo.abrir(ruta)).shape
+                  for factor, ruta in ingesta.niveles_disponibles(original).items()}
+        self.assertEqual(formas, {2: (16, 20, 3), 4: (8, 10, 3), 8: (4, 5, 3)})
+
+
+class VistaPreviaTests(MediaTemporal):
+    def test_imagen_inexistente_da_404(self):
+        imagen_url = self.subir()
+        self.assertEqual(self.client.post('/previa/', {'imagen_actual': imagen_url, 'accion': 'negativo'})
+                         .status_code, 200)
+        for url in ('/media/originales/no/existe.png', '/media/'):
+            self.assertEqual(self.client.post('/previa/', {'imagen_actual': url, 'accion': 'negativo'}).status_code, 404)
+
+    def test_resultado_directo_de_imagen_inexistente_da_404(self):
+        imagen_url = self.subir()
+        respuesta = self.client.get('/resultado/', {'imagen_actual': imagen_url, 'accion': 'negativo'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'image/png')
+        procesada_url = self.client.post('/', {'imagen_actual': imagen_url, 'accion': 'negativo'}).context['procesada_url']
+        with Image.open(os.path.join(self.media, procesada_url.replace('/media/', ''))) as guardada:
+            np.testing.assert_array_equal(np.asarray(Image.open(io.BytesIO(b''.join(respuesta.streaming_content)))),
+                                          np.asarray(guardada))
+        for url in ('/media/originales/no/existe.png', '/media/'):
+            self.assertEqual(self.client.get('/resultado/', {'imagen_actual': url, 'accion': 'negativo'}).status_code, 404)
+
+
+class SalidaTests(MediaTemporal):
+    CONFIG = {'FORMATO': 'png', 'FORMATOS': ('png', 'jpeg', 'raw'), 'CALIDAD': 90, 'COMPRESION_PNG': 6}
+
+    def test_politica_ignora_valores_no_permitidos(self):
+        casos = [({}, {'formato': 'png', 'compresion': 6}),
+                 ({'formato': 'png', 'compresion': '0'}, {'formato': 'png', 'compresion': 0}),
+                 ({'formato': 'png', 'compresion': '12'}, {'formato': 'png', 'compresion': 6}),
+                 ({'formato': 'jpeg', 'calidad': '70'}, {'formato': 'jpeg', 'calidad': 70}),
+                 ({'formato': 'jpeg', 'calidad': 'mucha'}, {'formato': 'jpeg', 'calidad': 90}),
+                 ({'formato': 'webp', 'calidad': '70'}, {'formato': 'png', 'compresion': 6}), # no permitido aquí
+                 ({'formato': 'gif'}, {'formato': 'png', 'compresion': 6}),
+                 ({'formato': 'raw', 'calidad': '70'}, {'formato': 'raw'})]
+        for datos, esperada in casos:
+            self.assertEqual(salida.politica(datos, self.CONFIG), esperada, str(datos))
+        self.assertEqual(salida.opciones(None), ('PNG', {'compress_level': 6}))
+        self.assertEqual(salida.opciones({'formato': 'jpeg', 'calidad': 70}), ('JPEG', {'quality': 70}))
+
+    def test_resultado_en_cada_formato(self):
+        imagen_url = self.subir()
+        formulario = {'imagen_actual': imagen_url, 'accion': 'negativo'}
+        urls = {}
+        for datos in ({}, {'formato': 'png', 'compresion': '0'}, {'formato': 'raw'}, {'formato': 'jpeg'},
+                      {'formato': 'webp', 'calidad': '80'}):
+            urls[datos.get('formato', 'defecto') + datos.get('compresion', '')] = \
+                self.client.post('/', dict(formulario, **datos)).context['procesada_url']
+        self.assertEqual(len(set(urls.values())), len(urls)) # la política forma parte de la clave de caché
+        rutas = {nombre: os.path.join(self.media, url.replace('/media/', '')) for nombre, url in urls.items()}
+        self.assertEqual({nombre: os.path.splitext(ruta)[1] for nombre, ruta in rutas.items()},
+                         {'defecto': '.png', 'png0': '.png', 'raw': '.npy', 'jpeg': '.jpg', 'webp': '.webp'})
+        esperado = np.asarray(Image.open(rutas['defecto']))
+        np.testing.assert_array_equal(np.asarray(Image.open(rutas['png0'])), esperado)
+        np.testing.assert_array_equal(np.load(rutas['raw']), esperado)
+        for nombre, formato in (('jpeg', 'JPEG'), ('webp', 'WEBP')):
+            with Image.open(rutas[nombre]) as codificada:
+                self.assertEqual((codificada.format, codificada.size), (formato, esperado.shape[1::-1]))
+        respuesta = self.client.get('/resultado/', dict(formulario, formato='jpeg'))
+        self.assertEqual(respuesta['Content-Type'], 'image/jpeg')
+        with Image.open(io.BytesIO(b''.join(respuesta))) as codificada:
+            self.assertEqual(codificada.format, 'JPEG')
+
+
+class HistogramaTests(MediaTemporal):
+    def test_estadisticas_por_bandas_iguales_a_numpy(self):
+        img = np.random.default_rng(0).integers(0, 256, (37, 23, 3), dtype=np.uint8)
+        canales = histograma.estadisticas(img, alto_banda=5)
+        self.assertEqual(list(canales), ['r', 'g', 'b', 'luminancia'])
+        for canal, nombre in enumerate('rgb'):
+            valores = img[:, :, canal]
+            datos = canales[nombre]
+            self.assertEqual(datos['histograma'], np.bincount(valores.ravel(), minlength=256).tolist())
+            self.assertEqual((datos['min'], datos['max']), (valores.min(), valores.max()))
+            self.assertAlmostEqual(datos['media'], valores.mean(), places=3)
+            self.assertAlmostEqual(datos['desviacion'], valores.std(), places=3)
+            for p, nivel in datos['percentiles'].items():
+                self.assertEqual(nivel, np.percentile(valores, float(p), method='inverted_cdf'))
+
+    def test_vista_de_imagen_inexistente_da_404(self):
+        imagen_url = self.subir()
+        respuesta = self.client.get('/histograma/', {'imagen_actual': imagen_url})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['canales']['r']['pixeles'], 24 * 16)
+        for url in ('/media/originales/no/existe.png', '/media/'):
+            self.assertEqual(self.client.get('/histograma/', {'imagen_actual': url}).status_code, 404)
+
+
+class NivelesTests(MediaTemporal):
+    def test_auto_niveles_estira_entre_percentiles(self):
+        rng = np.random.default_rng(0)
+        img = rng.integers(50, 151, (100, 100, 3), dtype=np.uint8)
+        img[2, 0], img[2, 1] = 50, 150
+        img[0], img[1] = 0, 255 # 1 % de valores extremos por cada lado
+        esperado = np.clip(np.round((img.astype(float) - 50) * 255 / 100), 0, 255).astype(np.uint8)
+        np.testing.assert_array_equal(niveles.auto_levels(img, 1, 99), esperado)
+        # sin recorte se estira entre el mínimo y el máximo presentes
+        np.testing.assert_array_equal(niveles.auto_levels(img[2:], 0, 100), esperado[2:])
+        plana = np.full((4, 5), 77, dtype=np.uint8)
+        np.testing.assert_array_equal(niveles.auto_levels(plana), plana)
+
+    def test_ecualizar_igual_a_la_formula(self):
+        gris = np.random.default_rng(1).integers(40, 90, (31, 17), dtype=np.uint8)
+        acumulado = np.cumsum(np.bincount(gris.ravel(), minlength=256))
+        primero = acumulado[gris.min()]
+        tabla = np.round((acumulado - primero) * 255 / (gris.size - primero)).astype(np.uint8)
+        np.testing.assert_array_equal(niveles.equalize(gris), tabla[gris])
+        color = color_de(gris)
+        np.testing.assert_array_equal(niveles.equalize(color), color_de(tabla[gris]))
+        np.testing.assert_array_equal(niveles.equalize(color, 'canales'), color_de(tabla[gris]))
+
+    def test_clahe(self):
+        gris = np.random.default_rng(2).integers(0, 120, (45, 38), dtype=np.uint8)
+        # un solo mosaico sin recorte es la ecualización por la frecuencia acumulada
+        acumulado = np.cumsum(np.bincount(gris.ravel(), minlength=256))
+        tabla = np.round(acumulado * 255 / gris.size).astype(np.uint8)
+        np.testing.assert_array_equal(niveles.clahe(gris, 1, 1000), tabla[gris])
+        color = np.random.default_rng(3).integers(0, 256, (45, 38, 3), dtype=np.uint8)
+        color[:, :19] //= 4 # mitad oscura: cada mosaico se ajusta a su zona
+        np.testing.assert_array_equal(niveles.clahe(color, 4, 2.0, filas_bloque=7), niveles.clahe(color, 4, 2.0))
+        self.assertGreater(niveles.clahe(color, 4, 2.0)[:, :19].std(), color[:, :19].std())
+        np.testing.assert_array_equal(niveles.clahe(color_de(gris), 4, 2.0), color_de(niveles.clahe(gris, 4, 2.0)))
+
+    def test_formulario_acota_los_parametros(self):
+        imagen_url = self.subir()
+        for datos in ({'accion': 'auto_niveles', 'recorte_niveles': 'nan'},
+                      {'accion': 'auto_niveles', 'recorte_niveles': '80'},
+                      {'accion': 'clahe', 'mosaicos_clahe': '1e9', 'limite_clahe': 'x'},
+                      {'accion': 'clahe', 'mosaicos_clahe': '-3', 'limite_clahe': '-1'}):
+            respuesta = self.client.post('/', dict(datos, imagen_actual=imagen_url))
+            self.assertEqual(respuesta.status_code, 200, str(datos))
+            self.assertTrue(respuesta.context['procesada_url'], str(datos))
+        self.assertEqual(views.levels_parameters({'accion': 'auto_niveles', 'recorte_niveles': '80'})['bajo'], 49)
+        self.assertEqual(views.levels_parameters({'accion': 'clahe', 'mosaicos_clahe': '1e9', 'limite_clahe': 'x'}),
+                         {'operacion': 'clahe', 'mosaicos': niveles.MOSAICOS_MAXIMOS, 'limite': 2.0})
+
+
+class RecetaTests(TestCase):
+    def test_pasos_por_canales_tras_binarizar(self):
+        for nombre, argumentos in (('extract_layer_rgb', {'capa': 0}), ('extract_layer_cmy', {'capa': 1}),
+                                   ('bright_layer', {'brillo': 0.1, 'capa': 2}), ('luminosity', {}),
+                                   ('binarize', {'umbral': 0.5})):
+            with self.assertRaisesRegex(ValueError, nombre):
+                acciones.validar_receta([{'op': 'binarize', 'umbral': 0.5}, {'op': 'bright', 'brillo': 0.1},
+                                         dict(argumentos, op=nombre)])
+
+    def test_recetas_validas_se_pueden_aplicar(self):
+        img = np.random.default_rng(0).integers(0, 256, (10, 12, 3), dtype=np.uint8)
+        # los grises conservan tres canales; binarize deja uno
+        for receta, dimensiones in (
+                ([{'op': 'luminosity'}, {'op': 'extract_layer_rgb', 'capa': 0}], 3),
+                ([{'op': 'average'}, {'op': 'bright_layer', 'brillo': 0.1, 'capa': 1},
+                  {'op': 'binarize', 'umbral': 0.5}], 2),
+                ([{'op': 'binarize', 'umbral': 0.5}, {'op': 'median'}, {'op': 'rotate', 'angulo': 10}], 2)):
+            acciones.validar_receta(receta)
+            self.assertEqual(bloques.procesar_completa(img, acciones.operaciones_receta(receta)).ndim, dimensiones)
+
+    def test_parametros_fuera_de_rango_o_de_tipo(self):
+        for paso in ({'op': 'lower_resolution', 'factor': 0}, {'op': 'lower_resolution', 'factor': 0.5},
+                     {'op': 'zoom', 'factor': -2}, {'op': 'zoom', 'factor': float('nan')},
+                     {'op': 'zoom', 'factor': acciones.ZOOM_MAXIMO * 2}, {'op': 'bright', 'brillo': 'claro'},
+                     {'op': 'bright', 'brillo': float('inf')}, {'op': 'bright', 'brillo': None},
+                     {'op': 'bright', 'brillo': True}, {'op': 'extract_layer_rgb', 'capa': 3},
+                     {'op': 'bright_layer', 'brillo': 0.1, 'capa': 0.5}, {'op': 'binarize', 'umbral': 2},
+                     {'op': 'contrast_dark', 'contraste': -1}, {'op': 'crop', 'xIni': 5, 'yIni': 0, 'xFin': 2, 'yFin': 4},
+                     {'op': 'crop', 'xIni': -1, 'yIni': 0, 'xFin': 2, 'yFin': 4},
+                     {'op': 'trasnslation', 'dx': 1.5, 'dy': 0}, {'op': 'resize', 'alto': 0, 'ancho': 10},
+                     {'op': 'resize', 'alto': 10, 'ancho': acciones.LADO_MAXIMO + 1},
+                     {'op': 'auto_levels', 'bajo': 60, 'alto': 40}, {'op': 'clahe', 'mosaicos': 10 ** 6},
+                     {'op': 'clahe', 'limite': 'x'}, {'op': 'rotate', 'angulo': float('nan')},
+                     {'op': 'rotate', 'angulo': 10, 'interpolacion': 'cubica'},
+                     {'op': 'rotate', 'angulo': 10, 'expandir': 'no'},
+                     {'op': 'fusion_images', 'capas': [{'imagen': 'a.png', 'peso': float('nan')}]},
+                     {'op': 'fusion_images', 'capas': [{'imagen': 'a.png'}], 'peso_base': -1}):
+            with self.assertRaises(ValueError, msg=paso):
+                acciones.validar_receta([paso])
+        self.assertEqual(self.client.post('/lote/', {'receta': json.dumps([{'op': 'lower_resolution', 'factor': 0}]),
+                                                     'imagenes': png_subido()}).status_code, 400)
+
+    def test_parametros_numericos_se_convierten(self):
+        pasos = acciones.validar_receta([{'op': 'extract_layer_rgb', 'capa': 1.0}, {'op': 'zoom', 'factor': '2'},
+                                         {'op': 'crop', 'xIni': '0', 'yIni': 0, 'xFin': '10', 'yFin': 4.0}])
+        self.assertEqual(pasos, [{'op': 'extract_layer_rgb', 'capa': 1}, {'op': 'zoom', 'factor': 2.0},
+                                 {'op': 'crop', 'xIni': 0, 'yIni': 0, 'xFin': 10, 'yFin': 4}])
+        self.assertIsInstance(pasos[0]['capa'], int)
+
+
+def rotar_bucles(a, ang):
+    """
+    imgPro.rotarImg antes de vectorizarla (con bucles de Python), de referencia.
+    """
+    ang = np.radians(ang)
+    m, n = a.shape[:2]
+    cos_ang, sin_ang = np.cos(ang), np.sin(ang)
+    if 0 < ang <= np.pi / 2:
+        c = int(round(m * sin_ang + n * cos_ang)) + 1
+        d = int(round(m * cos_ang + n * sin_ang)) + 1
+    else:
+        c = d = int(round(m * sin_ang - n * cos_ang)) + 1
+    b = np.zeros((c, d) + a.shape[2:], dtype=a.dtype)
+    for i in range(c):
+        for j in range(d):
+            if ang <= np.pi / 2:
+                iii, jjj = i - int(n * sin_ang) - 1, j
+            else:
+                iii, jjj = c - i - 1, d - j - 1
+            ii = int(round(jjj * sin_ang + iii * cos_ang))
+            jj = int(round(jjj * cos_ang - iii * sin_ang))
+            if 0 <= ii < m and 0 <= jj < n:
+                b[i, j] = a[ii, jj]
+    return b
+
+
+class RotacionTests(TestCase):
+    def test_rotarimg_vectorizada_igual_que_con_bucles(self):
+        gris = np.random.default_rng(0).integers(0, 256, (13, 17), dtype=np.uint8)
+        color = np.random.default_rng(1).integers(0, 256, (9, 11, 3), dtype=np.uint8)
+        for angulo in (1, 30, 45, 89.5, 90, 91, 135, 180):
+            for img in (gris, color):
+                np.testing.assert_array_equal(imgPro.rotarImg(img, angulo), rotar_bucles(img, angulo))
+        for angulo in (0, -10, 181):
+            with self.assertRaises(ValueError):
+                imgPro.rotarImg(gris, angulo)
+
+    def test_rotate_en_angulos_rectos(self):
+        img = np.random.default_rng(2).integers(0, 256, (7, 10, 3), dtype=np.uint8)
+        for veces in (1, 2, 3):
+            for interpolacion in rotacion.INTERPOLACIONES:
+                np.testing.assert_array_equal(rotacion.rotate(img, 90 * veces, interpolacion), np.rot90(img, veces))
+
+    def test_formulario_con_angulo_o_interpolacion_invalidos(self):
+        for angulo in ('nan', 'inf', '-inf', 'treinta', ''):
+            self.assertEqual(views.rotation_parameters({'angulo': angulo})['angulo'], 0)
+        parametros = views.rotation_parameters({'angulo': '30', 'interpolacion': 'cubica'})
+        self.assertEqual((parametros['angulo'], parametros['interpolacion']), (30, 'bilinear'))
+        self.assertEqual(views.rotation_parameters({'interpolacion': 'bicubic'})['interpolacion'], 'bicubic')
+
+
+class DecodificadasTests(MediaTemporal):
+    def guardar(self, nombre, semilla):
+        ruta = os.path.join(self.media, nombre)
+        with open(ruta, 'wb') as archivo:
+            archivo.write(png_subido(semilla, (10, 10)).getvalue())
+        return ruta
+
+    def test_decodifica_una_vez_y_desaloja_lo_menos_usado(self):
+        rutas = [self.guardar(f'{numero}.png', numero) for numero in range(3)]
+        decodificador = mock.Mock(wraps=decodificadas.decodificar)
+        cache = decodificadas.CacheDecodificadas(2 * 10 * 10 * 3, decodificador) # caben dos imágenes
+        primera = cache.obtener(rutas[0])
+        self.assertFalse(primera.flags.writeable)
+        np.testing.assert_array_equal(primera, np.asarray(Image.open(rutas[0]).convert('RGB')))
+        self.assertIs(cache.obtener(rutas[0]), primera)
+        cache.obtener(rutas[1])
+        cache.obtener(rutas[0]) # rutas[1] pasa a ser la menos usada
+        cache.obtener(rutas[2])
+        self.assertEqual(decodificador.call_count, 3)
+        self.assertEqual(list(cache.entradas), [rutas[0], rutas[2]])
+        self.assertEqual(cache.estadisticas(), {'aciertos': 2, 'fallos': 3, 'desalojos': 1, 'entradas': 2,
+                                                'bytes': 600, 'presupuesto': 600})
+
+    def test_archivo_cambiado_o_invalidado_se_vuelve_a_decodificar(self):
+        ruta = self.guardar('foto.png', 0)
+        cache = decodificadas.CacheDecodificadas(1 << 20)
+        antes = cache.obtener(ruta)
+        with open(ruta, 'wb') as archivo:
+            archivo.write(png_subido(1, (12, 10)).getvalue())
+        despues = cache.obtener(ruta)
+        self.assertEqual(despues.shape, (10, 12, 3))
+        self.assertFalse(np.array_equal(antes[:, :10], despues[:, :10]))
+        cache.invalidar(ruta)
+        self.assertIsNot(cache.obtener(ruta), despues)
+        self.assertEqual(cache.estadisticas()['fallos'], 3)
+        grande = decodificadas.CacheDecodificadas(10)
+        grande.obtener(ruta) # no cabe: se devuelve sin guardarla
+        self.assertEqual(grande.estadisticas()['entradas'], 0)
+
+    def test_ediciones_seguidas_decodifican_el_original_una_vez(self):
+        imagen_url = self.subir()
+        with mock.patch.object(views, 'decode_image', wraps=views.decode_image) as decodificar, \
+                mock.patch.object(views, '_cache_decodificadas', None):
+            resultados_url = [self.client.post('/', {'imagen_actual': imagen_url, 'accion': accion})
+                              .context['procesada_url'] for accion in ('negativo', 'extract_R', 'extract_G')]
+        self.assertEqual(decodificar.call_count, 1)
+        self.assertEqual(len(set(resultados_url)), 3)
+
+
+class CrudoTests(MediaTemporal):
+    def guardar(self, arr, tesela=None):
+        ruta = os.path.join(self.media, 'imagen' + crudo.EXTENSION)
+        with open(ruta, 'wb') as archivo:
+            crudo.escribir(archivo, arr, tesela)
+        return ruta
+
+    def test_ida_y_vuelta_por_filas_y_por_teselas(self):
+        rng = np.random.default_rng(0)
+        for arr in (rng.integers(0, 256, (37, 23, 3), dtype=np.uint8), rng.integers(0, 256, (9, 40), dtype=np.uint8),
+                    rng.integers(0, 256, (50, 30, 3), dtype=np.uint8)[::2, 5:]):
+            for tesela in (None, 8, (5, 16)):
+                ruta = self.guardar(arr, tesela)
+                leida = crudo.abrir(ruta)
+                np.testing.assert_array_equal(leida, arr)
+                self.assertFalse(leida.flags.writeable)
+                np.testing.assert_array_equal(crudo.region(ruta, 3, 17, 2, 19), arr[3:17, 2:19])
+                np.testing.assert_array_equal(crudo.region(ruta, -5, None, 0, 4), arr[-5:, :4])
+        with self.assertRaises(ValueError):
+            crudo.escribir(io.BytesIO(), np.zeros((4, 4), dtype=np.float32))
+        with open(os.path.join(self.media, 'otro.raw'), 'wb') as archivo:
+            archivo.write(b'no es crudo')
+        with self.assertRaises(ValueError):
+            crudo.abrir(os.path.join(self.media, 'otro.raw'))
+
+    def test_copia_cruda_se_escribe_en_el_ejecutor(self):
+        ruta = os.path.join(self.media, 'foto.png')
+        with open(ruta, 'wb') as archivo:
+            archivo.write(png_subido().getvalue())
+        cache = crudo.cache_proceso(os.path.join(self.media, 'crudos'), 1 << 20)
+        decodificar = mock.Mock(wraps=views.decodificadas.decodificar)
+        with views.ThreadPoolExecutor(1) as ejecutor:
+            primera = crudo.decodificar_en_cache(ruta, cache, decodificar, ejecutor)
+        segunda = crudo.decodificar_en_cache(ruta, cache, decodificar, ejecutor)
+        self.assertEqual(decodificar.call_count, 1)
+        np.testing.assert_array_equal(segunda, primera)
+        self.assertIsInstance(segunda.base, np.memmap)
+
+    def test_puntos_de_control_y_piramide_en_formato_crudo(self):
+        img = np.random.default_rng(1).integers(0, 256, (24, 16, 3), dtype=np.uint8)
+        ruta, tamano = historial._guardar_punto(img)
+        self.assertTrue(ruta.endswith(crudo.EXTENSION))
+        self.assertEqual(tamano, crudo.DESPLAZAMIENTO + img.nbytes)
+        np.testing.assert_array_equal(historial._abrir_punto(ruta), img)
+        original = os.path.join(self.media, 'foto.png')
+        Image.fromarray(img).save(original)
+        rutas = ingesta.construir_piramide(original)
+        self.assertTrue(all(nivel.endswith(crudo.EXTENSION) for nivel in rutas))
+        self.assertEqual(ingesta.nivel(original, lambda forma: forma[0] >= 6).shape, (6, 4, 3))
+        reducida, n = ingesta.nivel_divisor(original, 4)
+        self.assertEqual((reducida.shape, n), ((6, 4, 3), 4))
+        np.testing.assert_array_equal(reducida, np.asarray(Image.fromarray(img).reduce(2).reduce(2))) # cada nivel sale del anterior
+        # los niveles .npy anteriores se siguen leyendo y se borran con la pirámide
+        os.remove(rutas[2])
+        np.save(rutas[2][:-len(crudo.EXTENSION)] + '.npy', np.zeros((3, 2, 3), dtype=np.uint8))
+        self.assertEqual(ingesta.nivel(original, lambda forma: True).shape, (3, 2, 3))
+        ingesta.borrar_piramide(original)
+        self.assertEqual(ingesta.niveles_disponibles(original), {})
+        self.assertEqual(os.listdir(os.path.dirname(rutas[0])), [])
+
+
+class CacheResultadosTests(MediaTemporal):
+    def setUp(self):
+        super().setUp()
+        self.cache = resultados.CacheResultados(os.path.join(self.media, 'resultados'), 1 << 20, 1 << 20)
+
+    def test_hashes_memorizados_acotados(self):
+        rutas = []
+        for numero in range(3):
+            rutas.append(os.path.join(self.media, f'{numero}.bin'))
+            with open(rutas[-1], 'wb') as archivo:
+                archivo.write(bytes([numero]))
+        with mock.patch.object(resultados, 'MAXIMO_HASHES', 2):
+            hashes = [self.cache.hash_contenido(ruta) for ruta in rutas]
+            self.cache.hash_contenido(rutas[1]) # pasa a ser el más reciente
+            self.cache.hash_contenido(rutas[0])
+        self.assertEqual(len(set(hashes)), 3)
+        self.assertEqual([firma[0] for firma in self.cache.hashes], [rutas[1], rutas[0]])
+
+    def test_fecha_de_acceso_se_actualiza_como_mucho_una_vez_por_intervalo(self):
+        nombre = self.cache.guardar('a' * 64, b'datos')
+        ruta = self.cache.ruta('a' * 64)
+        os.utime(ruta, (0, 0))
+        self.assertEqual(self.cache.buscar('a' * 64), nombre) # acierto en memoria: también marca el acceso
+        self.assertGreater(os.stat(ruta).st_mtime, 0)
+        os.utime(ruta, (0, 0))
+        self.assertEqual(self.cache.buscar('a' * 64), nombre)
+        self.assertEqual(os.stat(ruta).st_mtime, 0)
+        with mock.patch.object(resultados, 'INTERVALO_ACCESO', 0):
+            self.assertEqual(self.cache.buscar('a' * 64), nombre)
+        self.assertGreater(os.stat(ruta).st_mtime, 0)
+        # desalojado por otro proceso: se detecta aunque el acceso sea reciente
+        os.remove(ruta)
+        self.assertIsNone(self.cache.buscar('a' * 64))
+        self.assertIsNone(self.cache.leer('a' * 64))
+
+
+class FiltrosTests(TestCase):
+    def test_parametros_acotados_en_todas_las_entradas(self):
+        for nombre, parametros in (('gaussian_blur', {'sigma': 1e9}), ('unsharp_mask', {'sigma': filtros.SIGMA_MAXIMO + 1}),
+                                   ('gaussian_blur', {'sigma': float('nan')}), ('gaussian_blur', {'sigma': 0}),
+                                   ('box_blur', {'radio': filtros.RADIO_CAJA_MAXIMO + 1}), ('box_blur', {'radio': 0}),
+                                   ('median', {'radio': filtros.RADIO_MEDIANA_MAXIMO + 1}),
+                                   ('unsharp_mask', {'cantidad': 'mucho'}), ('gaussian_blur', {'sigma': None})):
+            with self.assertRaises(ValueError):
+                filtros.operacion(nombre, **parametros)
+            with self.assertRaises(ValueError):
+                acciones.validar_receta([dict(parametros, op=nombre)])
+        filtros.operacion('gaussian_blur', sigma=filtros.SIGMA_MAXIMO)
+        filtros.operacion('box_blur', radio=filtros.RADIO_CAJA_MAXIMO)
+
+    def test_formulario_ignora_valores_no_numericos(self):
+        self.assertEqual(views.filter_parameters({'filtro': 'gaussian_blur', 'intensidad_filtro': 'nan'}),
+                         {'operacion': 'filtro', 'filtro': 'gaussian_blur'})
+        self.assertEqual(views.filter_parameters({'filtro': 'box_blur', 'intensidad_filtro': '1e9'})['radio'],
+                         views.INTENSIDAD_FILTRO_MAXIMA)
+        self.assertEqual(views.filter_parameters({'filtro': 'unsharp_mask', 'cantidad_filtro': 'x'})['cantidad'], 1.0)
+
+    def test_mediana_y_caja_por_bandas_igual_que_completa(self):
+        img = np.random.default_rng(0).integers(0, 256, (37, 29, 3), dtype=np.uint8)
+        for filtro in (filtros.Filtro('median', 2), filtros.Filtro('box_blur', 3), filtros.Filtro('gaussian_blur', 1.5)):
+            completa = filtro.aplicar(img, 0, len(img))
+            self.assertEqual(completa.shape, img.shape)
+            for alto_banda in (1, 5, 16):
+                np.testing.assert_array_equal(bloques.ensamblar(img, [filtro], alto_banda, 2), completa)
+
+    def test_resultados_iguales_a_la_definicion(self):
+        rng = np.random.default_rng(9)
+        img = rng.integers(0, 256, (23, 31, 3), dtype=np.uint8)
+
+        def ventanas(radio, entrada=img):
+            # ventanas (2 radio + 1)^2 de cada píxel con los bordes replicados
+            bordes = ((radio, radio), (radio, radio)) + ((0, 0),) * (entrada.ndim - 2)
+            relleno = np.pad(entrada.astype(np.float64), bordes, mode='edge')
+            return np.lib.stride_tricks.sliding_window_view(relleno, (2 * radio + 1, 2 * radio + 1), axis=(0, 1))
+
+        nucleo = filtros.nucleo_gaussiano(1.5).astype(np.float64)
+        gaussiano = np.einsum('...ij,i,j->...', ventanas(len(nucleo) // 2), nucleo, nucleo)
+        self.assertLessEqual(np.abs(filtros.gaussian_blur(img, 1.5) - np.round(gaussiano)).max(), 1)
+        enfocada = np.clip(np.round(img + 0.8 * (img - gaussiano)), 0, 255)
+        self.assertLessEqual(np.abs(filtros.unsharp_mask(img, 1.5, 0.8) - enfocada).max(), 1)
+        for radio in (1, 4):
+            suma = ventanas(radio).sum(axis=(-2, -1))
+            area = (2 * radio + 1) ** 2
+            np.testing.assert_array_equal(filtros.box_blur(img, radio), (suma + area // 2) // area)
+            np.testing.assert_array_equal(filtros.median(img, radio), np.median(ventanas(radio), axis=(-2, -1)))
+        gris = rng.integers(0, 256, (23, 31), dtype=np.uint8)
+        vecinos = ventanas(1, gris)
+        sobel_x = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
+        magnitud = np.hypot(np.einsum('...ij,ij->...', vecinos, sobel_x), np.einsum('...ij,ij->...', vecinos, sobel_x.T))
+        self.assertLessEqual(np.abs(filtros.sobel(gris) - np.clip(np.round(magnitud), 0, 255)).max(), 1)
+        laplaciano = np.abs(np.einsum('...ij,ij->...', vecinos, [[0, 1, 0], [1, -4, 1], [0, 1, 0]]))
+        np.testing.assert_array_equal(filtros.laplacian(gris), np.clip(laplaciano, 0, 255))
+
+
+class ComposicionTests(MediaTemporal):
+    def setUp(self):
+        super().setUp()
+        self.imagen_url = self.subir()
+
+    def fusionar(self, **campos):
+        return self.client.post('/', dict(imagen_actual=self.imagen_url, accion='fusionar', **campos))
+
+    def test_modos_de_fusion_iguales_a_sus_formulas(self):
+        rng = np.random.default_rng(6)
+        base = rng.integers(0, 256, (19, 23, 3), dtype=np.uint8)
+        capa = rng.integers(0, 256, (19, 23, 3), dtype=np.uint8)
+        a, b = base / 255, capa / 255
+        formulas = {'normal': b, 'multiply': a * b, 'screen': a + b - a * b,
+                    'overlay': np.where(a < 0.5, 2 * a * b, 2 * (a + b - a * b) - 1)}
+        for modo, fundida in formulas.items():
+            resultado = composicion.compose(base, [{'imagen': capa, 'peso': 0.6, 'modo': modo}])
+            esperado = np.round(255 * (a + 0.6 * (fundida - a)))
+            self.assertLessEqual(np.abs(resultado - esperado).max(), 1, modo)
+        # la máscara multiplica el peso píxel a píxel; capas sucesivas se apilan
+        mascara = rng.integers(0, 256, (19, 23), dtype=np.uint8)
+        resultado = composicion.compose(base, [{'imagen': capa, 'mascara': mascara},
+                                               {'imagen': base, 'peso': 0.5, 'modo': 'multiply'}])
+        alfa = (mascara / 255)[:, :, np.newaxis]
+        primera = a + alfa * (b - a)
+        esperado = np.round(255 * (primera + 0.5 * (primera * a - primera)))
+        self.assertLessEqual(np.abs(resultado - esperado).max(), 1)
+
+    def test_promedio_igual_que_fusion_images(self):
+        rng = np.random.default_rng(7)
+        base = rng.integers(0, 256, (21, 17, 3), dtype=np.uint8)
+        capa = rng.integers(0, 256, (21, 17, 3), dtype=np.uint8)
+        esperado = np.round(imgPro.fusion_images(base / 255, capa / 255) * 255)
+        resultado = composicion.compose(base, [{'imagen': capa}], mezcla='promedio')
+        self.assertLessEqual(np.abs(resultado - esperado).max(), 1)
+
+    def test_por_bandas_igual_que_completa(self):
+        rng = np.random.default_rng(8)
+        base = rng.integers(0, 256, (41, 30, 3), dtype=np.uint8)
+        capas = [{'imagen': rng.integers(0, 256, (25, 50, 3), dtype=np.uint8), 'modo': 'overlay', 'peso': 0.7},
+                 {'imagen': rng.integers(0, 256, (41, 30), dtype=np.uint8), 'modo': 'screen',
+                  'mascara': rng.integers(0, 256, (13, 9, 3), dtype=np.uint8)}]
+        def componer(mezcla, alto_banda):
+            operacion = composicion.Composicion(capas, mezcla, abrir=lambda imagen: imagen)
+            return bloques.ensamblar(base, [operacion], alto_banda)
+        for mezcla in composicion.MEZCLAS:
+            completa = componer(mezcla, len(base))
+            for alto_banda in (1, 6, 16):
+                np.testing.assert_array_equal(componer(mezcla, alto_banda), completa, f'{mezcla} {alto_banda}')
+
+    def test_capas_subidas_en_la_peticion_o_antes(self):
+        respuesta = self.fusionar(capas=png_subido(1), modo_fusion='screen')
+        self.assertIsNone(respuesta.context['error'])
+        self.assertTrue(respuesta.context['procesada_url'])
+        capa_url = self.subir(semilla=2)
+        respuesta = self.fusionar(capa_url=capa_url, mascara_url=self.imagen_url)
+        self.assertIsNone(respuesta.context['error'])
+        self.assertTrue(respuesta.context['procesada_url'])
+
+    def test_capas_que_no_son_subidas_dan_error_de_formulario(self):
+        with open(os.path.join(self.media, 'suelto.png'), 'wb') as archivo:
+            archivo.write(png_subido(3).getvalue())
+        borrada = self.subir(semilla=4)
+        os.remove(os.path.join(self.media, borrada.replace('/media/', '')))
+        for url in ('/media/suelto.png', '/media/../../etc/passwd', '/etc/passwd', borrada,
+                    '/media/originales/00/00/' + '0' * 64 + '.png'):
+            respuesta = self.fusionar(capa_url=url)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertTrue(respuesta.context['error'])
+            self.assertIsNone(respuesta.context['procesada_url'])
+            respuesta = self.fusionar(capa_url=self.imagen_url, mascara_url=url)
+            self.assertTrue(respuesta.context['error'])
+        respuesta = self.client.post('/previa/', {'imagen_actual': self.imagen_url, 'accion': 'fusionar',
+                                                  'capa_url': '/media/suelto.png'})
+        self.assertEqual(respuesta.status_code, 400)
+        receta = [{'op': 'fusion_images', 'capas': [{'imagen': '/media/suelto.png'}]}]
+        respuesta = self.client.post('/lote/', {'receta': json.dumps(receta), 'imagenes': png_subido(5)})
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class VistaAsincronaTests(ConMediaTemporal, TransactionTestCase):
+    # index_async atiende en un hilo con su propia conexión: necesita ver lo
+    # que ya se ha confirmado, no una transacción abierta de la prueba.
+
+    def test_misma_atencion_que_index(self):
+        imagen_url = self.client.post('/async/', {'imagen': png_subido()}).context['imagen_url']
+        respuesta = self.client.post('/async/', {'imagen_actual': imagen_url, 'accion': 'fusionar',
+                                                 'capas': png_subido(1), 'modo_fusion': 'screen'})
+        self.assertIsNone(respuesta.context['error'])
+        self.assertTrue(respuesta.context['procesada_url'])
+        resultados = [self.client.post('/async/', {'imagen_actual': imagen_url, 'accion': accion, 'apilar': '1'})
+                      .context['procesada_url'] for accion in ('negativo', 'extract_R')]
+        respuesta = self.client.post('/async/', {'imagen_actual': imagen_url, 'accion': 'deshacer'})
+        self.assertEqual(respuesta.context['historial'].posicion, 1)
+        self.assertEqual(respuesta.context['procesada_url'], resultados[0])
+
+
+class TrabajosTests(ConMediaTemporal, TransactionTestCase):
+    # _terminar actualiza el trabajo desde el hilo del pool, con su propia conexión
+
+    def test_solo_se_recuperan_los_trabajos_de_procesos_muertos(self):
+        host = socket.gethostname()
+        hijo = subprocess.Popen([sys.executable, '-c', 'pass'])
+        hijo.wait() # pid de un proceso que ya no existe
+        duenos = {'muerto': f'{host}:{hijo.pid}', 'vivo': trabajos.propietario(), 'otro_host': f'otro-{host}:1',
+                  'sin_dueno': ''}
+        creados = {nombre: Trabajo.objects.create(ruta_original=nombre, parametros={}, clave='x', propietario=dueno)
+                   for nombre, dueno in duenos.items()}
+        terminado = Trabajo.objects.create(ruta_original='terminado', parametros={}, clave='x',
+                                           propietario=duenos['muerto'], estado=Trabajo.TERMINADO)
+        self.assertEqual(trabajos.recuperar_huerfanos(), 2)
+        estados = {nombre: Trabajo.objects.get(pk=trabajo.pk).estado for nombre, trabajo in creados.items()}
+        self.assertEqual(estados, {'muerto': Trabajo.ERROR, 'vivo': Trabajo.PENDIENTE,
+                                   'otro_host': Trabajo.PENDIENTE, 'sin_dueno': Trabajo.ERROR})
+        self.assertEqual(Trabajo.objects.get(pk=terminado.pk).estado, Trabajo.TERMINADO)
+
+    def test_trabajo_asincrono_da_el_mismo_resultado(self):
+        # el pool de procesos se sustituye por un hilo: el trabajo es el mismo
+        cola = trabajos.ColaTrabajos(1, views.result_cache())
+        cola.pool = ThreadPoolExecutor(1)
+        self.addCleanup(cola.pool.shutdown)
+        imagen_url = self.subir()
+        with mock.patch.object(trabajos, '_cola', cola):
+            respuesta = self.client.post('/', {'imagen_actual': imagen_url, 'accion': 'negativo', 'asincrono': '1'})
+        trabajo = respuesta.context['trabajo']
+        self.assertFalse(respuesta.context['procesada_url'])
+        cola.pool.shutdown(wait=True)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.propietario, trabajos.propietario())
+        self.assertEqual(trabajo.estado, Trabajo.TERMINADO)
+        estado = self.client.get(f'/trabajos/{trabajo.pk}/').json()
+        self.assertEqual(estado['estado'], Trabajo.TERMINADO)
+        self.assertRedirects(self.client.get(f'/trabajos/{trabajo.pk}/resultado/'), estado['procesada_url'],
+                             fetch_redirect_response=False)
+        # la petición síncrona encuentra el resultado del trabajo en la caché
+        respuesta = self.client.post('/', {'imagen_actual': imagen_url, 'accion': 'negativo'})
+        self.assertEqual(respuesta.context['procesada_url'], estado['procesada_url'])
+
+    def test_trabajo_fallido_y_pendiente(self):
+        cola = trabajos.ColaTrabajos(1, views.result_cache())
+        trabajo = Trabajo.objects.create(ruta_original='x', parametros={}, clave='x')
+        self.assertEqual(self.client.get(f'/trabajos/{trabajo.pk}/resultado/').status_code, 202)
+        destino = os.path.join(self.media, 'parcial.tmp')
+        with open(destino, 'wb'):
+            pass
+        futuro = Future()
+        futuro.set_exception(OSError('disco lleno'))
+        cola._terminar(trabajo.pk, 'x', destino, '.png', futuro)
+        self.assertFalse(os.path.exists(destino))
+        respuesta = self.client.get(f'/trabajos/{trabajo.pk}/resultado/')
+        self.assertEqual(respuesta.status_code, 500)
+        self.assertEqual(respuesta.json(), {'estado': Trabajo.ERROR, 'error': 'disco lleno'})
+        self.assertEqual(self.client.get(f'/trabajos/{trabajo.pk}/').json()['error'], 'disco lleno')
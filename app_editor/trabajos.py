@@ -0,0 +1,143 @@
+"""
+Cola de trabajos en segundo plano para operaciones pesadas de imgPro.
+
+Las operaciones se envían a un ProcessPoolExecutor para que el hilo de la
+petición (y el GIL del proceso web) queden libres mientras se rota o procesa
+una imagen grande. El estado de cada trabajo se guarda en el modelo Trabajo
+(SQLite), que la vista de estado consulta; no se necesita un broker externo.
+
+Los procesos del pool se crean con 'spawn' y solo importan utils/acciones.py,
+que no depende de Django. Un trabajo queda pendiente hasta que un proceso
+del pool lo empieza y lo anuncia por una cola (acciones.procesar_trabajo);
+un hilo del servidor lo pasa entonces a en proceso.
+
+Cada trabajo guarda en propietario el host y el pid del proceso del
+servidor que lo encoló. Al crear su pool, un proceso marca como
+interrumpidos solo los trabajos sin terminar cuyo propietario ya no existe
+(del mismo host), así que con varios procesos del servidor ninguno da por
+fallidos los trabajos que otro sigue ejecutando.
+"""
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+
+from .models import Trabajo
+from .utils import acciones
+from .utils import salida
+
+
+class ColaTrabajos:
+    """
+    Cola local: los trabajos se registran en la base de datos y se ejecutan en
+    un pool de procesos del mismo servidor.
+    """
+
+    def __init__(self, procesos, cache, crudos=None):
+        self.procesos = procesos
+        self.cache = cache
+        self.crudos = crudos # (directorio, bytes) de las copias crudas, ver utils/crudo.py
+        self.pool = None
+        self.candado = threading.Lock()
+
+    def _pool(self):
+        with self.candado:
+            if self.pool is None:
+                recuperar_huerfanos()
+                contexto = multiprocessing.get_context('spawn')
+                avisos = contexto.SimpleQueue()
+                self.pool = ProcessPoolExecutor(self.procesos, mp_context=contexto,
+                                                initializer=acciones.iniciar_proceso, initargs=(avisos,))
+                threading.Thread(target=self._escuchar, args=(avisos,), name='trabajos-avisos', daemon=True).start()
+            return self.pool
+
+    def _escuchar(self, avisos):
+        # los procesos del pool anuncian cada trabajo al empezarlo
+        while True:
+            pk = avisos.get()
+            try:
+                Trabajo.objects.filter(pk=pk, estado=Trabajo.PENDIENTE).update(estado=Trabajo.EN_PROCESO)
+            finally:
+                connection.close()
+
+    def encolar(self, ruta_original, parametros, clave, lote=None):
+        """
+        Registra un trabajo y lo envía al pool. Devuelve el Trabajo creado.
+        """
+        pool = self._pool()
+        trabajo = Trabajo.objects.create(ruta_original=ruta_original, parametros=parametros, clave=clave, lote=lote,
+                                         propietario=propietario())
+        descriptor, destino = tempfile.mkstemp(suffix='.tmp', dir=self.cache.directorio)
+        os.close(descriptor)
+        futuro = pool.submit(acciones.procesar_trabajo, str(trabajo.pk), ruta_original, parametros, destino,
+                             settings.EDITOR_MEGAPIXELES_POR_BANDAS, self.crudos, settings.EDITOR_HILOS_BANDAS)
+        extension = salida.extension(parametros.get('salida'))
+        futuro.add_done_callback(lambda f: self._terminar(trabajo.pk, clave, destino, extension, f))
+        return trabajo
+
+    def _terminar(self, pk, clave, destino, extension, futuro):
+        # se ejecuta en un hilo interno del pool, con su propia conexión a la base de datos
+        try:
+            futuro.result()
+            nombre = self.cache.adoptar(clave, destino, extension)
+            Trabajo.objects.filter(pk=pk).update(estado=Trabajo.TERMINADO, resultado=nombre)
+        except Exception as error:
+            if os.path.exists(destino):
+                os.remove(destino)
+            Trabajo.objects.filter(pk=pk).update(estado=Trabajo.ERROR, error=str(error))
+        finally:
+            connection.close()
+
+
+def propietario():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def _vivo(pid):
+    if os.name != 'posix':
+        return True # sin una comprobación segura (la señal 0 no existe en Windows) no se toca
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError: # existe, de otro usuario
+        return True
+    return True
+
+def recuperar_huerfanos():
+    """
+    Marca como interrumpidos los trabajos sin terminar encolados por un
+    proceso de este host que ya no existe (o por una versión anterior, sin
+    propietario). Los de otros procesos vivos o de otros hosts no se tocan.
+    Devuelve cuántos se marcaron.
+    """
+    host = socket.gethostname()
+    huerfanos = []
+    for pk, dueno in Trabajo.objects.filter(estado__in=[Trabajo.PENDIENTE, Trabajo.EN_PROCESO]).values_list(
+            'pk', 'propietario'):
+        host_dueno, _, pid = dueno.rpartition(':')
+        if not dueno or (host_dueno == host and pid.isdigit() and not _vivo(int(pid))):
+            huerfanos.append(pk)
+    return Trabajo.objects.filter(pk__in=huerfanos, estado__in=[Trabajo.PENDIENTE, Trabajo.EN_PROCESO]).update(
+        estado=Trabajo.ERROR, error='Interrumpido por reinicio del servidor.')
+
+
+_cola = None
+
+def cola(cache):
+    """
+    Cola del proceso, creada al primer uso con EDITOR_TRABAJOS. Los resultados
+    se guardan en cache (una CacheResultados) y los originales se abren desde
+    las copias crudas de EDITOR_CACHE_CRUDOS.
+    """
+    global _cola
+    if _cola is None:
+        crudos = settings.EDITOR_CACHE_CRUDOS
+        _cola = ColaTrabajos(settings.EDITOR_TRABAJOS['PROCESOS'], cache,
+                             (FileSystemStorage().path(crudos['DIRECTORIO']), crudos['BYTES_DISCO']))
+    return _cola
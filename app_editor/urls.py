@@ -3,4 +3,14 @@ from . import views
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('async/', views.index_async, name='index_async'),
+    path('previa/', views.preview, name='preview'),
+    path('resultado/', views.stream_result, name='stream_result'),
+    path('histograma/', views.image_stats, name='image_stats'),
+    path('cache/estadisticas/', views.cache_stats, name='cache_stats'),
+    path('metricas/', views.metrics, name='metrics'),
+    path('trabajos/<uuid:trabajo_id>/', views.job_status, name='job_status'),
+    path('trabajos/<uuid:trabajo_id>/resultado/', views.job_result, name='job_result'),
+    path('lote/', views.batch, name='batch'),
+    path('lote/<uuid:lote_id>/', views.batch_status, name='batch_status'),
 ]
\ No newline at end of file
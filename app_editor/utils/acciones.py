@@ -0,0 +1,357 @@
+"""
+Traducción de los parámetros de una acción del editor a operaciones de bloques.
+
+Los parámetros son un diccionario serializable en JSON (por ejemplo
+{'operacion': 'layer', 'capa': 0, 'canal': 'rgb', 'tipo_grises': None}), así
+que la misma descripción sirve como clave de caché, se guarda en la base de
+datos para los trabajos en segundo plano y se reconstruye en otro proceso.
+"""
+import math
+import os
+
+from . import bloques
+from . import composicion
+from . import crudo
+from . import decodificadas
+from . import diferida
+from . import filtros
+from . import imgPro8
+from . import ingesta
+from . import niveles
+from . import remuestreo
+from . import rotacion
+from . import salida as politica_salida
+
+
+# Un nivel de la pirámide sirve de entrada para reducir a un tamaño si tiene
+# al menos este múltiplo de ese tamaño, así el filtro del remuestreo sigue
+# viendo más píxeles de los que produce
+MARGEN_PIRAMIDE = 2
+
+
+def identidad(img):
+    return img
+
+def operacion_capa(capa, canal, tipo_grises=None):
+    """
+    Operación puntual de imgPro8 para extracción de capas, negativo y grises.
+    """
+    if canal == "rgb":
+        return bloques.Puntual(imgPro8.extract_layer_rgb, capa)
+    elif canal == "cmy":
+        return bloques.Puntual(imgPro8.extract_layer_cmy, capa)
+    elif capa is None and canal is None and tipo_grises is None:
+        return bloques.Puntual(imgPro8.reverse)
+    elif tipo_grises == "average":
+        return bloques.Puntual(imgPro8.average)
+    elif tipo_grises == "luminosity":
+        return bloques.Puntual(imgPro8.luminosity)
+    elif tipo_grises == "midgray":
+        return bloques.Puntual(imgPro8.midgray)
+    return bloques.Puntual(identidad)
+
+# Pasos de una receta (pipeline) -> argumentos en orden. Cada paso es un
+# método de diferida.ImagenDiferida con el mismo nombre que en imgPro.
+PASOS_PUNTUALES = {
+    'extract_layer_rgb': ('capa',),
+    'extract_layer_cmy': ('capa',),
+    'average': (),
+    'luminosity': (),
+    'midgray': (),
+    'binarize': ('umbral',),
+}
+PASOS_TONALES = {
+    'bright': ('brillo',),
+    'bright_layer': ('brillo', 'capa'),
+    'contrast_dark': ('contraste',),
+    'contrast_light': ('contraste',),
+    'reverse': (),
+}
+PASOS_GEOMETRICOS = {
+    'crop': ('xIni', 'yIni', 'xFin', 'yFin'),
+    'trasnslation': ('dx', 'dy'),
+}
+# Cambios de tamaño: argumentos obligatorios y filtro por defecto (se puede
+# cambiar con 'filtro' en el paso, ver remuestreo.FILTROS)
+PASOS_REMUESTREO = {
+    'lower_resolution': (('factor',), 'box'),
+    'zoom': (('factor',), 'bilinear'),
+    'resize': (('alto', 'ancho'), 'lanczos'),
+}
+# Filtros espaciales -> argumentos opcionales con su valor por defecto
+PASOS_FILTROS = filtros.PARAMETROS
+# Ajustes por histograma (operaciones globales) -> argumentos opcionales con
+# su valor por defecto
+PASOS_NIVELES = {
+    'auto_levels': (('bajo', 0.5), ('alto', 99.5), ('modo', 'canales')),
+    'equalize': (('modo', 'luminancia'),),
+    'clahe': (('mosaicos', 8), ('limite', 2.0)),
+}
+# Pasos que indexan los canales RGB y los que dejan la imagen con un solo
+# canal (los grises de imgPro8 siguen teniendo tres canales iguales)
+PASOS_POR_CANALES = ('extract_layer_rgb', 'extract_layer_cmy', 'average', 'luminosity', 'midgray', 'binarize',
+                     'bright_layer')
+PASOS_UN_CANAL = ('binarize',)
+
+# Lado máximo de la salida de resize y factores extremos de zoom
+LADO_MAXIMO = 20_000
+ZOOM_MINIMO = 0.01
+ZOOM_MAXIMO = 16
+# Parámetros numéricos de cada paso -> (tipo, mínimo, máximo), None sin cota.
+# Los de los filtros espaciales los comprueba filtros.Filtro
+_CAPA = (int, 0, 2)
+_BRILLO = (float, -1, 1)
+_CONTRASTE = (float, 0, None)
+_ENTERO = (int, None, None)
+_PERCENTIL = (float, 0, 100)
+RANGOS_PASOS = {
+    'extract_layer_rgb': {'capa': _CAPA},
+    'extract_layer_cmy': {'capa': _CAPA},
+    'binarize': {'umbral': (float, 0, 1)},
+    'bright': {'brillo': _BRILLO},
+    'bright_layer': {'brillo': _BRILLO, 'capa': _CAPA},
+    'contrast_dark': {'contraste': _CONTRASTE},
+    'contrast_light': {'contraste': _CONTRASTE},
+    'crop': {nombre: (int, 0, None) for nombre in PASOS_GEOMETRICOS['crop']},
+    'trasnslation': {'dx': _ENTERO, 'dy': _ENTERO},
+    'lower_resolution': {'factor': (float, 1, None)},
+    'zoom': {'factor': (float, ZOOM_MINIMO, ZOOM_MAXIMO)},
+    'resize': {'alto': (int, 1, LADO_MAXIMO), 'ancho': (int, 1, LADO_MAXIMO)},
+    'auto_levels': {'bajo': _PERCENTIL, 'alto': _PERCENTIL},
+    'clahe': {'mosaicos': (int, 1, niveles.MOSAICOS_MAXIMOS), 'limite': (float, 1, None)},
+    'rotate': {'angulo': (float, None, None)},
+    'fusion_images': {'peso_base': (float, 0, None)},
+}
+
+def _argumentos(paso, nombres):
+    faltantes = [nombre for nombre in nombres if nombre not in paso]
+    if faltantes:
+        raise ValueError(f"Faltan parámetros en el paso {paso['op']}: {', '.join(faltantes)}")
+    return [paso[nombre] for nombre in nombres]
+
+def _validar_numero(nombre, parametro, valor, tipo, minimo, maximo):
+    """
+    Convierte valor a tipo comprobando que sea un número finito (entero si tipo
+    es int) dentro de [minimo, maximo]. Lanza ValueError si no.
+    """
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        numero = math.nan
+    if isinstance(valor, bool) or not math.isfinite(numero) or (tipo is int and not numero.is_integer()):
+        clase = 'un entero' if tipo is int else 'un número finito'
+        raise ValueError(f"El parámetro {parametro} del paso {nombre} debe ser {clase}: {valor!r}")
+    if (minimo is not None and numero < minimo) or (maximo is not None and numero > maximo):
+        rango = f"[{'-∞' if minimo is None else minimo}, {'∞' if maximo is None else maximo}]"
+        raise ValueError(f"El parámetro {parametro} del paso {nombre} debe estar en {rango}: {valor!r}")
+    return tipo(numero)
+
+def validar_receta(pasos):
+    """
+    Comprueba que una receta sea una lista de pasos {'op': nombre, ...} con
+    operaciones conocidas y todos sus parámetros, con el tipo y el rango de
+    RANGOS_PASOS, y que ningún paso de PASOS_POR_CANALES vaya detrás de uno
+    que deja un solo canal. Devuelve los pasos con esos parámetros convertidos
+    a su tipo; lanza ValueError si no son válidos.
+    """
+    if not isinstance(pasos, list) or not pasos:
+        raise ValueError("La receta debe ser una lista no vacía de pasos.")
+    un_canal = None # paso que dejó la imagen con un solo canal
+    normalizados = [] # pasos con los parámetros numéricos ya convertidos
+    for paso in pasos:
+        if not isinstance(paso, dict) or 'op' not in paso:
+            raise ValueError(f"Paso inválido: {paso!r}")
+        nombre = paso['op']
+        if un_canal is not None and nombre in PASOS_POR_CANALES:
+            raise ValueError(f"El paso {nombre} necesita una imagen de 3 canales y {un_canal} la deja en uno.")
+        if nombre in PASOS_UN_CANAL:
+            un_canal = nombre
+        if nombre in PASOS_PUNTUALES:
+            _argumentos(paso, PASOS_PUNTUALES[nombre])
+        elif nombre in PASOS_TONALES:
+            _argumentos(paso, PASOS_TONALES[nombre])
+        elif nombre in PASOS_GEOMETRICOS:
+            _argumentos(paso, PASOS_GEOMETRICOS[nombre])
+        elif nombre in PASOS_REMUESTREO:
+            _argumentos(paso, PASOS_REMUESTREO[nombre][0])
+        elif nombre in PASOS_FILTROS:
+            filtros.operacion(nombre, **paso) # comprueba sigma y radio
+        elif nombre in PASOS_NIVELES:
+            if paso.get('modo', niveles.MODOS[0]) not in niveles.MODOS:
+                raise ValueError(f"Modo desconocido en el paso {nombre}: {paso['modo']}")
+        elif nombre == 'fusion_images':
+            composicion.validar_capas(_argumentos(paso, ('capas',))[0])
+            if paso.get('mezcla', 'capas') not in composicion.MEZCLAS:
+                raise ValueError(f"Mezcla desconocida en el paso fusion_images: {paso['mezcla']}")
+        elif nombre != 'rotate':
+            raise ValueError(f"Operación desconocida en la receta: {nombre}")
+        elif 'angulo' not in paso:
+            raise ValueError("Faltan parámetros en el paso rotate: angulo")
+        elif paso.get('interpolacion', 'bilinear') not in rotacion.INTERPOLACIONES:
+            raise ValueError(f"Interpolación desconocida en el paso rotate: {paso['interpolacion']}")
+        elif not isinstance(paso.get('expandir', True), bool):
+            raise ValueError(f"expandir debe ser true o false en el paso rotate: {paso['expandir']!r}")
+        if 'filtro' in paso and paso['filtro'] not in remuestreo.FILTROS:
+            raise ValueError(f"Filtro desconocido en el paso {nombre}: {paso['filtro']}")
+        valores = {parametro: _validar_numero(nombre, parametro, paso[parametro], *rango)
+                   for parametro, rango in RANGOS_PASOS.get(nombre, {}).items() if parametro in paso}
+        if nombre == 'crop' and not (valores['xIni'] < valores['xFin'] and valores['yIni'] < valores['yFin']):
+            raise ValueError("El paso crop necesita xIni < xFin e yIni < yFin.")
+        if nombre == 'auto_levels' and not valores.get('bajo', 0.5) < valores.get('alto', 99.5):
+            raise ValueError("El paso auto_levels necesita bajo < alto.")
+        normalizados.append(dict(paso, **valores))
+    return normalizados
+
+def operaciones_receta(pasos):
+    """
+    Traduce una receta como
+        [{'op': 'luminosity'}, {'op': 'bright', 'brillo': 0.1}, {'op': 'binarize', 'umbral': 0.5}]
+    a operaciones de bloques. La receta se arma como una ImagenDiferida, así
+    que los pasos puntuales se fusionan y los recortes se adelantan.
+
+    El paso fusion_images compone capas sobre el resultado de los pasos
+    anteriores: {'op': 'fusion_images', 'capas': [{'imagen': ruta, 'peso': 0.5,
+    'modo': 'screen', 'mascara': ruta}], 'mezcla': 'capas'} (ver composicion).
+    """
+    imagen = diferida.ImagenDiferida(None)
+    for paso in validar_receta(pasos):
+        nombre = paso['op']
+        if nombre in PASOS_PUNTUALES:
+            argumentos = _argumentos(paso, PASOS_PUNTUALES[nombre])
+        elif nombre in PASOS_TONALES:
+            argumentos = _argumentos(paso, PASOS_TONALES[nombre])
+        elif nombre in PASOS_GEOMETRICOS:
+            argumentos = [int(valor) for valor in _argumentos(paso, PASOS_GEOMETRICOS[nombre])]
+        elif nombre in PASOS_REMUESTREO:
+            nombres, filtro = PASOS_REMUESTREO[nombre]
+            tipo = int if nombre == 'resize' else float
+            argumentos = [tipo(valor) for valor in _argumentos(paso, nombres)] + [paso.get('filtro', filtro)]
+        elif nombre in PASOS_FILTROS:
+            argumentos = [paso.get(argumento, defecto) for argumento, defecto in PASOS_FILTROS[nombre]]
+        elif nombre in PASOS_NIVELES:
+            argumentos = [paso.get(argumento, defecto) for argumento, defecto in PASOS_NIVELES[nombre]]
+        elif nombre == 'fusion_images':
+            argumentos = [paso['capas'], paso.get('mezcla', 'capas'), paso.get('peso_base', 1.0),
+                          paso.get('filtro', 'bilinear')]
+        else: # rotate
+            argumentos = [float(paso['angulo']), paso.get('interpolacion', 'bilinear'), paso.get('expandir', True)]
+        imagen = getattr(imagen, nombre)(*argumentos)
+    return imagen.operaciones()
+
+def construir_operaciones(parametros):
+    """
+    Devuelve la lista de operaciones de bloques descrita por parametros.
+    """
+    operacion = parametros.get('operacion')
+    if operacion == 'receta':
+        return operaciones_receta(parametros['pasos'])
+    if operacion == 'layer':
+        return [operacion_capa(parametros.get('capa'), parametros.get('canal'), parametros.get('tipo_grises'))]
+    if operacion == 'curva':
+        return [bloques.Curva(imgPro8.ToneCurve.from_steps(parametros['pasos']))]
+    if operacion == 'rotar':
+        return [bloques.Global(rotacion.rotate, float(parametros['angulo']),
+                               parametros.get('interpolacion', 'bilinear'), parametros.get('expandir', True))]
+    if operacion == 'auto_niveles':
+        return [bloques.Global(niveles.auto_levels, float(parametros.get('bajo', 0.5)),
+                               float(parametros.get('alto', 99.5)), parametros.get('modo', 'canales'))]
+    if operacion == 'ecualizar':
+        return [bloques.Global(niveles.equalize, parametros.get('modo', 'luminancia'))]
+    if operacion == 'clahe':
+        return [bloques.Global(niveles.clahe, int(parametros.get('mosaicos', 8)), float(parametros.get('limite', 2.0)))]
+    if operacion == 'filtro':
+        return [filtros.operacion(parametros['filtro'], **parametros)]
+    if operacion == 'componer':
+        return [composicion.Composicion(parametros['capas'], parametros.get('mezcla', 'capas'),
+                                        float(parametros.get('peso_base', 1.0)), parametros.get('filtro', 'bilinear'))]
+    raise ValueError(f"Operación desconocida: {operacion}")
+
+def imagen_entrada(ruta, parametros, abrir=decodificadas.decodificar):
+    """
+    Imagen de entrada de la operación: si es una receta que empieza con
+    resize, el nivel más pequeño de la pirámide del original (ver ingesta)
+    que le basta; si no, abrir(ruta).
+    """
+    pasos = parametros.get('pasos') if parametros.get('operacion') == 'receta' else None
+    if pasos and pasos[0].get('op') == 'resize':
+        alto, ancho = int(pasos[0]['alto']), int(pasos[0]['ancho'])
+        reducida = ingesta.nivel(ruta, lambda forma: forma[0] >= MARGEN_PIRAMIDE * alto
+                                 and forma[1] >= MARGEN_PIRAMIDE * ancho)
+        if reducida is not None:
+            return reducida
+    return abrir(ruta)
+
+def codificar(fuente, operaciones, archivo, megapixeles_bandas, salida=None, cronometro=None, hilos=1):
+    """
+    Ejecuta la cadena de operaciones sobre la imagen (arreglo o PIL) y escribe
+    el resultado en archivo con la política de salida (PNG por defecto). Las
+    imágenes de al menos megapixeles_bandas se procesan y codifican por bandas
+    sin materializar el resultado en memoria cuando el formato lo permite.
+    Con hilos > 1 las cadenas por bloques reparten sus bandas entre hilos
+    hilos (ver bloques.py).
+
+    cronometro (un previa.Cronometro, opcional) marca las etapas 'proceso' y
+    'codificacion', o 'bandas' si van intercaladas.
+    """
+    formato, opciones = politica_salida.opciones(salida)
+    alto, ancho = bloques.dimensiones(fuente)
+    if alto * ancho >= megapixeles_bandas * 1_000_000:
+        bloques.guardar(fuente, operaciones, archivo, formato, hilos=hilos, **opciones)
+        if cronometro is not None:
+            cronometro.marcar('bandas')
+        return
+    if hilos > 1 and bloques.es_por_bloques(operaciones):
+        nueva = bloques.ensamblar(fuente, operaciones, hilos=hilos)
+    else:
+        nueva = bloques.procesar_completa(fuente, operaciones)
+    if cronometro is not None:
+        cronometro.marcar('proceso')
+    bloques.guardar_arreglo(nueva, archivo, formato, **opciones) # codifica la imagen procesada dentro del archivo
+    if cronometro is not None:
+        cronometro.marcar('codificacion')
+
+# Cola por la que cada proceso del pool de trabajos avisa de que empieza uno
+# (ver iniciar_proceso y app_editor/trabajos.py)
+_avisos = None
+
+def iniciar_proceso(avisos):
+    """
+    Inicializador de los procesos del pool de trabajos: avisos es la cola
+    donde procesar_trabajo anuncia cada trabajo que empieza.
+    """
+    global _avisos
+    _avisos = avisos
+
+def procesar_trabajo(identificador, *args, **kwargs):
+    """
+    procesar_archivo(*args, **kwargs), anunciando antes identificador en la
+    cola de iniciar_proceso (si la hay).
+    """
+    if _avisos is not None:
+        _avisos.put(identificador)
+    return procesar_archivo(*args, **kwargs)
+
+def procesar_archivo(ruta_origen, parametros, ruta_destino, megapixeles_bandas, crudos=None, hilos=1):
+    """
+    Procesa un archivo completo y escribe el resultado en ruta_destino con
+    la política de parametros['salida'] (PNG si no hay). Con crudos
+    (directorio, bytes) el original se abre desde su copia cruda en ese
+    directorio si la hay (ver crudo.decodificar_en_cache); hilos es como en
+    codificar.
+
+    Solo depende de rutas y parámetros serializables, así que puede ejecutarse
+    en otro proceso (ver app_editor/trabajos.py).
+    """
+    abrir = decodificadas.decodificar
+    if crudos is not None:
+        cache = crudo.cache_proceso(*crudos)
+        abrir = lambda ruta: crudo.decodificar_en_cache(ruta, cache)
+    imagen = imagen_entrada(ruta_origen, parametros, abrir)
+    operaciones = construir_operaciones(parametros)
+    try:
+        with open(ruta_destino, 'wb') as archivo:
+            codificar(imagen, operaciones, archivo, megapixeles_bandas, parametros.get('salida'), hilos=hilos)
+    except Exception:
+        os.remove(ruta_destino) # no dejar un archivo a medias
+        raise
+    return ruta_destino
@@ -0,0 +1,526 @@
+"""
+Procesamiento por bandas de filas para imágenes muy grandes.
+
+En vez de materializar la imagen completa como arreglo (y sus temporales),
+la fuente se lee en bandas horizontales, cada banda pasa por la cadena de
+operaciones y el resultado se entrega a un codificador PNG incremental que
+escribe las filas a medida que llegan. La memoria de trabajo queda
+proporcional al alto de la banda y no al tamaño de la imagen.
+
+Cada operación declara si es local (por_bloques = True) y qué filas de su
+entrada necesita para producir un rango de filas de su salida. Las operaciones
+que no son locales (rotación, ajustes por histograma...) declaran por_bloques = False y la
+cadena completa se ejecuta sobre la imagen entera.
+
+PIL no tiene decodificador incremental para PNG/JPEG, así que una fuente PIL se
+decodifica una vez en su tamaño uint8 y las bandas se recortan de ella; una
+fuente np.ndarray (por ejemplo un np.memmap) se lee banda a banda sin copiarla.
+
+Las bandas son independientes entre sí, así que con hilos > 1 se producen en
+un pool de hilos (NumPy libera el GIL en las operaciones sobre arreglos): la
+primera banda se produce antes de repartir el resto, para que las operaciones
+que preparan algo al aplicar su primera banda (las capas de una composición)
+lo hagan en un solo hilo. ensamblar escribe cada banda en el arreglo de salida
+reservado de antemano y bandas las entrega en orden con como mucho hilos
+bandas por delante del codificador.
+"""
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from . import remuestreo
+
+# Filas por banda por defecto
+ALTO_BANDA = 256
+
+# Tamaño máximo de cada bloque IDAT del PNG generado
+BYTES_IDAT = 1 << 16
+
+FIRMA_PNG = b'\x89PNG\r\n\x1a\n'
+TIPOS_COLOR_PNG = {1: 0, 3: 2, 4: 6} # canales -> tipo de color PNG (gris, RGB, RGBA)
+
+
+class Operacion:
+    """
+    Operación de la cadena. Por defecto es una operación puntual: cada fila de
+    salida depende solo de la misma fila de entrada.
+    """
+    por_bloques = True
+
+    def forma_salida(self, alto, ancho):
+        return alto, ancho
+
+    def filas_origen(self, fila_ini, fila_fin, alto):
+        """
+        Rango de filas de la entrada (de alto filas) necesario para producir
+        las filas [fila_ini, fila_fin) de la salida.
+        """
+        return fila_ini, fila_fin
+
+    def aplicar(self, bloque, fila_ini, fila_fin):
+        """
+        Procesa un bloque con las filas indicadas por filas_origen.
+        """
+        raise NotImplementedError
+
+    def completa(self, img):
+        """
+        Aplica la operación a la imagen entera (camino sin bandas).
+        """
+        alto, ancho = self.forma_salida(*img.shape[:2])
+        ini, fin = self.filas_origen(0, alto, img.shape[0])
+        return self.aplicar(img[ini:fin], 0, alto)
+
+
+class Puntual(Operacion):
+    """
+    Envuelve una función puntual de imgPro8 (capas, negativo, grises, brillo...).
+    """
+
+    def __init__(self, funcion, *args):
+        self.funcion = funcion
+        self.args = args
+
+    def aplicar(self, bloque, fila_ini, fila_fin):
+        resultado = self.funcion(bloque, *self.args)
+        if resultado.dtype == np.bool_: # binarize devuelve una máscara
+            resultado = resultado.astype(np.uint8) * 255
+        return resultado
+
+
+class Curva(Puntual):
+    """
+    Aplica una ToneCurve compilada.
+    """
+
+    def __init__(self, curva):
+        super().__init__(curva.apply)
+
+
+class Recorte(Operacion):
+    """
+    Equivalente por bandas de imgPro.crop (esquina superior izquierda e inferior derecha).
+    """
+
+    def __init__(self, xIni, yIni, xFin, yFin):
+        self.xIni, self.yIni, self.xFin, self.yFin = xIni, yIni, xFin, yFin
+
+    def forma_salida(self, alto, ancho):
+        return len(range(alto)[self.yIni:self.yFin]), len(range(ancho)[self.xIni:self.xFin])
+
+    def filas_origen(self, fila_ini, fila_fin, alto):
+        inicio = range(alto)[self.yIni:self.yFin].start
+        return inicio + fila_ini, inicio + fila_fin
+
+    def aplicar(self, bloque, fila_ini, fila_fin):
+        return bloque[:, self.xIni:self.xFin]
+
+
+class Traslacion(Operacion):
+    """
+    Equivalente por bandas de imgPro.trasnslation; admite desplazamientos negativos.
+    """
+
+    def __init__(self, dx, dy):
+        self.dx, self.dy = dx, dy
+
+    def filas_origen(self, fila_ini, fila_fin, alto):
+        return max(fila_ini - self.dy, 0), min(max(fila_fin - self.dy, 0), alto)
+
+    def aplicar(self, bloque, fila_ini, fila_fin):
+        salida = np.zeros((fila_fin - fila_ini,) + bloque.shape[1:], dtype=bloque.dtype)
+        ancho = bloque.shape[1]
+        destino_ini = max(fila_ini, self.dy) - fila_ini # primera fila de la banda con datos
+        col_ini, col_fin = max(self.dx, 0), min(ancho + self.dx, ancho)
+        if len(bloque) and col_ini < col_fin:
+            salida[destino_ini:destino_ini + len(bloque), col_ini:col_fin] = \
+                bloque[:, col_ini - self.dx:col_fin - self.dx]
+        return salida
+
+
+class Submuestreo(Operacion):
+    """
+    Equivalente por bandas de imgPro.lower_resolution con factor entero:
+    promedia cada bloque de factor x factor píxeles ('box') o toma una de cada
+    factor filas y columnas ('nearest').
+    """
+
+    def __init__(self, factor, filtro='box'):
+        if factor < 1:
+            raise ValueError("El factor de submuestreo debe ser un entero positivo.")
+        if filtro not in ('box', 'nearest'):
+            raise ValueError("El submuestreo por bandas solo admite los filtros 'box' y 'nearest'.")
+        self.factor = factor
+        self.filtro = filtro
+
+    def forma_salida(self, alto, ancho):
+        return len(range(0, alto, self.factor)), len(range(0, ancho, self.factor))
+
+    def filas_origen(self, fila_ini, fila_fin, alto):
+        if fila_fin <= fila_ini:
+            return fila_ini * self.factor, fila_ini * self.factor
+        if self.filtro == 'box':
+            return fila_ini * self.factor, min(fila_fin * self.factor, alto)
+        return fila_ini * self.factor, (fila_fin - 1) * self.factor + 1
+
+    def aplicar(self, bloque, fila_ini, fila_fin):
+        if self.filtro == 'box':
+            return remuestreo.reducir_area(bloque, self.factor)
+        return bloque[::self.factor, ::self.factor]
+
+
+class Redimension(Operacion):
+    """
+    Cambio de tamaño por bandas con remuestreo.resize: a una forma fija
+    (alto, ancho) o escalando por un factor real. Cada banda de salida lee
+    solo las filas de la entrada que cubre el filtro.
+    """
+
+    def __init__(self, filtro='lanczos', escala=None, forma=None):
+        if (escala is None) == (forma is None):
+            raise ValueError("Indique la escala o la forma de salida.")
+        self.filtro = filtro
+        self.escala = escala
+        self.forma = forma
+        self.alto_entrada = None
+
+    def forma_salida(self, alto, ancho):
+        if self.forma is not None:
+            return tuple(self.forma)
+        return remuestreo.tamano_escalado(alto, ancho, self.escala)
+
+    def filas_origen(self, fila_ini, fila_fin, alto):
+        # bandas() consulta filas_origen antes de aplicar cada banda
+        self.alto_entrada = alto
+        salida = self.forma_salida(alto, 1)[0]
+        if salida == alto:
+            return fila_ini, fila_fin
+        return remuestreo.filas_origen(alto, salida, self.filtro, fila_ini, fila_fin)
+
+    def aplicar(self, bloque, fila_ini, fila_fin):
+        # mismo orden de pasadas que remuestreo.resize para que el resultado coincida
+        alto = self.alto_entrada
+        salida, ancho = self.forma_salida(alto, bloque.shape[1])
+        if ancho != bloque.shape[1] and remuestreo.columnas_primero(alto, bloque.shape[1], salida, ancho):
+            bloque = self._columnas(bloque, ancho)
+        if salida != alto:
+            desplazamiento = remuestreo.filas_origen(alto, salida, self.filtro, fila_ini, fila_fin)[0]
+            filas = np.empty((fila_fin - fila_ini,) + bloque.shape[1:], dtype=bloque.dtype)
+            bloque = remuestreo.pasada_filas(bloque, self.filtro, filas, (alto, salida), fila_ini, desplazamiento)
+        if ancho != bloque.shape[1]:
+            bloque = self._columnas(bloque, ancho)
+        return bloque
+
+    def _columnas(self, bloque, ancho):
+        resultado = np.empty((len(bloque), ancho) + bloque.shape[2:], dtype=bloque.dtype)
+        return remuestreo.pasada_columnas(bloque, self.filtro, resultado)
+
+    def completa(self, img):
+        return remuestreo.resize(img, *self.forma_salida(*img.shape[:2]), filtro=self.filtro)
+
+
+class Global(Operacion):
+    """
+    Operación que necesita la imagen completa (no es segura por bandas).
+    """
+    por_bloques = False
+
+    def __init__(self, funcion, *args):
+        self.funcion = funcion
+        self.args = args
+
+    def forma_salida(self, alto, ancho):
+        raise NotImplementedError("Una operación global no conoce su forma de salida por adelantado.")
+
+    def completa(self, img):
+        return self.funcion(img, *self.args)
+
+
+class EscritorPNG:
+    """
+    Codificador PNG incremental: recibe bandas de filas uint8 y las comprime a
+    medida que llegan, sin mantener la imagen completa en memoria.
+
+    Usa el filtro 'Up' (diferencia con la fila anterior) en todas las filas.
+    """
+
+    def __init__(self, archivo, ancho, alto, canales, nivel_compresion=6):
+        self.archivo = archivo
+        self.ancho, self.alto, self.canales = ancho, alto, canales
+        self.compresor = zlib.compressobj(nivel_compresion)
+        self.fila_anterior = np.zeros((ancho * canales,), dtype=np.uint8)
+        self.pendiente = b''
+        archivo.write(FIRMA_PNG)
+        cabecera = struct.pack('>IIBBBBB', ancho, alto, 8, TIPOS_COLOR_PNG[canales], 0, 0, 0)
+        self._bloque(b'IHDR', cabecera)
+
+    def _bloque(self, tipo, datos):
+        self.archivo.write(struct.pack('>I', len(datos)) + tipo + datos)
+        self.archivo.write(struct.pack('>I', zlib.crc32(tipo + datos) & 0xffffffff))
+
+    def _emitir(self, datos, final=False):
+        self.pendiente += datos
+        while len(self.pendiente) >= BYTES_IDAT or (final and self.pendiente):
+            self._bloque(b'IDAT', self.pendiente[:BYTES_IDAT])
+            self.pendiente = self.pendiente[BYTES_IDAT:]
+
+    def escribir(self, filas):
+        filas = np.ascontiguousarray(filas, dtype=np.uint8).reshape(len(filas), -1)
+        anteriores = np.vstack((self.fila_anterior, filas[:-1]))
+        filtradas = np.empty((len(filas), filas.shape[1] + 1), dtype=np.uint8)
+        filtradas[:, 0] = 2 # filtro Up
+        np.subtract(filas, anteriores, out=filtradas[:, 1:]) # módulo 256 por desbordamiento uint8
+        self.fila_anterior = filas[-1].copy()
+        self._emitir(self.compresor.compress(filtradas.tobytes()))
+
+    def cerrar(self):
+        self._emitir(self.compresor.flush(), final=True)
+        self._bloque(b'IEND', b'')
+
+
+class EscritorNPY:
+    """
+    Escribe un .npy uint8 banda a banda: la cabecera de NumPy lleva la forma
+    final, así que los bytes de cada banda van detrás sin comprimir.
+    """
+
+    def __init__(self, archivo, forma):
+        self.archivo = archivo
+        np.lib.format.write_array_header_1_0(archivo, {'descr': '|u1', 'fortran_order': False, 'shape': forma})
+
+    def escribir(self, filas):
+        self.archivo.write(np.ascontiguousarray(filas, dtype=np.uint8).data)
+
+    def cerrar(self):
+        pass
+
+
+def forma_cadena(operaciones, alto, ancho):
+    """
+    Devuelve la lista de formas (alto, ancho) de la entrada de cada operación
+    más la forma final.
+    """
+    formas = [(alto, ancho)]
+    for operacion in operaciones:
+        formas.append(operacion.forma_salida(*formas[-1]))
+    return formas
+
+def es_por_bloques(operaciones):
+    return all(operacion.por_bloques for operacion in operaciones)
+
+def leer_filas(fuente, fila_ini, fila_fin):
+    """
+    Lee un rango de filas de una imagen PIL (como RGB) o de un arreglo.
+    """
+    if isinstance(fuente, np.ndarray):
+        return fuente[fila_ini:fila_fin]
+    if fila_ini == 0 and fila_fin >= fuente.height: # imagen completa, sin copia por crop
+        return np.asarray(fuente if fuente.mode == 'RGB' else fuente.convert('RGB'))
+    banda = fuente.crop((0, fila_ini, fuente.width, fila_fin))
+    if banda.mode != 'RGB':
+        banda = banda.convert('RGB')
+    return np.asarray(banda)
+
+def dimensiones(fuente):
+    if isinstance(fuente, np.ndarray):
+        return fuente.shape[:2]
+    return fuente.height, fuente.width
+
+def producir(fuente, operaciones, fila_ini, fila_fin, formas=None, etapa=None):
+    """
+    Filas [fila_ini, fila_fin) de la salida de la etapa indicada de la cadena
+    (la última por defecto). Cada operación pide a la anterior solo las filas
+    que declara en filas_origen; formas es forma_cadena ya calculada.
+    """
+    if formas is None:
+        formas = forma_cadena(operaciones, *dimensiones(fuente))
+    if etapa is None:
+        etapa = len(operaciones) - 1
+    if etapa < 0:
+        return leer_filas(fuente, fila_ini, fila_fin)
+    operacion = operaciones[etapa]
+    origen_ini, origen_fin = operacion.filas_origen(fila_ini, fila_fin, formas[etapa][0])
+    entrada = producir(fuente, operaciones, origen_ini, origen_fin, formas, etapa - 1)
+    return operacion.aplicar(entrada, fila_ini, fila_fin)
+
+def bandas(fuente, operaciones, alto_banda=ALTO_BANDA, hilos=1):
+    """
+    Genera las bandas de salida de la cadena de operaciones como
+    (fila_ini, arreglo), en orden. Todas las operaciones deben ser por
+    bloques. Con hilos > 1 las bandas siguientes se producen en paralelo
+    mientras se consume la actual.
+    """
+    formas = forma_cadena(operaciones, *dimensiones(fuente))
+    alto_final = formas[-1][0]
+    filas = range(0, alto_final, alto_banda)
+    if hilos <= 1 or len(filas) <= 2:
+        for fila in filas:
+            yield fila, producir(fuente, operaciones, fila, min(fila + alto_banda, alto_final), formas)
+        return
+
+    yield 0, producir(fuente, operaciones, 0, min(alto_banda, alto_final), formas)
+    with ThreadPoolExecutor(hilos, thread_name_prefix='bloques') as pool:
+        pendientes = deque()
+        for fila in filas[1:]:
+            pendientes.append((fila, pool.submit(producir, fuente, operaciones, fila,
+                                                 min(fila + alto_banda, alto_final), formas)))
+            if len(pendientes) > hilos:
+                siguiente, futuro = pendientes.popleft()
+                yield siguiente, futuro.result()
+        while pendientes:
+            siguiente, futuro = pendientes.popleft()
+            yield siguiente, futuro.result()
+
+def repartir(tarea, elementos, hilos=1):
+    """
+    Llama a tarea con cada uno de elementos, repartidos entre hilos hilos.
+    """
+    if hilos > 1 and len(elementos) > 1:
+        with ThreadPoolExecutor(min(hilos, len(elementos)), thread_name_prefix='bloques') as pool:
+            list(pool.map(tarea, elementos))
+    else:
+        for elemento in elementos:
+            tarea(elemento)
+
+def ensamblar(fuente, operaciones, alto_banda=ALTO_BANDA, hilos=1):
+    """
+    Ejecuta una cadena por bloques y copia las bandas en un único arreglo de
+    salida reservado una sola vez. Con hilos > 1 cada hilo escribe sus bandas
+    directamente en ese arreglo.
+    """
+    formas = forma_cadena(operaciones, *dimensiones(fuente))
+    alto, ancho = formas[-1]
+    if alto == 0: # resultado vacío
+        return np.empty((alto, ancho, 3), dtype=np.uint8)
+    primera = producir(fuente, operaciones, 0, min(alto_banda, alto), formas)
+    salida = np.empty((alto, ancho) + primera.shape[2:], dtype=np.uint8)
+    salida[:len(primera)] = primera
+
+    def escribir(fila):
+        salida[fila:fila + alto_banda] = producir(fuente, operaciones, fila, min(fila + alto_banda, alto), formas)
+
+    repartir(escribir, range(alto_banda, alto, alto_banda), hilos)
+    return salida
+
+def por_bandas(funcion, img, *args, hilos=1, alto_banda=ALTO_BANDA):
+    """
+    Aplica funcion(banda, *args), una función puntual de imgPro o imgPro8
+    (cada fila de la salida depende solo de la misma fila de img), por
+    bandas de filas repartidas entre hilos hilos. Cada banda se escribe en un
+    único arreglo de salida del tipo que devuelve funcion, reservado de
+    antemano, así que no hay que concatenar las bandas.
+    """
+    alto = img.shape[0]
+    if alto == 0:
+        return funcion(img, *args)
+    primera = funcion(img[:alto_banda], *args)
+    salida = np.empty((alto,) + primera.shape[1:], dtype=primera.dtype)
+    salida[:len(primera)] = primera
+
+    def escribir(fila):
+        salida[fila:fila + alto_banda] = funcion(img[fila:fila + alto_banda], *args)
+
+    repartir(escribir, range(alto_banda, alto, alto_banda), hilos)
+    return salida
+
+def procesar_completa(fuente, operaciones):
+    """
+    Camino sin bandas: carga la imagen entera y aplica la cadena.
+    """
+    img = leer_filas(fuente, 0, dimensiones(fuente)[0])
+    for operacion in operaciones:
+        img = operacion.completa(img)
+    if img.dtype == np.bool_:
+        img = img.astype(np.uint8) * 255
+    return img
+
+def guardar(fuente, operaciones, archivo, formato='PNG', alto_banda=ALTO_BANDA, hilos=1, **opciones):
+    """
+    Ejecuta la cadena de operaciones sobre la fuente y codifica el resultado
+    en archivo (un objeto con write). opciones se pasan al codificador
+    (compress_level para PNG, quality para JPEG/WebP). Las bandas se
+    producen en hilos hilos.
+
+    Con PNG o NPY y una cadena por bloques la salida se escribe banda a banda.
+    Con otros formatos (el codificador de PIL necesita la imagen completa) o
+    con operaciones globales las bandas se copian en un único arreglo de
+    salida uint8 que luego se codifica.
+    """
+    if not es_por_bloques(operaciones):
+        guardar_arreglo(procesar_completa(fuente, operaciones), archivo, formato, **opciones)
+        return
+    if formato.upper() not in ('PNG', 'NPY'):
+        guardar_arreglo(ensamblar(fuente, operaciones, alto_banda, hilos), archivo, formato, **opciones)
+        return
+
+    alto, ancho = forma_cadena(operaciones, *dimensiones(fuente))[-1]
+    escritor = None
+    for fila, banda in bandas(fuente, operaciones, alto_banda, hilos):
+        if escritor is None:
+            escritor = _escritor(archivo, formato, alto, ancho, banda, opciones)
+        escritor.escribir(banda)
+    if escritor is not None:
+        escritor.cerrar()
+
+def trozos(fuente, operaciones, formato='PNG', alto_banda=ALTO_BANDA, hilos=1, **opciones):
+    """
+    Como guardar, pero genera los bytes codificados a medida que se producen,
+    para enviarlos en una respuesta HTTP sin pasar por un archivo. Con PNG o
+    NPY y una cadena por bloques se entrega un trozo por banda.
+    """
+    salida = _Trozos()
+    if formato.upper() not in ('PNG', 'NPY') or not es_por_bloques(operaciones):
+        guardar(fuente, operaciones, salida, formato, alto_banda, hilos, **opciones)
+        yield salida.vaciar()
+        return
+
+    alto, ancho = forma_cadena(operaciones, *dimensiones(fuente))[-1]
+    escritor = None
+    for fila, banda in bandas(fuente, operaciones, alto_banda, hilos):
+        if escritor is None:
+            escritor = _escritor(salida, formato, alto, ancho, banda, opciones)
+        escritor.escribir(banda)
+        datos = salida.vaciar()
+        if datos:
+            yield datos
+    if escritor is not None:
+        escritor.cerrar()
+        yield salida.vaciar()
+
+def _escritor(archivo, formato, alto, ancho, banda, opciones):
+    if formato.upper() == 'NPY':
+        return EscritorNPY(archivo, (alto, ancho) + banda.shape[2:])
+    canales = banda.shape[2] if banda.ndim == 3 else 1
+    return EscritorPNG(archivo, ancho, alto, canales, opciones.get('compress_level', 6))
+
+
+class _Trozos:
+    """
+    Archivo en memoria que entrega lo escrito desde la última vez.
+    """
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def guardar_arreglo(img, archivo, formato='PNG', **opciones):
+    """
+    Codifica una imagen completa en archivo.
+    """
+    if formato.upper() == 'NPY':
+        np.lib.format.write_array(archivo, np.ascontiguousarray(img, dtype=np.uint8))
+        return
+    Image.fromarray(img).save(archivo, format=formato, **opciones)
@@ -0,0 +1,182 @@
+"""
+Composición de varias imágenes sobre una base en una sola pasada.
+
+imgPro.fusion_images convierte las dos imágenes a PIL y de vuelta, guarda una
+copia float64 de cada una y las promedia; fusion_images_ecualized solo acepta
+dos imágenes del mismo tamaño y un único factor. Aquí cada capa tiene su peso
+(opacidad), una máscara alfa opcional y un modo de fusión (normal, multiply,
+screen u overlay), y se pueden componer N capas a la vez.
+
+La composición es una operación de bloques: para cada banda de filas de la
+base se leen las mismas filas de cada capa (redimensionada al tamaño de la
+base con bloques.Redimension si hace falta, también por bandas) y se acumulan
+en el sitio sobre un único buffer float32 del tamaño de la banda:
+
+    acumulado += alfa * (fundir(acumulado, capa) - acumulado)
+
+así que la memoria de trabajo es de unas pocas bandas float32, no una copia
+flotante de cada imagen. Con mezcla='promedio' el resultado es la media
+ponderada de la base y las capas (sum w_i x_i / sum w_i, con las máscaras
+como pesos por píxel), que es lo que hace fusion_images con dos imágenes.
+
+Las capas se describen con diccionarios serializables en JSON
+({'imagen': ruta, 'peso': 0.5, 'modo': 'multiply', 'mascara': ruta}) y se
+abren la primera vez que se necesitan, así que la operación se puede
+reconstruir en otro proceso a partir de los parámetros.
+"""
+import numpy as np
+
+from . import bloques
+from . import decodificadas
+from . import histograma
+from . import remuestreo
+
+MODOS = ('normal', 'multiply', 'screen', 'overlay')
+MEZCLAS = ('capas', 'promedio')
+
+
+def validar_capas(capas):
+    """
+    Comprueba la lista de capas y la devuelve normalizada (peso float, modo y
+    máscara presentes). Lanza ValueError si no es válida.
+    """
+    if not isinstance(capas, list) or not capas:
+        raise ValueError("La composición necesita una lista no vacía de capas.")
+    normalizadas = []
+    for capa in capas:
+        if not isinstance(capa, dict) or 'imagen' not in capa:
+            raise ValueError(f"Capa inválida: {capa!r}")
+        modo = capa.get('modo', 'normal')
+        if modo not in MODOS:
+            raise ValueError(f"Modo de fusión desconocido: {modo}. Opciones: {', '.join(MODOS)}")
+        peso = float(capa.get('peso', 1.0))
+        if not np.isfinite(peso) or peso < 0:
+            raise ValueError(f"El peso de una capa debe ser un número finito no negativo: {peso}")
+        normalizadas.append(dict(capa, peso=peso, modo=modo, mascara=capa.get('mascara')))
+    return normalizadas
+
+
+def fundir(modo, base, capa, auxiliar):
+    """
+    Escribe en capa el resultado del modo de fusión entre base y capa (float32
+    en [0, 1], misma forma). auxiliar es un buffer de trabajo de esa forma.
+    """
+    if modo == 'multiply':
+        capa *= base
+    elif modo == 'screen': # 1 - (1 - a)(1 - b) = a + b - ab
+        np.multiply(base, capa, out=auxiliar)
+        capa += base
+        capa -= auxiliar
+    elif modo == 'overlay': # 2ab en las sombras de la base, screen doble en las luces
+        np.multiply(base, capa, out=auxiliar)
+        capa += base
+        capa -= auxiliar
+        capa *= 2
+        capa -= 1
+        auxiliar *= 2
+        np.copyto(capa, auxiliar, where=base < 0.5)
+    return capa
+
+
+class Composicion(bloques.Operacion):
+    """
+    Compone capas sobre la imagen que llega por la cadena, banda a banda.
+
+    Cada capa se ajusta al tamaño de la base con el filtro indicado. Las
+    máscaras se leen como luminancia (0 transparente, 255 opaca). La salida
+    conserva la forma de la base; un canal alfa de la base no se modifica.
+    """
+
+    def __init__(self, capas, mezcla='capas', peso_base=1.0, filtro='bilinear', abrir=decodificadas.decodificar):
+        if mezcla not in MEZCLAS:
+            raise ValueError(f"Mezcla desconocida: {mezcla}. Opciones: {', '.join(MEZCLAS)}")
+        if filtro not in remuestreo.FILTROS:
+            raise ValueError(f"Filtro desconocido: {filtro}")
+        self.capas = validar_capas(capas)
+        self.mezcla = mezcla
+        self.peso_base = float(peso_base)
+        self.filtro = filtro
+        self.abrir = abrir
+        self.alto = None
+        self.fuentes = None # (imagen, mascara) por capa, abiertas al aplicar la primera banda
+        self.cadenas = None # (imagen, ajuste, mascara, ajuste) para la forma de la base
+        self.forma = None
+
+    def filas_origen(self, fila_ini, fila_fin, alto):
+        # bandas() consulta filas_origen antes de aplicar cada banda
+        self.alto = alto
+        return fila_ini, fila_fin
+
+    def _ajuste(self, fuente, alto, ancho):
+        if bloques.dimensiones(fuente) == (alto, ancho):
+            return []
+        return [bloques.Redimension(self.filtro, forma=(alto, ancho))]
+
+    def _preparar(self, alto, ancho):
+        if self.forma == (alto, ancho):
+            return
+        if self.fuentes is None:
+            self.fuentes = [(self.abrir(capa['imagen']),
+                             None if capa['mascara'] is None else self.abrir(capa['mascara']))
+                            for capa in self.capas]
+        self.cadenas = [(imagen, self._ajuste(imagen, alto, ancho),
+                         mascara, self._ajuste(mascara, alto, ancho) if mascara is not None else None)
+                        for imagen, mascara in self.fuentes]
+        self.forma = (alto, ancho)
+
+    def aplicar(self, bloque, fila_ini, fila_fin):
+        self._preparar(self.alto, bloque.shape[1])
+        color = 1 if bloque.ndim == 2 else min(bloque.shape[2], 3)
+        base = bloque[:, :, np.newaxis] if bloque.ndim == 2 else bloque[:, :, :color]
+        forma = base.shape
+        acumulado = np.multiply(base, 1 / 255, dtype=np.float32)
+        capa_f = np.empty(forma, dtype=np.float32)
+        auxiliar = np.empty(forma, dtype=np.float32) if self.mezcla == 'capas' else None
+        promedio = self.mezcla == 'promedio'
+        if promedio:
+            acumulado *= self.peso_base
+            total = np.full(forma[:2] + (1,), self.peso_base, dtype=np.float32)
+
+        for capa, (imagen, cadena, mascara, cadena_mascara) in zip(self.capas, self.cadenas):
+            filas = bloques.producir(imagen, cadena, fila_ini, fila_fin)
+            filas = filas[:, :, np.newaxis] if filas.ndim == 2 else filas[:, :, :3]
+            np.multiply(filas if filas.shape[2] == color else filas[:, :, :1], 1 / 255, out=capa_f)
+            alfa = np.float32(capa['peso'])
+            if mascara is not None:
+                filas_mascara = bloques.producir(mascara, cadena_mascara, fila_ini, fila_fin)
+                if filas_mascara.ndim == 3:
+                    filas_mascara = histograma.luminancia(filas_mascara)
+                alfa = np.multiply(filas_mascara[:, :, np.newaxis], alfa / 255, dtype=np.float32)
+            if promedio:
+                capa_f *= alfa
+                acumulado += capa_f
+                total += alfa
+            else:
+                fundir(capa['modo'], acumulado, capa_f, auxiliar)
+                capa_f -= acumulado
+                capa_f *= alfa
+                acumulado += capa_f
+
+        if promedio:
+            np.maximum(total, np.float32(1e-6), out=total) # píxeles con peso total cero quedan en negro
+            acumulado /= total
+        acumulado *= 255
+        np.rint(acumulado, out=acumulado)
+        np.clip(acumulado, 0, 255, out=acumulado)
+        salida = np.array(bloque, dtype=np.uint8) # copia; conserva el alfa de la base
+        if salida.ndim == 2:
+            salida[:] = acumulado[:, :, 0]
+        else:
+            salida[:, :, :color] = acumulado
+        return salida
+
+
+def compose(img, capas, mezcla='capas', peso_base=1.0, filtro='bilinear', abrir=decodificadas.decodificar):
+    """
+    Compone capas sobre img (arreglo uint8 o PIL) y devuelve el resultado
+    uint8. Las capas pueden traer en 'imagen' y 'mascara' rutas o arreglos
+    ya abiertos.
+    """
+    def abrir_capa(imagen):
+        return imagen if isinstance(imagen, np.ndarray) else abrir(imagen)
+    return bloques.ensamblar(img, [Composicion(capas, mezcla, peso_base, filtro, abrir_capa)])
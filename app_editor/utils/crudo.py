@@ -0,0 +1,200 @@
+"""
+Formato crudo interno para imágenes intermedias.
+
+Un archivo crudo es una cabecera fija de DESPLAZAMIENTO bytes seguida de los
+píxeles uint8 sin comprimir, así que abrirlo es leer la cabecera y mapear el
+resto con np.memmap: no se decodifica nada y el arreglo que se entrega es una
+vista de solo lectura sobre la caché de páginas del sistema, compartida por
+todos los procesos que abren el mismo archivo. Los datos empiezan en un
+límite de página para que el mapeo no necesite copias.
+
+Los píxeles van por filas (alto, ancho, canales), que es como los recorre
+bloques.py, o por teselas de tesela_alto x tesela_ancho guardadas una tras
+otra (las del borde se rellenan con ceros), para leer una región sin tocar
+las filas enteras.
+
+Cabecera (little endian): MAGIA, versión, canales (0 si el arreglo no tiene
+eje de canales), alto, ancho, tesela_alto y tesela_ancho (0 si va por filas).
+
+La caché de decodificadas guarda aquí una copia cruda de cada imagen que
+decodifica (ver decodificar_en_cache), de modo que la siguiente vez que
+cualquier proceso necesita esa imagen la abre en microsegundos en vez de
+volver a descomprimir el PNG o el JPEG. Los puntos de control del historial
+y los niveles de la pirámide de cada subida también se guardan en este
+formato.
+"""
+import hashlib
+import math
+import os
+import struct
+import threading
+
+import numpy as np
+
+from . import decodificadas
+from . import resultados
+
+MAGIA = b'IMGCRUDO'
+VERSION = 1
+CABECERA = struct.Struct('<8sHHIIII')
+# Los píxeles empiezan en la primera página después de la cabecera
+DESPLAZAMIENTO = 4096
+EXTENSION = '.raw'
+
+# Bytes por escritura al guardar un arreglo que no es contiguo
+BYTES_ESCRITURA = 16 << 20
+
+
+def escribir(archivo, arr, tesela=None):
+    """
+    Escribe arr (uint8, (alto, ancho) o (alto, ancho, canales)) en archivo
+    (abierto en binario). Con tesela (lado o (alto, ancho)) los píxeles se
+    guardan por teselas.
+    """
+    arr = np.asarray(arr)
+    if arr.dtype != np.uint8 or arr.ndim not in (2, 3):
+        raise ValueError(f"Se esperaba un arreglo uint8 de 2 o 3 dimensiones, no {arr.dtype} {arr.shape}")
+    alto, ancho = arr.shape[:2]
+    canales = arr.shape[2] if arr.ndim == 3 else 0
+    tesela_alto, tesela_ancho = (tesela, tesela) if isinstance(tesela, int) else (tesela or (0, 0))
+    archivo.write(CABECERA.pack(MAGIA, VERSION, canales, alto, ancho, tesela_alto, tesela_ancho)
+                  .ljust(DESPLAZAMIENTO, b'\0'))
+    if not tesela_alto:
+        filas = max(1, BYTES_ESCRITURA // max(1, arr[:1].nbytes))
+        for inicio in range(0, alto, filas):
+            archivo.write(np.ascontiguousarray(arr[inicio:inicio + filas]).data) # sin copia si ya es contiguo
+        return
+    columnas = math.ceil(ancho / tesela_ancho)
+    for inicio in range(0, alto, tesela_alto):
+        banda = np.zeros((tesela_alto, columnas * tesela_ancho) + arr.shape[2:], dtype=np.uint8)
+        trozo = arr[inicio:inicio + tesela_alto]
+        banda[:trozo.shape[0], :ancho] = trozo
+        banda = banda.reshape((tesela_alto, columnas, tesela_ancho) + arr.shape[2:]).swapaxes(0, 1)
+        archivo.write(np.ascontiguousarray(banda).data)
+
+def cabecera(ruta):
+    """
+    (alto, ancho, canales, (tesela_alto, tesela_ancho)) del archivo crudo en
+    ruta; canales es 0 si no tiene eje de canales y la tesela (0, 0) si va
+    por filas. Lanza ValueError si no es un archivo crudo.
+    """
+    with open(ruta, 'rb') as archivo:
+        datos = archivo.read(CABECERA.size)
+    if len(datos) < CABECERA.size or datos[:len(MAGIA)] != MAGIA:
+        raise ValueError(f"{ruta} no es un archivo crudo.")
+    _, version, canales, alto, ancho, tesela_alto, tesela_ancho = CABECERA.unpack(datos)
+    if version != VERSION:
+        raise ValueError(f"Versión de archivo crudo no soportada: {version}")
+    return alto, ancho, canales, (tesela_alto, tesela_ancho)
+
+def _mapear(ruta, forma):
+    mapa = np.memmap(ruta, dtype=np.uint8, mode='r', offset=DESPLAZAMIENTO, shape=forma)
+    return np.asarray(mapa) # ndarray de solo lectura sobre el mapeo, sin copia
+
+def teselas(ruta):
+    """
+    Vista (filas de teselas, columnas de teselas, tesela_alto, tesela_ancho[,
+    canales]) sin copia de un archivo crudo por teselas.
+    """
+    alto, ancho, canales, (tesela_alto, tesela_ancho) = cabecera(ruta)
+    if not tesela_alto:
+        raise ValueError(f"{ruta} no está guardado por teselas.")
+    forma = (math.ceil(alto / tesela_alto), math.ceil(ancho / tesela_ancho), tesela_alto, tesela_ancho)
+    return _mapear(ruta, forma + ((canales,) if canales else ()))
+
+def region(ruta, y0, y1, x0, x1):
+    """
+    Píxeles [y0:y1, x0:x1] de un archivo crudo. Si va por filas es una vista
+    sin copia; si va por teselas solo se leen las teselas que tocan la región.
+    """
+    alto, ancho, canales, (tesela_alto, tesela_ancho) = cabecera(ruta)
+    y0, y1, _ = slice(y0, y1).indices(alto)
+    x0, x1, _ = slice(x0, x1).indices(ancho)
+    if not tesela_alto:
+        return abrir(ruta)[y0:y1, x0:x1]
+    mapa = teselas(ruta)
+    salida = np.empty((max(y1 - y0, 0), max(x1 - x0, 0)) + ((canales,) if canales else ()), dtype=np.uint8)
+    for fila in range(y0 // tesela_alto, math.ceil(y1 / tesela_alto)):
+        for columna in range(x0 // tesela_ancho, math.ceil(x1 / tesela_ancho)):
+            arriba, izquierda = fila * tesela_alto, columna * tesela_ancho
+            ty0, ty1 = max(y0, arriba), min(y1, arriba + tesela_alto)
+            tx0, tx1 = max(x0, izquierda), min(x1, izquierda + tesela_ancho)
+            salida[ty0 - y0:ty1 - y0, tx0 - x0:tx1 - x0] = \
+                mapa[fila, columna, ty0 - arriba:ty1 - arriba, tx0 - izquierda:tx1 - izquierda]
+    salida.setflags(write=False)
+    return salida
+
+def abrir(ruta):
+    """
+    Imagen de un archivo crudo como arreglo uint8 de solo lectura. Si va por
+    filas es una vista de np.memmap (no se lee nada hasta que se accede a los
+    píxeles); si va por teselas se reensambla en memoria.
+    """
+    alto, ancho, canales, tesela = cabecera(ruta)
+    if tesela[0]:
+        return region(ruta, 0, alto, 0, ancho)
+    return _mapear(ruta, (alto, ancho) + ((canales,) if canales else ()))
+
+
+def firma(ruta):
+    """
+    Clave de la copia cruda del archivo en ruta: ruta, fecha de modificación
+    y tamaño (como CacheDecodificadas), sin leer el contenido.
+    """
+    info = os.stat(ruta)
+    return hashlib.sha256(f'{os.path.abspath(ruta)}\0{info.st_mtime_ns}\0{info.st_size}'.encode()).hexdigest()
+
+_caches = {}
+
+def cache_proceso(directorio, bytes_disco):
+    """
+    CacheResultados de copias crudas del proceso para directorio, creada al
+    primer uso (sin nivel en memoria: las páginas ya las guarda el sistema).
+    """
+    clave = (directorio, bytes_disco)
+    if clave not in _caches:
+        _caches[clave] = resultados.CacheResultados(directorio, bytes_disco, 0, (EXTENSION,))
+    return _caches[clave]
+
+_pendientes = set() # claves con la copia cruda encargada a un ejecutor y aún sin escribir
+_candado = threading.Lock()
+
+def decodificar_en_cache(ruta, cache, decodificar=decodificadas.decodificar, ejecutor=None):
+    """
+    Imagen de ruta como uint8 de solo lectura: desde su copia cruda en cache
+    (una CacheResultados con EXTENSION) si la hay, o decodificada con
+    decodificar y guardada en cache para la próxima vez. Con ejecutor (un
+    concurrent.futures.Executor) la copia se escribe en él y la imagen se
+    devuelve sin esperarla; una misma clave no se encarga dos veces a la vez.
+    """
+    clave = firma(ruta)
+    if cache.buscar(clave, EXTENSION) is not None:
+        try:
+            return abrir(cache.ruta(clave, EXTENSION))
+        except (FileNotFoundError, ValueError): # desalojada entretanto o de otra versión del formato
+            pass
+    arr = decodificar(ruta)
+    if ejecutor is None:
+        _guardar_copia(cache, clave, arr)
+        return arr
+    with _candado:
+        if clave in _pendientes:
+            return arr
+        _pendientes.add(clave)
+    try:
+        ejecutor.submit(_guardar_pendiente, cache, clave, arr)
+    except RuntimeError: # ejecutor cerrado: la próxima vez se vuelve a intentar
+        with _candado:
+            _pendientes.discard(clave)
+    return arr
+
+def _guardar_copia(cache, clave, arr):
+    with cache.escribir(clave, EXTENSION) as archivo:
+        escribir(archivo, arr)
+
+def _guardar_pendiente(cache, clave, arr):
+    try:
+        _guardar_copia(cache, clave, arr)
+    finally:
+        with _candado:
+            _pendientes.discard(clave)
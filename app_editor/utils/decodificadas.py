@@ -0,0 +1,91 @@
+"""
+Caché en memoria de imágenes decodificadas.
+
+Una sesión de edición suele aplicar muchas acciones seguidas sobre la misma
+imagen original; en vez de abrir, decodificar y convertir a RGB el archivo en
+cada petición, el arreglo uint8 decodificado se guarda por proceso con clave
+(ruta, fecha de modificación, tamaño), así que si el archivo cambia en disco
+la entrada deja de coincidir.
+
+Los arreglos se entregan como solo lectura: las funciones de imgPro/imgPro8
+que intenten modificarlos fallan en vez de corromper la caché.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+def decodificar(ruta):
+    """
+    Abre una imagen y la devuelve como arreglo uint8 RGB de solo lectura.
+    """
+    with Image.open(ruta) as img:
+        arr = np.asarray(img if img.mode == 'RGB' else img.convert('RGB'))
+    arr.setflags(write=False)
+    return arr
+
+
+class CacheDecodificadas:
+    """
+    Caché LRU de arreglos decodificados con presupuesto en bytes.
+
+    decodificador(ruta) produce el arreglo de cada archivo; por defecto es
+    decodificar, pero puede derivar otra cosa del original (por ejemplo la
+    versión reducida de la vista previa).
+    """
+
+    def __init__(self, bytes_maximos, decodificador=decodificar):
+        self.bytes_maximos = bytes_maximos
+        self.decodificador = decodificador
+        self.entradas = OrderedDict() # ruta -> (firma, arreglo)
+        self.ocupado = 0
+        self.contadores = {'aciertos': 0, 'fallos': 0, 'desalojos': 0}
+        self.candado = threading.Lock()
+
+    def obtener(self, ruta):
+        """
+        Devuelve la imagen de ruta decodificada (uint8 RGB, solo lectura),
+        decodificándola solo si no está en caché o cambió en disco.
+        """
+        info = os.stat(ruta)
+        firma = (info.st_mtime_ns, info.st_size)
+        with self.candado:
+            entrada = self.entradas.get(ruta)
+            if entrada is not None and entrada[0] == firma:
+                self.entradas.move_to_end(ruta)
+                self.contadores['aciertos'] += 1
+                return entrada[1]
+            self.contadores['fallos'] += 1
+
+        arr = self.decodificador(ruta)
+        if arr.nbytes <= self.bytes_maximos:
+            self._guardar(ruta, firma, arr)
+        return arr
+
+    def _guardar(self, ruta, firma, arr):
+        with self.candado:
+            anterior = self.entradas.pop(ruta, None)
+            if anterior is not None:
+                self.ocupado -= anterior[1].nbytes
+            self.entradas[ruta] = (firma, arr)
+            self.ocupado += arr.nbytes
+            while self.ocupado > self.bytes_maximos:
+                _, (_, expulsado) = self.entradas.popitem(last=False)
+                self.ocupado -= expulsado.nbytes
+                self.contadores['desalojos'] += 1
+
+    def invalidar(self, ruta):
+        with self.candado:
+            entrada = self.entradas.pop(ruta, None)
+            if entrada is not None:
+                self.ocupado -= entrada[1].nbytes
+
+    def estadisticas(self):
+        with self.candado:
+            datos = dict(self.contadores)
+            datos.update({'entradas': len(self.entradas), 'bytes': self.ocupado,
+                          'presupuesto': self.bytes_maximos})
+        return datos
@@ -0,0 +1,291 @@
+"""
+Evaluación diferida de una cadena de ediciones.
+
+Cada función de imgPro devuelve una copia completa de la imagen, así que
+encadenar k operaciones cuesta k copias del tamaño de la imagen. ImagenDiferida
+expone las mismas operaciones pero solo anota los pasos: nada se ejecuta hasta
+pedir el resultado con evaluar() o guardar(). Al compilar la cadena:
+
+- los recortes y submuestreos se adelantan por delante de las operaciones
+  puntuales (y se combinan entre sí), así que solo se procesan los píxeles que
+  sobreviven; los submuestreos que promedian ('box') y los cambios de tamaño
+  no conmutan con las curvas y solo dejan pasar recortes
+- los pasos tonales consecutivos se fusionan en una sola ToneCurve y los pasos
+  puntuales consecutivos en una sola operación de bloques, que procesa cada
+  banda de la imagen de principio a fin mientras está en caché
+- dentro de una operación fusionada, las curvas se aplican en el sitio sobre
+  el buffer que produjo el paso anterior cuando ese buffer es propio (nunca
+  sobre la imagen fuente)
+
+Los nodos son inmutables: cada operación devuelve una ImagenDiferida nueva que
+comparte los pasos anteriores, así que de una misma edición pueden salir
+varias ramas sin recalcular ni copiar nada hasta evaluarlas.
+"""
+import numpy as np
+from PIL import Image
+
+from . import bloques
+from . import composicion
+from . import filtros
+from . import imgPro8
+from . import niveles
+from . import rotacion
+
+PUNTUAL, TONO, RECORTE, SUBMUESTREO, REDIMENSION, TRASLACION, COMPOSICION, FILTRO, GLOBAL = (
+    'puntual', 'tono', 'recorte', 'submuestreo', 'redimension', 'traslacion', 'composicion', 'filtro', 'global')
+
+
+class Fusionada(bloques.Operacion):
+    """
+    Varias operaciones puntuales aplicadas una tras otra sobre el mismo bloque.
+    """
+
+    def __init__(self):
+        self.funciones = [] # (funcion, args, admite_out)
+
+    def agregar(self, funcion, args=(), admite_out=False):
+        self.funciones.append((funcion, args, admite_out))
+
+    def aplicar(self, bloque, fila_ini, fila_fin):
+        actual = bloque
+        for funcion, args, admite_out in self.funciones:
+            if admite_out and _es_propio(actual, bloque):
+                actual = funcion(actual, *args, out=actual)
+            else:
+                actual = funcion(actual, *args)
+            if actual.dtype == np.bool_: # binarize devuelve una máscara
+                actual = actual.astype(np.uint8) * 255
+        return actual
+
+
+def _es_propio(arreglo, entrada):
+    """
+    Un buffer se puede reutilizar si lo reservó un paso anterior de la cadena
+    (no es la entrada ni una vista de otro arreglo) y se puede escribir.
+    """
+    return arreglo is not entrada and arreglo.flags.owndata and arreglo.flags.writeable
+
+
+class ImagenDiferida:
+    """
+    Expresión de imagen que se evalúa solo al pedir el resultado.
+
+    fuente es un arreglo uint8 (por ejemplo de decodificadas) o una imagen
+    PIL; puede ser None si solo se quieren las operaciones compiladas.
+    """
+
+    def __init__(self, fuente, pasos=()):
+        self.fuente = fuente
+        self.pasos = tuple(pasos)
+
+    @classmethod
+    def abrir(cls, ruta):
+        # Image.open solo lee la cabecera; los píxeles se decodifican al evaluar
+        return cls(Image.open(ruta))
+
+    def _con(self, *paso):
+        return ImagenDiferida(self.fuente, self.pasos + (paso,))
+
+    # operaciones puntuales
+    def extract_layer_rgb(self, capa):
+        return self._con(PUNTUAL, imgPro8.extract_layer_rgb, (capa,))
+
+    def extract_layer_cmy(self, capa):
+        return self._con(PUNTUAL, imgPro8.extract_layer_cmy, (capa,))
+
+    def average(self):
+        return self._con(PUNTUAL, imgPro8.average, ())
+
+    def luminosity(self):
+        return self._con(PUNTUAL, imgPro8.luminosity, ())
+
+    def midgray(self):
+        return self._con(PUNTUAL, imgPro8.midgray, ())
+
+    def binarize(self, umbral):
+        return self._con(PUNTUAL, imgPro8.binarize, (umbral,))
+
+    # operaciones tonales (se compilan en una ToneCurve)
+    def bright(self, brillo):
+        return self._con(TONO, 'bright', (brillo,))
+
+    def bright_layer(self, brillo, capa):
+        return self._con(TONO, 'bright_layer', (brillo, capa))
+
+    def contrast_dark(self, contraste):
+        return self._con(TONO, 'contrast_dark', (contraste,))
+
+    def contrast_light(self, contraste):
+        return self._con(TONO, 'contrast_light', (contraste,))
+
+    def reverse(self):
+        return self._con(TONO, 'reverse', ())
+
+    # operaciones geométricas
+    def crop(self, xIni, yIni, xFin, yFin):
+        return self._con(RECORTE, (xIni, yIni, xFin, yFin))
+
+    def lower_resolution(self, factor, filtro='box'):
+        if float(factor).is_integer() and filtro in ('box', 'nearest'):
+            return self._con(SUBMUESTREO, int(factor), filtro)
+        return self._con(REDIMENSION, filtro, 1 / factor, None)
+
+    def zoom(self, factor, filtro='bilinear'):
+        return self._con(REDIMENSION, filtro, factor, None)
+
+    def resize(self, alto, ancho, filtro='lanczos'):
+        return self._con(REDIMENSION, filtro, None, (alto, ancho))
+
+    def trasnslation(self, dx, dy):
+        return self._con(TRASLACION, (dx, dy))
+
+    def rotate(self, angulo, interpolacion='bilinear', expandir=True):
+        return self._con(GLOBAL, rotacion.rotate, (angulo, interpolacion, expandir))
+
+    # composición de varias imágenes (por bandas, hace de barrera)
+    def fusion_images(self, capas, mezcla='capas', peso_base=1.0, filtro='bilinear'):
+        return self._con(COMPOSICION, composicion.validar_capas(capas), mezcla, float(peso_base), filtro)
+
+    # filtros espaciales (por bandas solapadas, hacen de barrera)
+    def gaussian_blur(self, sigma=2.0):
+        return self._con(FILTRO, 'gaussian_blur', (float(sigma),))
+
+    def unsharp_mask(self, sigma=2.0, cantidad=1.0, umbral=0):
+        return self._con(FILTRO, 'unsharp_mask', (float(sigma), float(cantidad), float(umbral)))
+
+    def box_blur(self, radio=2):
+        return self._con(FILTRO, 'box_blur', (int(radio),))
+
+    def sobel(self):
+        return self._con(FILTRO, 'sobel', ())
+
+    def laplacian(self):
+        return self._con(FILTRO, 'laplacian', ())
+
+    def median(self, radio=1):
+        return self._con(FILTRO, 'median', (int(radio),))
+
+    # ajustes por histograma (necesitan la imagen completa)
+    def auto_levels(self, bajo=0.5, alto=99.5, modo='canales'):
+        return self._con(GLOBAL, niveles.auto_levels, (float(bajo), float(alto), modo))
+
+    def equalize(self, modo='luminancia'):
+        return self._con(GLOBAL, niveles.equalize, (modo,))
+
+    def clahe(self, mosaicos=8, limite=2.0):
+        return self._con(GLOBAL, niveles.clahe, (int(mosaicos), float(limite)))
+
+    def operaciones(self):
+        """
+        Compila los pasos en la lista optimizada de operaciones de bloques.
+        """
+        return compilar(optimizar(self.pasos))
+
+    def evaluar(self, alto_banda=bloques.ALTO_BANDA):
+        """
+        Ejecuta la cadena y devuelve el resultado como arreglo uint8.
+        """
+        operaciones = self.operaciones()
+        if bloques.es_por_bloques(operaciones):
+            return bloques.ensamblar(self.fuente, operaciones, alto_banda)
+        return bloques.procesar_completa(self.fuente, operaciones)
+
+    def guardar(self, archivo, formato='PNG', alto_banda=bloques.ALTO_BANDA):
+        """
+        Ejecuta la cadena y codifica el resultado en archivo, por bandas si
+        todas las operaciones lo permiten.
+        """
+        bloques.guardar(self.fuente, self.operaciones(), archivo, formato, alto_banda)
+
+
+def _recorte_simple(rectangulo):
+    """
+    Solo se mueven recortes con coordenadas enteras no negativas y no vacíos:
+    con índices negativos el resultado depende del tamaño de la imagen.
+    """
+    xIni, yIni, xFin, yFin = rectangulo
+    return all(isinstance(v, int) and v >= 0 for v in rectangulo) and xIni < xFin and yIni < yFin
+
+def _intercambiar(anterior, paso):
+    """
+    Devuelve los pasos equivalentes a anterior seguido de paso con el recorte
+    o submuestreo adelantado (o combinados en uno), o None si no se puede.
+    """
+    if paso[0] == RECORTE and not _recorte_simple(paso[1]):
+        return None
+    if paso[0] == RECORTE and anterior[0] in (PUNTUAL, TONO):
+        return [paso, anterior]
+    if paso[0] == SUBMUESTREO and paso[2] == 'nearest': # promediar no conmuta con las curvas
+        if anterior[0] in (PUNTUAL, TONO):
+            return [paso, anterior]
+        if anterior[0] == SUBMUESTREO and anterior[2] == 'nearest':
+            return [(SUBMUESTREO, anterior[1] * paso[1], 'nearest')]
+    if paso[0] == RECORTE and anterior[0] == SUBMUESTREO:
+        xIni, yIni, xFin, yFin = paso[1]
+        factor = anterior[1]
+        if anterior[2] == 'box': # bloques completos de factor x factor
+            return [(RECORTE, (xIni * factor, yIni * factor, xFin * factor, yFin * factor)), anterior]
+        return [(RECORTE, (xIni * factor, yIni * factor, (xFin - 1) * factor + 1, (yFin - 1) * factor + 1)), anterior]
+    if paso[0] == RECORTE and anterior[0] == RECORTE and _recorte_simple(anterior[1]):
+        (ax, ay, axf, ayf), (bx, by, bxf, byf) = anterior[1], paso[1]
+        return [(RECORTE, (ax + bx, ay + by, min(axf, ax + bxf), min(ayf, ay + byf)))]
+    return None
+
+def optimizar(pasos):
+    """
+    Adelanta recortes y submuestreos todo lo posible y combina los
+    consecutivos. Las operaciones puntuales son independientes por píxel, así
+    que conmutan con los recortes y con el submuestreo 'nearest'; traslaciones,
+    cambios de tamaño, composiciones, filtros y operaciones globales hacen de
+    barrera.
+    """
+    pasos = list(pasos)
+    cambio = True
+    while cambio:
+        cambio = False
+        for i in range(1, len(pasos)):
+            reemplazo = _intercambiar(pasos[i - 1], pasos[i])
+            if reemplazo is not None:
+                pasos[i - 1:i + 1] = reemplazo
+                cambio = True
+                break
+    return pasos
+
+def compilar(pasos):
+    """
+    Traduce los pasos a operaciones de bloques, fusionando las puntuales
+    consecutivas en una Fusionada y las tonales consecutivas en una ToneCurve.
+    """
+    operaciones = []
+    fusionada = curva = None
+    for paso in pasos:
+        tipo = paso[0]
+        if tipo in (PUNTUAL, TONO):
+            if fusionada is None:
+                fusionada = Fusionada()
+                operaciones.append(fusionada)
+            if tipo == TONO:
+                if curva is None:
+                    curva = imgPro8.ToneCurve()
+                    fusionada.agregar(curva.apply, admite_out=True)
+                getattr(curva, paso[1])(*paso[2])
+            else:
+                curva = None
+                fusionada.agregar(paso[1], paso[2])
+            continue
+        fusionada = curva = None
+        if tipo == RECORTE:
+            operaciones.append(bloques.Recorte(*paso[1]))
+        elif tipo == SUBMUESTREO:
+            operaciones.append(bloques.Submuestreo(paso[1], paso[2]))
+        elif tipo == REDIMENSION:
+            operaciones.append(bloques.Redimension(*paso[1:]))
+        elif tipo == TRASLACION:
+            operaciones.append(bloques.Traslacion(*paso[1]))
+        elif tipo == COMPOSICION:
+            operaciones.append(composicion.Composicion(*paso[1:]))
+        elif tipo == FILTRO:
+            operaciones.append(filtros.Filtro(paso[1], *paso[2]))
+        else:
+            operaciones.append(bloques.Global(paso[1], *paso[2]))
+    return operaciones
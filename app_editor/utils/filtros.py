@@ -0,0 +1,294 @@
+"""
+Filtros espaciales para imágenes uint8: desenfoque gaussiano, máscara de
+enfoque (unsharp), desenfoque de caja, bordes de Sobel y Laplaciano y mediana.
+
+Cada filtro es una bloques.Operacion que declara un halo de radio filas: la
+banda de salida [fila_ini, fila_fin) lee las filas [fila_ini - radio,
+fila_fin + radio) de la entrada, así que las imágenes grandes se procesan en
+bandas solapadas, tanto en las cadenas de bloques como en filtrar(), que
+reparte las bandas entre un pool de hilos con bloques.ensamblar (NumPy
+libera el GIL en las operaciones sobre arreglos) y escribe cada una en un
+único arreglo de salida reservado de antemano. Los bordes de la imagen se extienden replicando la
+última fila o columna.
+
+- gaussian_blur y unsharp_mask: dos pasadas separables (filas y columnas) en
+  float32, sumando pares de desplazamientos simétricos del núcleo; el coste
+  crece con el radio (3 sigma) pero cada paso es una operación vectorizada.
+- box_blur: sumas acumuladas por filas y por columnas (la imagen integral
+  separada en sus dos ejes) en enteros, así que el coste no depende del radio
+  y el resultado es exacto.
+- sobel y laplacian: sobre la luminancia, con la magnitud saturada a 255 y
+  devuelta en tres canales grises como imgPro8.luminosity.
+- median: ventana deslizante (sliding_window_view) y np.partition por
+  trozos de filas cuyo alto se ajusta para que las ventanas copiadas no
+  pasen de ELEMENTOS_MEDIANA, sea cual sea el alto de la banda que llega.
+"""
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from . import bloques
+from . import histograma
+
+# Filas por banda al filtrar una imagen completa
+FILAS_BLOQUE = 128
+
+# Elementos máximos de las ventanas de cada trozo de filas de la mediana (se
+# copian al ordenarlas)
+ELEMENTOS_MEDIANA = 1 << 23
+
+# Radio máximo de la mediana: el coste por píxel crece con (2 radio + 1)^2
+RADIO_MEDIANA_MAXIMO = 7
+
+# sigma máxima del gaussiano y de la máscara de enfoque (radio 3 sigma) y
+# radio máximo del desenfoque de caja: el halo de cada banda, el relleno y el
+# núcleo crecen con el radio
+SIGMA_MAXIMO = 50
+RADIO_CAJA_MAXIMO = 150
+
+# Filtro -> parámetros opcionales con su valor por defecto
+PARAMETROS = {
+    'gaussian_blur': (('sigma', 2.0),),
+    'unsharp_mask': (('sigma', 2.0), ('cantidad', 1.0), ('umbral', 0)),
+    'box_blur': (('radio', 2),),
+    'sobel': (),
+    'laplacian': (),
+    'median': (('radio', 1),),
+}
+
+
+@lru_cache(maxsize=64)
+def nucleo_gaussiano(sigma):
+    """
+    Pesos float32 del núcleo gaussiano 1D de radio ceil(3 sigma), normalizados.
+    """
+    if sigma <= 0:
+        raise ValueError("sigma debe ser positivo.")
+    radio = max(1, int(np.ceil(3 * sigma)))
+    x = np.arange(-radio, radio + 1, dtype=np.float64)
+    pesos = np.exp(-x * x / (2 * sigma * sigma))
+    return (pesos / pesos.sum()).astype(np.float32)
+
+def _convolucion(relleno, pesos, eje):
+    """
+    Convolución 'valida' de relleno (float32) con un núcleo simétrico a lo
+    largo de eje (0 filas, 1 columnas).
+    """
+    radio = len(pesos) // 2
+    largo = relleno.shape[eje] - 2 * radio
+
+    def tramo(inicio):
+        return relleno[inicio:inicio + largo] if eje == 0 else relleno[:, inicio:inicio + largo]
+
+    salida = np.multiply(tramo(radio), pesos[radio])
+    auxiliar = np.empty_like(salida)
+    for k in range(radio):
+        np.add(tramo(k), tramo(2 * radio - k), out=auxiliar) # pesos[k] == pesos[2 * radio - k]
+        auxiliar *= pesos[k]
+        salida += auxiliar
+    return salida
+
+def _gaussiano(relleno, sigma):
+    pesos = nucleo_gaussiano(sigma)
+    flotante = relleno.astype(np.float32)
+    return _convolucion(_convolucion(flotante, pesos, 0), pesos, 1)
+
+def _a_uint8(flotante):
+    np.rint(flotante, out=flotante)
+    np.clip(flotante, 0, 255, out=flotante)
+    return flotante.astype(np.uint8)
+
+def _gaussian_blur(relleno, sigma):
+    return _a_uint8(_gaussiano(relleno, sigma))
+
+def _unsharp_mask(relleno, sigma, cantidad, umbral):
+    radio = len(nucleo_gaussiano(sigma)) // 2
+    original = relleno[radio:-radio, radio:-radio].astype(np.float32)
+    desenfocada = _gaussiano(relleno, sigma)
+    detalle = np.subtract(original, desenfocada, out=desenfocada)
+    if umbral > 0: # solo se realzan las diferencias de más de umbral niveles
+        detalle[np.abs(detalle) <= umbral] = 0
+    detalle *= cantidad
+    detalle += original
+    return _a_uint8(detalle)
+
+def _suma_ventana(relleno, ventana, eje):
+    """
+    Suma de cada ventana de largo ventana a lo largo de eje, como diferencia
+    de sumas acumuladas: el coste es el mismo para cualquier radio.
+    """
+    forma = list(relleno.shape)
+    forma[eje] += 1
+    acumulado = np.zeros(forma, dtype=np.uint32)
+    np.cumsum(relleno, axis=eje, dtype=np.uint32, out=acumulado[1:] if eje == 0 else acumulado[:, 1:])
+    if eje == 0:
+        return acumulado[ventana:] - acumulado[:-ventana]
+    return acumulado[:, ventana:] - acumulado[:, :-ventana]
+
+def _box_blur(relleno, radio):
+    ventana = 2 * radio + 1
+    suma = _suma_ventana(_suma_ventana(relleno, ventana, 0), ventana, 1)
+    area = ventana * ventana
+    suma += area // 2 # redondeo al entero más cercano
+    suma //= area
+    return suma.astype(np.uint8)
+
+def _gris(relleno):
+    if relleno.ndim == 2:
+        return relleno.astype(np.float32)
+    if relleno.shape[2] < 3:
+        return relleno[:, :, 0].astype(np.float32)
+    return histograma.luminancia(relleno).astype(np.float32)
+
+def _como_entrada(gris, relleno):
+    gris = _a_uint8(gris)
+    if relleno.ndim == 2:
+        return gris
+    return np.stack((gris, gris, gris), axis=-1)
+
+def _sobel(relleno):
+    gris = _gris(relleno)
+    suavizado_x = gris[:, :-2] + 2 * gris[:, 1:-1] + gris[:, 2:] # [1 2 1] por filas
+    suavizado_y = gris[:-2] + 2 * gris[1:-1] + gris[2:]
+    gy = suavizado_x[2:] - suavizado_x[:-2]
+    gx = suavizado_y[:, 2:] - suavizado_y[:, :-2]
+    return _como_entrada(np.hypot(gx, gy, out=gx), relleno)
+
+def _laplacian(relleno):
+    gris = _gris(relleno)
+    centro = gris[1:-1, 1:-1]
+    suma = gris[:-2, 1:-1] + gris[2:, 1:-1]
+    suma += gris[1:-1, :-2]
+    suma += gris[1:-1, 2:]
+    suma -= 4 * centro
+    return _como_entrada(np.abs(suma, out=suma), relleno)
+
+def _median(relleno, radio):
+    ventana = 2 * radio + 1
+    mitad = ventana * ventana // 2
+    vista = sliding_window_view(relleno, (ventana, ventana), axis=(0, 1))
+    salida = np.empty(vista.shape[:-2], dtype=relleno.dtype)
+    # reshape copia las ventanas: se ordenan por trozos de filas acotados
+    elementos_fila = max(1, salida[:1].size * ventana * ventana)
+    filas = max(1, ELEMENTOS_MEDIANA // elementos_fila)
+    for fila in range(0, len(salida), filas):
+        ventanas = vista[fila:fila + filas]
+        ventanas = ventanas.reshape(ventanas.shape[:-2] + (ventana * ventana,))
+        salida[fila:fila + filas] = np.partition(ventanas, mitad, axis=-1)[..., mitad]
+    return salida
+
+_FUNCIONES = {
+    'gaussian_blur': _gaussian_blur,
+    'unsharp_mask': _unsharp_mask,
+    'box_blur': _box_blur,
+    'sobel': _sobel,
+    'laplacian': _laplacian,
+    'median': _median,
+}
+
+
+class Filtro(bloques.Operacion):
+    """
+    Filtro espacial por bandas solapadas. Cada banda llega con hasta radio
+    filas de más por arriba y por abajo; el resto del halo (en los bordes de
+    la imagen y a los lados) se completa replicando los bordes.
+    """
+
+    def __init__(self, nombre, *args):
+        if nombre not in _FUNCIONES:
+            raise ValueError(f"Filtro desconocido: {nombre}. Opciones: {', '.join(_FUNCIONES)}")
+        try:
+            finitos = all(np.isfinite(float(arg)) for arg in args)
+        except (TypeError, ValueError):
+            finitos = False
+        if not finitos:
+            raise ValueError(f"Los parámetros del filtro {nombre} deben ser números finitos.")
+        self.nombre = nombre
+        self.args = args
+        self.funcion = _FUNCIONES[nombre]
+        if nombre in ('gaussian_blur', 'unsharp_mask'):
+            if float(args[0]) > SIGMA_MAXIMO:
+                raise ValueError(f"sigma no puede pasar de {SIGMA_MAXIMO}.")
+            self.radio = len(nucleo_gaussiano(float(args[0]))) // 2
+        elif nombre in ('box_blur', 'median'):
+            maximo = RADIO_MEDIANA_MAXIMO if nombre == 'median' else RADIO_CAJA_MAXIMO
+            if not 1 <= int(args[0]) <= maximo:
+                raise ValueError(f"El radio del filtro {nombre} debe ser un entero entre 1 y {maximo}.")
+            self.radio = int(args[0])
+            self.args = (self.radio,)
+        else:
+            self.radio = 1
+
+    def filas_origen(self, fila_ini, fila_fin, alto):
+        return max(fila_ini - self.radio, 0), min(fila_fin + self.radio, alto)
+
+    def aplicar(self, bloque, fila_ini, fila_fin):
+        if bloque.dtype == np.bool_:
+            bloque = bloque.astype(np.uint8) * 255
+        if bloque.dtype != np.uint8:
+            raise ValueError(f"Los filtros son para imágenes uint8, no {bloque.dtype}.")
+        arriba = self.radio - min(self.radio, fila_ini) # filas del halo que faltan en el borde superior
+        abajo = self.radio - (len(bloque) - min(self.radio, fila_ini) - (fila_fin - fila_ini))
+        bordes = ((arriba, abajo), (self.radio, self.radio)) + ((0, 0),) * (bloque.ndim - 2)
+        return self.funcion(np.pad(bloque, bordes, mode='edge'), *self.args)
+
+
+def operacion(nombre, **parametros):
+    """
+    Filtro de bloques con los parámetros de PARAMETROS (los que falten toman
+    su valor por defecto).
+    """
+    if nombre not in PARAMETROS:
+        raise ValueError(f"Filtro desconocido: {nombre}. Opciones: {', '.join(PARAMETROS)}")
+    try:
+        valores = [float(parametros.get(clave, defecto)) for clave, defecto in PARAMETROS[nombre]]
+    except (TypeError, ValueError):
+        raise ValueError(f"Los parámetros del filtro {nombre} deben ser números finitos.")
+    return Filtro(nombre, *valores)
+
+def filtrar(img, filtro, hilos=1, alto_banda=FILAS_BLOQUE):
+    """
+    Aplica un Filtro a la imagen completa por bandas solapadas, repartidas
+    entre hilos hilos, y devuelve un arreglo uint8 nuevo.
+    """
+    if img.shape[0] == 0:
+        return filtro.aplicar(img, 0, 0)
+    return bloques.ensamblar(img, [filtro], alto_banda, hilos)
+
+def gaussian_blur(img, sigma=2.0, hilos=1):
+    """
+    Desenfoque gaussiano separable de desviación sigma (en píxeles).
+    """
+    return filtrar(img, Filtro('gaussian_blur', float(sigma)), hilos)
+
+def unsharp_mask(img, sigma=2.0, cantidad=1.0, umbral=0, hilos=1):
+    """
+    Enfoque por máscara de desenfoque: img + cantidad * (img - gaussiano),
+    solo donde la diferencia supera umbral niveles.
+    """
+    return filtrar(img, Filtro('unsharp_mask', float(sigma), float(cantidad), float(umbral)), hilos)
+
+def box_blur(img, radio=2, hilos=1):
+    """
+    Promedio de la ventana de (2 radio + 1)^2 píxeles, con coste independiente del radio.
+    """
+    return filtrar(img, Filtro('box_blur', radio), hilos)
+
+def sobel(img, hilos=1):
+    """
+    Magnitud del gradiente de Sobel de la luminancia.
+    """
+    return filtrar(img, Filtro('sobel'), hilos)
+
+def laplacian(img, hilos=1):
+    """
+    Valor absoluto del Laplaciano (4 vecinos) de la luminancia.
+    """
+    return filtrar(img, Filtro('laplacian'), hilos)
+
+def median(img, radio=1, hilos=1):
+    """
+    Filtro de mediana en una ventana de (2 radio + 1)^2 píxeles.
+    """
+    return filtrar(img, Filtro('median', radio), hilos)
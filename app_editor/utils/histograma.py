@@ -0,0 +1,133 @@
+"""
+Histogramas y estadísticas de imágenes uint8.
+
+imgPro.mhist recorre la imagen una vez por nivel (256 pasadas) y dibuja con
+matplotlib; aquí los histogramas de cada canal y de la luminancia salen de una
+sola pasada por la imagen: cada banda de filas se cuenta con np.bincount,
+canal por canal, mientras está en caché. (Contar todos los canales en un solo
+bincount desplazando cada uno 256 niveles resultó más lento, por el arreglo
+de índices de 16 bits que hay que armar.)
+
+La imagen se recorre por bandas de filas y los conteos se acumulan en un
+AcumuladorHistograma, así que la memoria de trabajo no depende del tamaño de la
+imagen; dos acumuladores (por ejemplo de mosaicos procesados en paralelo) se
+pueden combinar. Como el histograma de un uint8 es exacto, mínimo, máximo,
+media, desviación y percentiles se calculan a partir de él sin volver a leer
+los píxeles.
+"""
+import numpy as np
+
+from . import bloques
+from . import imgPro8
+
+NIVELES = 256
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+
+def nombres_canales(img):
+    if img.ndim == 2:
+        return ('gris',)
+    if img.shape[2] == 3:
+        return ('r', 'g', 'b', 'luminancia')
+    return tuple(f'canal_{canal}' for canal in range(img.shape[2]))
+
+def luminancia(img):
+    """
+    Luminancia en punto fijo con los mismos pesos que imgPro8.luminosity.
+    """
+    suma = img[:, :, 0].astype(np.uint32) * imgPro8.PESOS_LUMINOSIDAD[0]
+    suma += img[:, :, 1].astype(np.uint32) * imgPro8.PESOS_LUMINOSIDAD[1]
+    suma += img[:, :, 2].astype(np.uint32) * imgPro8.PESOS_LUMINOSIDAD[2]
+    suma >>= imgPro8.BITS_LUMINOSIDAD
+    return suma.astype(np.uint8) # np.bincount cuenta más rápido sobre uint8
+
+def contar(img):
+    """
+    Histogramas de un bloque uint8: arreglo (canales, 256) con los canales de
+    nombres_canales(img).
+    """
+    if img.dtype != np.uint8:
+        raise ValueError(f"El histograma es para imágenes uint8, no {img.dtype}.")
+    if img.ndim == 2:
+        return np.bincount(img.ravel(), minlength=NIVELES)[np.newaxis]
+    conteos = [np.bincount(img[:, :, canal].ravel(), minlength=NIVELES) for canal in range(img.shape[2])]
+    if len(nombres_canales(img)) > img.shape[2]:
+        conteos.append(np.bincount(luminancia(img).ravel(), minlength=NIVELES))
+    return np.stack(conteos)
+
+class AcumuladorHistograma:
+    """
+    Suma los histogramas de bloques (bandas o mosaicos) de una misma imagen.
+    """
+
+    def __init__(self):
+        self.canales = None
+        self.conteos = None
+
+    def agregar(self, bloque):
+        if bloque.dtype == np.bool_: # máscaras de binarize
+            bloque = bloque.astype(np.uint8) * 255
+        conteos = contar(bloque)
+        if self.conteos is None:
+            self.canales = nombres_canales(bloque)
+            self.conteos = conteos.astype(np.int64)
+        else:
+            self.conteos += conteos
+        return self
+
+    def combinar(self, otro):
+        if otro.conteos is not None:
+            if self.conteos is None:
+                self.canales, self.conteos = otro.canales, otro.conteos.copy()
+            else:
+                self.conteos += otro.conteos
+        return self
+
+    def resultado(self, percentiles=PERCENTILES):
+        """
+        Diccionario serializable en JSON con el histograma y las estadísticas
+        de cada canal.
+        """
+        if self.conteos is None:
+            return {}
+        return {nombre: estadisticas_histograma(conteos, percentiles)
+                for nombre, conteos in zip(self.canales, self.conteos)}
+
+
+def estadisticas_histograma(conteos, percentiles=PERCENTILES):
+    """
+    Estadísticas exactas de un canal a partir de su histograma de 256 niveles.
+    """
+    total = int(conteos.sum())
+    niveles = np.arange(NIVELES)
+    datos = {'histograma': conteos.tolist(), 'pixeles': total}
+    if total == 0:
+        return datos
+    presentes = np.flatnonzero(conteos)
+    media = float(np.dot(conteos, niveles) / total)
+    varianza = float(np.dot(conteos, (niveles - media) ** 2) / total)
+    acumulado = np.cumsum(conteos)
+    datos.update({
+        'min': int(presentes[0]),
+        'max': int(presentes[-1]),
+        'media': round(media, 3),
+        'desviacion': round(varianza ** 0.5, 3),
+        # nivel más bajo que acumula (hasta él inclusive) al menos el p % de los píxeles
+        'percentiles': {str(p): int(np.searchsorted(acumulado, total * p / 100)) for p in percentiles},
+    })
+    return datos
+
+def estadisticas(fuente, operaciones=(), alto_banda=bloques.ALTO_BANDA, percentiles=PERCENTILES):
+    """
+    Histograma y estadísticas de la fuente (arreglo o PIL), o del resultado de
+    aplicarle operaciones, acumulados banda a banda.
+    """
+    acumulador = AcumuladorHistograma()
+    if bloques.es_por_bloques(operaciones):
+        for _, banda in bloques.bandas(fuente, list(operaciones), alto_banda):
+            acumulador.agregar(banda)
+    else:
+        img = bloques.procesar_completa(fuente, list(operaciones))
+        for fila in range(0, img.shape[0], alto_banda):
+            acumulador.agregar(img[fila:fila + alto_banda])
+    return acumulador.resultado(percentiles)
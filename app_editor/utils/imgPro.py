@@ -1,6 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from PIL import Image
+
+from . import remuestreo
 
 def layer(img, capa):
     """
@@ -92,41 +93,33 @@ def image_resize(img1, img2, resize_method, w1, h1, w2, h2):
         target_size = (w1, h1)
     return target_size
     
-def fusion_images(img1, img2, resize_method='resize_to_smaller'):
+def fusion_images(img1, img2, resize_method='resize_to_smaller', filtro='lanczos'):
     """
     Fusiona dos imágenes promediando sus píxeles.
     
     Parámetros:
-    - img1, img2: Las imágenes a fusionar
+    - img1, img2: Las imágenes a fusionar (normalizadas o PIL)
     - resize_method: 'resize_to_smaller', 'resize_to_larger', 'resize_second_to_first'
     - resize_method por defecto es 'resize_to_smaller'
+    - filtro: filtro de remuestreo.resize si los tamaños no coinciden
     """
-    # Convertir a PIL si es necesario
-    if isinstance(img1, np.ndarray):
-        img1_pil = Image.fromarray((img1 * 255).astype(np.uint8))
-    else:
-        img1_pil = img1
-    
-    if isinstance(img2, np.ndarray):
-        img2_pil = Image.fromarray((img2 * 255).astype(np.uint8))
-    else:
-        img2_pil = img2
+    # Convertir PIL a normalizada si es necesario
+    if not isinstance(img1, np.ndarray):
+        img1 = np.asarray(img1) / 255.0
+    if not isinstance(img2, np.ndarray):
+        img2 = np.asarray(img2) / 255.0
     
     # Obtener dimensiones
-    w1, h1 = img1_pil.size
-    w2, h2 = img2_pil.size
+    h1, w1 = img1.shape[:2]
+    h2, w2 = img2.shape[:2]
     
-    # Redimensionar solo si es necesario
+    # Redimensionar solo si es necesario, sin pasar por uint8
     if (w1, h1) != (w2, h2):
-        target_size = image_resize(img1, img2, resize_method, w1, h1, w2, h2)
-        img1_pil = img1_pil.resize(target_size)
-        img2_pil = img2_pil.resize(target_size)
-    
-    # Convertir de vuelta a numpy y fusionar
-    img1_np = np.array(img1_pil) / 255.0
-    img2_np = np.array(img2_pil) / 255.0
+        ancho, alto = image_resize(img1, img2, resize_method, w1, h1, w2, h2)
+        img1 = remuestreo.resize(img1, alto, ancho, filtro)
+        img2 = remuestreo.resize(img2, alto, ancho, filtro)
     
-    return (img1_np + img2_np) / 2
+    return np.clip((img1 + img2) / 2, 0, 1) # Lanczos puede salirse un poco de [0, 1]
 
 def fusion_images_ecualized(img1, img2, factor):
     """
@@ -161,8 +154,9 @@ def midgray(img):
    Convierte una imagen a escala de grises usando el método de gris medio.
    """
    img_copia = np.copy(img)
-   gris = (np.maximum(img_copia[:,:,0], img_copia[:,:,1], img_copia[:,:,2]) +
-              np.minimum(img_copia[:,:,0], img_copia[:,:,1], img_copia[:,:,2]))/2
+   # el tercer argumento de np.maximum/np.minimum es 'out', se encadenan para usar los 3 canales
+   gris = (np.maximum(np.maximum(img_copia[:,:,0], img_copia[:,:,1]), img_copia[:,:,2]) +
+              np.minimum(np.minimum(img_copia[:,:,0], img_copia[:,:,1]), img_copia[:,:,2]))/2
    # print("Promedio de gris 3:", np.mean(gris))  # <--- línea temporal
    return np.stack((gris, gris, gris), axis=-1)
 
@@ -245,16 +239,19 @@ def trasnslation(img, dx, dy):
 
     return trasladada
 
-def lower_resolution(img, zoom_factor):
-    img_copia = np.copy(img)
-    return img_copia[::zoom_factor, ::zoom_factor]
+def lower_resolution(img, zoom_factor, filtro='box'):
+    """
+    Reduce la resolución de una imagen en un factor, promediando cada bloque
+    de zoom_factor x zoom_factor píxeles ('nearest' toma uno de cada
+    zoom_factor como antes, ver remuestreo.lower_resolution).
+    """
+    return remuestreo.lower_resolution(img, zoom_factor, filtro)
 
-# def zoom(img, zoom_factor):
-#     """
-#     Aplica un zoom a una imagen normalizada.
-#     """
-#     img_copia = np.copy(img)
-#     return np.kron(img_copia, np.ones((zoom_factor, zoom_factor, 1)))
+def zoom(img, zoom_factor, filtro='bilinear'):
+    """
+    Aplica un zoom a una imagen normalizada.
+    """
+    return remuestreo.zoom(img, zoom_factor, filtro)
 
 def mhist (RGB, tipo='n', color='gray'):
     """
@@ -271,10 +268,13 @@ def mhist (RGB, tipo='n', color='gray'):
         factor = (filas * columnas) / 100 # para mostrar en porcentaje
     else:
         factor = 1 # para mostrar en conteo
-    histograma = np.zeros(256)
-
-    for nivel in range(256):
-        histograma[nivel] = np.sum(RGB == nivel) / factor
+    # una sola pasada con bincount, contando solo los valores iguales a un
+    # nivel entero 0-255 (lo mismo que comparar RGB == nivel para cada nivel);
+    # para histogramas en el servidor usar utils/histograma.py
+    valores = np.asarray(RGB).ravel()
+    if valores.dtype != np.uint8:
+        valores = valores[(valores >= 0) & (valores <= 255) & (valores == np.floor(valores))].astype(np.intp)
+    histograma = np.bincount(valores, minlength=256) / factor
         
     plt.bar(np.arange(256), histograma, color=color, width=1) 
     plt.title("Histograma")
@@ -288,7 +288,7 @@ def rotarImg(a, ang):
     """
     Rota una imagen en sentido antihorario por un ángulo dado.
     Parámetros:
-    a (numpy.ndarray): Imagen de entrada representada como un arreglo 2D.
+    a (numpy.ndarray): Imagen de entrada representada como un arreglo 2D (o 3D con canales).
     ang (float): Ángulo de rotación en grados. Debe estar en el rango (0, π] radianes.
     Devuelve:
     numpy.ndarray: Imagen rotada con el mismo tipo de datos que la imagen de entrada.
@@ -298,37 +298,34 @@ def rotarImg(a, ang):
     - La función convierte el ángulo de grados a radianes internamente.
     - La imagen de salida tendrá dimensiones ajustadas para contener la imagen rotada.
     - La rotación se realiza en sentido antihorario.
+    - Para ángulos arbitrarios, interpolación o imágenes grandes usar rotacion.rotate.
     """
     ang = np.radians(ang)  # Convertir a radianes
-    m, n = a.shape
+    m, n = a.shape[:2]
     cos_ang = np.cos(ang)
     sin_ang = np.sin(ang)
 
+    # Misma correspondencia de índices que la versión con bucles, evaluada
+    # con mallas de NumPy en vez de recorrer cada píxel en Python
     if ang > 0 and ang <= np.pi / 2:
         c = int(round(m * sin_ang + n * cos_ang)) + 1
         d = int(round(m * cos_ang + n * sin_ang)) + 1
-        b = np.zeros((c, d), dtype=a.dtype)
-        for i in range(c):
-            for j in range(d):
-                iii = i - int(n * sin_ang) - 1
-                ii = int(round(j * sin_ang + iii * cos_ang))
-                jj = int(round(j * cos_ang - iii * sin_ang))
-                if 0 <= ii < m and 0 <= jj < n:
-                    b[i, j] = a[ii, jj]
+        i, j = np.ogrid[:c, :d]
+        iii = i - int(n * sin_ang) - 1
+        jjj = j
     elif ang > np.pi / 2 and ang <= np.pi:
         c = int(round(m * sin_ang - n * cos_ang)) + 1
         d = int(round(m * sin_ang - n * cos_ang)) + 1
-        e = -n * cos_ang
-        b = np.zeros((c, d), dtype=a.dtype)
-        for i in range(c):
-            iii = c - i - 1
-            for j in range(d):
-                jjj = d - j - 1
-                ii = int(round(jjj * sin_ang + iii * cos_ang))
-                jj = int(round(jjj * cos_ang - iii * sin_ang))
-                if 0 <= ii < m and 0 <= jj < n:
-                    b[i, j] = a[ii, jj]
+        i, j = np.ogrid[:c, :d]
+        iii = c - i - 1
+        jjj = d - j - 1
     else:
         raise ValueError("Ángulo fuera del rango esperado (0 < ang <= π)")
 
-    return b
\ No newline at end of file
+    ii = np.rint(jjj * sin_ang + iii * cos_ang).astype(np.intp)
+    jj = np.rint(jjj * cos_ang - iii * sin_ang).astype(np.intp)
+    validos = (0 <= ii) & (ii < m) & (0 <= jj) & (jj < n)
+    b = np.zeros((c, d) + a.shape[2:], dtype=a.dtype)
+    b[validos] = a[ii[validos], jj[validos]]
+
+    return b
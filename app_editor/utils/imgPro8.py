@@ -0,0 +1,319 @@
+"""
+Versión entera (uint8 / uint16) de las operaciones puntuales de imgPro.
+
+Las funciones de imgPro trabajan sobre imágenes normalizadas en float64 [0, 1],
+lo que obliga a las vistas a dividir entre 255, procesar y volver a multiplicar
+por 255 en cada petición (8 veces la memoria de la imagen decodificada).
+Aquí las mismas operaciones trabajan directamente sobre los enteros que entrega
+PIL usando aritmética saturada y tablas de consulta (LUT) precalculadas.
+
+Las tablas se construyen evaluando la función flotante original sobre los
+niveles posibles (256 para uint8, 65536 para uint16), por lo que el resultado
+coincide con el camino flotante (diferencia máxima de 1 nivel).
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from . import imgPro
+
+# Pesos de luminosidad (0.299, 0.587, 0.114) en punto fijo de 16 bits, suman 65536
+PESOS_LUMINOSIDAD = (19595, 38470, 7471)
+BITS_LUMINOSIDAD = 16
+
+# Filas procesadas por bloque al aplicar tablas de consulta
+FILAS_BANDA = 256
+
+# Operaciones que no dependen del tipo de dato y se reutilizan tal cual
+layer = imgPro.layer
+cyan = imgPro.cyan
+magenta = imgPro.magenta
+yellow = imgPro.yellow
+remove_layer = imgPro.remove_layer
+extract_layer_rgb = imgPro.extract_layer_rgb
+trasnslation = imgPro.trasnslation
+lower_resolution = imgPro.lower_resolution
+zoom = imgPro.zoom
+
+
+def maximo(dtype):
+    """
+    Devuelve el valor máximo representable por un tipo entero soportado.
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.uint8, np.uint16):
+        raise ValueError("Solo se soportan imágenes uint8 o uint16.")
+    return np.iinfo(dtype).max
+
+def acumulador(dtype):
+    """
+    Tipo entero suficientemente ancho para sumar canales sin desbordamiento.
+    """
+    return np.uint32 if np.dtype(dtype) == np.uint8 else np.uint64
+
+def a_entero(img, dtype=np.uint8):
+    """
+    Convierte una imagen normalizada [0, 1] a enteros, igual que las vistas
+    (recorte y truncamiento).
+    """
+    return (np.clip(img, 0, 1) * maximo(dtype)).astype(dtype)
+
+def a_flotante(img):
+    """
+    Convierte una imagen entera a flotante normalizado [0, 1].
+    """
+    return img / maximo(img.dtype)
+
+def lut_desde_flotante(funcion, dtype=np.uint8):
+    """
+    Construye una tabla de consulta evaluando una operación flotante de imgPro
+    sobre todos los niveles posibles del tipo entero.
+    """
+    niveles = np.arange(maximo(dtype) + 1) / maximo(dtype)
+    lut = a_entero(funcion(niveles), dtype)
+    lut.setflags(write=False)
+    return lut
+
+def aplicar_lut(img, lut, capa=None, out=None):
+    """
+    Aplica una tabla de consulta a toda la imagen o solo a una capa.
+
+    Si lut es 2D (una tabla por canal) cada canal usa su propia tabla.
+    np.take convierte los índices a intp, así que se recorre la imagen por
+    bandas de FILAS_BANDA filas para no reservar 8 bytes por píxel de golpe.
+
+    out puede ser la propia img para aplicar la tabla en el sitio: cada
+    píxel se lee antes de escribirse, así que no hace falta otro buffer.
+    """
+    if lut.ndim == 2:
+        if out is not None:
+            salida = out
+        else: # los canales sin tabla propia (p. ej. alfa) se conservan
+            salida = np.empty_like(img) if img.shape[2] == lut.shape[0] else np.copy(img)
+        for canal in range(lut.shape[0]):
+            _tomar_por_bandas(lut[canal], img[:, :, canal], salida[:, :, canal])
+        return salida
+    if capa is None:
+        salida = np.empty_like(img) if out is None else out
+        _tomar_por_bandas(lut, img, salida)
+    else:
+        salida = np.copy(img) if out is None else out
+        _tomar_por_bandas(lut, img[:, :, capa], salida[:, :, capa])
+    return salida
+
+def _tomar_por_bandas(lut, origen, destino):
+    # los niveles nunca se salen de la tabla: mode='clip' evita el buffer
+    # intermedio que np.take usa con mode='raise' cuando out es un parámetro
+    for fila in range(0, origen.shape[0], FILAS_BANDA):
+        np.take(lut, origen[fila:fila + FILAS_BANDA], out=destino[fila:fila + FILAS_BANDA], mode='clip')
+
+
+@lru_cache(maxsize=64)
+def lut_bright(brillo, dtype=np.uint8):
+    return lut_desde_flotante(lambda n: imgPro.bright(n, brillo), dtype)
+
+@lru_cache(maxsize=64)
+def lut_contrast_dark(contraste, dtype=np.uint8):
+    return lut_desde_flotante(lambda n: imgPro.contrast_dark(n, contraste), dtype)
+
+@lru_cache(maxsize=64)
+def lut_contrast_light(contraste, dtype=np.uint8):
+    return lut_desde_flotante(lambda n: imgPro.contrast_light(n, contraste), dtype)
+
+
+def reverse(img):
+    """
+    Invierte los colores de una imagen entera.
+    """
+    return maximo(img.dtype) - img
+
+def extract_layer_cmy(img, capa):
+    """
+    Extrae una capa específica (0=Cian, 1=Magenta, 2=Amarillo) de una imagen RGB entera.
+
+    Equivale a convertir a CMY, anular las otras capas y volver a RGB: las capas
+    anuladas quedan al máximo y la capa indicada conserva su valor original.
+    """
+    img_capa = np.full_like(img, maximo(img.dtype))
+    img_capa[:, :, capa] = img[:, :, capa]
+    return img_capa
+
+def average(img):
+    """
+    Convierte una imagen entera a escala de grises usando el método del promedio.
+    """
+    suma = img[:, :, 0].astype(acumulador(img.dtype))
+    suma += img[:, :, 1]
+    suma += img[:, :, 2]
+    suma //= 3
+    gris = suma.astype(img.dtype)
+    return np.stack((gris, gris, gris), axis=-1)
+
+def luminosity(img):
+    """
+    Convierte una imagen entera a escala de grises usando el método de
+    luminosidad con pesos en punto fijo.
+    """
+    tipo = acumulador(img.dtype)
+    suma = img[:, :, 0].astype(tipo) * PESOS_LUMINOSIDAD[0]
+    suma += img[:, :, 1].astype(tipo) * PESOS_LUMINOSIDAD[1]
+    suma += img[:, :, 2].astype(tipo) * PESOS_LUMINOSIDAD[2]
+    suma >>= BITS_LUMINOSIDAD
+    gris = suma.astype(img.dtype)
+    return np.stack((gris, gris, gris), axis=-1)
+
+def midgray(img):
+    """
+    Convierte una imagen entera a escala de grises usando el método de gris medio.
+    """
+    r, g, b = img[:, :, 0], img[:, :, 1], img[:, :, 2]
+    suma = np.maximum(np.maximum(r, g), b).astype(acumulador(img.dtype))
+    suma += np.minimum(np.minimum(r, g), b)
+    suma //= 2
+    gris = suma.astype(img.dtype)
+    return np.stack((gris, gris, gris), axis=-1)
+
+def bright(img, brillo):
+    """
+    Altera el brillo de una imagen entera, con saturación en [0, máximo].
+    """
+    return aplicar_lut(img, lut_bright(float(brillo), img.dtype))
+
+def bright_layer(img, brillo, capa):
+    """
+    Altera el brillo de una capa específica RGB de una imagen entera.
+    """
+    return aplicar_lut(img, lut_bright(float(brillo), img.dtype), capa)
+
+def contrast_dark(img, contraste):
+    """
+    Aplica contraste oscuro (logarítmico) a una imagen entera.
+    """
+    return aplicar_lut(img, lut_contrast_dark(float(contraste), img.dtype))
+
+def contrast_light(img, contraste):
+    """
+    Aplica contraste claro (exponencial) a una imagen entera.
+    """
+    return aplicar_lut(img, lut_contrast_light(float(contraste), img.dtype))
+
+def binarize(img, umbral):
+    """
+    Binariza una imagen entera comparando la suma de canales con el umbral escalado.
+    """
+    suma = img[:, :, 0].astype(acumulador(img.dtype))
+    suma += img[:, :, 1]
+    suma += img[:, :, 2]
+    return suma > umbral * 3 * maximo(img.dtype)
+
+def crop(img, xIni, yIni, xFin, yFin):
+    """
+    Deja una sección rectangular de la imagen sin copiar la imagen completa.
+    """
+    return img[yIni:yFin, xIni:xFin].copy()
+
+
+class ToneCurve:
+    """
+    Curva tonal componible: acumula una secuencia de operaciones puntuales y
+    las compila en una tabla de consulta por canal.
+
+    Aplicar la curva es una sola pasada np.take sobre la imagen, sin importar
+    cuántas operaciones se hayan encadenado:
+
+        curva = ToneCurve().bright(0.1).contrast_dark(1.5).reverse()
+        nueva = curva.apply(arr)
+
+    Cada paso se compone con los anteriores como tabla entera, así que el
+    resultado es idéntico a aplicar las funciones de imgPro8 una tras otra.
+    """
+
+    def __init__(self, dtype=np.uint8, canales=3):
+        self.dtype = np.dtype(dtype)
+        identidad = np.arange(maximo(self.dtype) + 1, dtype=self.dtype)
+        self.tablas = np.tile(identidad, (canales, 1))
+        self.pasos = []
+
+    def _componer(self, lut, capa=None):
+        if capa is None:
+            self.tablas = lut[self.tablas]
+        else:
+            self.tablas[capa] = lut[self.tablas[capa]]
+        return self
+
+    def bright(self, brillo):
+        self.pasos.append(('bright', brillo))
+        return self._componer(lut_bright(float(brillo), self.dtype))
+
+    def bright_layer(self, brillo, capa):
+        self.pasos.append(('bright_layer', brillo, capa))
+        return self._componer(lut_bright(float(brillo), self.dtype), capa)
+
+    def contrast_dark(self, contraste):
+        self.pasos.append(('contrast_dark', contraste))
+        return self._componer(lut_contrast_dark(float(contraste), self.dtype))
+
+    def contrast_light(self, contraste):
+        self.pasos.append(('contrast_light', contraste))
+        return self._componer(lut_contrast_light(float(contraste), self.dtype))
+
+    def reverse(self):
+        self.pasos.append(('reverse',))
+        return self._componer(maximo(self.dtype) - np.arange(maximo(self.dtype) + 1, dtype=self.dtype))
+
+    def binarize(self, umbral):
+        """
+        Umbral por canal: los niveles mayores que umbral pasan al máximo y el
+        resto a 0. A diferencia de imgPro.binarize no promedia los canales, así
+        que solo coincide con ella sobre imágenes en escala de grises.
+        """
+        self.pasos.append(('binarize', umbral))
+        niveles = np.arange(maximo(self.dtype) + 1)
+        lut = np.where(niveles > umbral * maximo(self.dtype), maximo(self.dtype), 0)
+        return self._componer(lut.astype(self.dtype))
+
+    def then(self, otra):
+        """
+        Encadena otra curva después de esta.
+        """
+        self.pasos.extend(otra.pasos)
+        self.tablas = np.take_along_axis(otra.tablas, self.tablas.astype(np.intp), axis=1)
+        return self
+
+    @classmethod
+    def from_steps(cls, pasos, dtype=np.uint8):
+        """
+        Construye una curva a partir de una lista de pasos como
+        [('bright', 0.1), ('contrast_dark', 1.5), ('reverse',)].
+        """
+        curva = cls(dtype)
+        for nombre, *parametros in pasos:
+            if nombre not in PASOS_CURVA:
+                raise ValueError(f"Operación no soportada por ToneCurve: {nombre}")
+            getattr(curva, nombre)(*parametros)
+        return curva
+
+    def is_identity(self):
+        return bool(np.all(self.tablas == np.arange(self.tablas.shape[1])))
+
+    def lut(self):
+        """
+        Devuelve la tabla compilada: 1D si todos los canales comparten curva,
+        2D (una fila por canal) en otro caso.
+        """
+        if np.all(self.tablas == self.tablas[0]):
+            return self.tablas[0]
+        return self.tablas
+
+    def apply(self, img, out=None):
+        """
+        Aplica la curva compilada a una imagen entera en una sola pasada
+        (en el sitio si out es la propia img).
+        """
+        if img.dtype != self.dtype:
+            raise ValueError(f"La curva es para imágenes {self.dtype}, no {img.dtype}.")
+        return aplicar_lut(img, self.lut(), out=out)
+
+
+# Operaciones que ToneCurve puede compilar en una tabla
+PASOS_CURVA = ('bright', 'bright_layer', 'contrast_dark', 'contrast_light', 'reverse', 'binarize')
@@ -0,0 +1,161 @@
+"""
+Validación de las imágenes subidas y pirámide de resoluciones.
+
+Antes de guardar una subida se lee solo su cabecera (Image.open no
+decodifica los píxeles) y se rechaza si PIL no la reconoce o si supera los
+bytes o píxeles permitidos. Así una bomba de descompresión (un PNG pequeño
+que declara cientos de megapíxeles) no llega nunca a decodificarse.
+
+Al subir una imagen se precalcula una pirámide de versiones reducidas
+(1/2, 1/4 y 1/8 por defecto), guardadas en el formato crudo de crudo.py en
+el subdirectorio DIRECTORIO junto al original y abiertas después con mmap. Un
+JPEG se decodifica directamente a la escala del primer nivel con draft (la
+reducción se hace en el dominio DCT, sin decodificar la resolución completa);
+los demás formatos se decodifican una vez y cada nivel sale del anterior con
+Image.reduce (promedio por bloques). La vista previa y las operaciones que
+empiezan reduciendo la imagen leen el nivel más pequeño que les basta en vez
+de decodificar el original.
+"""
+import glob
+import math
+import os
+import tempfile
+import warnings
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from . import crudo
+
+# Subdirectorio junto a cada original donde se guardan sus niveles
+DIRECTORIO = 'piramides'
+
+NIVELES = (2, 4, 8)
+# Los niveles .npy son de antes de que la pirámide se guardara en formato crudo
+EXTENSIONES = (crudo.EXTENSION, '.npy')
+
+
+class ImagenRechazada(ValueError):
+    """
+    La subida no es una imagen o supera los límites de la ingesta.
+    """
+
+
+def inspeccionar(archivo, pixeles_maximos, bytes_maximos=None):
+    """
+    Lee la cabecera de archivo (ruta o archivo abierto, que queda al
+    principio) y devuelve (formato, alto, ancho). Lanza ImagenRechazada si
+    no es una imagen o supera los límites.
+    """
+    if isinstance(archivo, (str, os.PathLike)):
+        tamano = os.path.getsize(archivo)
+    else:
+        tamano = archivo.seek(0, os.SEEK_END)
+        archivo.seek(0)
+    if bytes_maximos is not None and tamano > bytes_maximos:
+        raise ImagenRechazada(f"El archivo ocupa {tamano / 2**20:.1f} MiB; el máximo es "
+                              f"{bytes_maximos / 2**20:.1f} MiB.")
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning) # el límite se comprueba abajo
+            with Image.open(archivo) as img:
+                formato, (ancho, alto) = img.format, img.size
+    except Image.DecompressionBombError as error:
+        raise ImagenRechazada(str(error))
+    except (UnidentifiedImageError, OSError, SyntaxError): # SyntaxError: cabecera corrupta en algunos plugins
+        raise ImagenRechazada("El archivo no es una imagen reconocible.")
+    finally:
+        if not isinstance(archivo, (str, os.PathLike)):
+            archivo.seek(0)
+    if alto * ancho > pixeles_maximos:
+        raise ImagenRechazada(f"La imagen tiene {alto * ancho / 1e6:.1f} MP; el máximo es "
+                              f"{pixeles_maximos / 1e6:.1f} MP.")
+    return formato, alto, ancho
+
+
+def ruta_nivel(ruta, factor):
+    directorio, nombre = os.path.split(ruta)
+    return os.path.join(directorio, DIRECTORIO, f'{nombre}.{factor}{crudo.EXTENSION}')
+
+def construir_piramide(ruta, niveles=NIVELES):
+    """
+    Guarda los niveles de ruta reducidos por cada factor de niveles
+    (crecientes, cada uno múltiplo del anterior) y devuelve sus rutas.
+    """
+    rutas = []
+    with Image.open(ruta) as img:
+        ancho = img.width
+        if img.format == 'JPEG':
+            img.draft('RGB', (math.ceil(img.width / niveles[0]), math.ceil(img.height / niveles[0])))
+        img = img.convert('RGB')
+    escala = round(ancho / img.width) # > 1 si draft ya redujo el JPEG
+    for factor in niveles:
+        if factor > escala:
+            img = img.reduce(factor // escala)
+            escala = factor
+        rutas.append(_guardar(np.asarray(img), ruta_nivel(ruta, factor)))
+    return rutas
+
+def niveles_disponibles(ruta):
+    """
+    {factor: ruta del nivel} de la pirámide de ruta (vacío si no tiene).
+    """
+    patron = os.path.join(os.path.dirname(ruta_nivel(ruta, 1)), glob.escape(os.path.basename(ruta)) + '.*')
+    niveles = {}
+    for nivel in sorted(glob.glob(patron), reverse=True): # a igual factor gana .raw sobre .npy
+        base, extension = os.path.splitext(nivel)
+        factor = base.rsplit('.', 1)[1]
+        if extension in EXTENSIONES and factor.isdigit():
+            niveles[int(factor)] = nivel
+    return niveles
+
+def nivel(ruta, suficiente):
+    """
+    Nivel más reducido de la pirámide de ruta para el que suficiente(forma)
+    es cierto, como arreglo uint8 de solo lectura (mmap), o None.
+    """
+    for _, nivel_ruta in sorted(niveles_disponibles(ruta).items(), reverse=True):
+        arr = _abrir(nivel_ruta)
+        if suficiente(arr.shape):
+            return arr
+    return None
+
+def nivel_divisor(ruta, factor):
+    """
+    (arreglo, n) del nivel de la pirámide de ruta con el mayor factor n que
+    divide a factor, cargado en memoria, o None. Reducir ese nivel por
+    factor // n da el mismo tamaño que reducir el original por factor.
+    """
+    divisores = [n for n in niveles_disponibles(ruta) if factor % n == 0]
+    if not divisores:
+        return None
+    n = max(divisores)
+    return np.array(_abrir(niveles_disponibles(ruta)[n])), n
+
+def dimensiones(ruta):
+    """
+    (alto, ancho) de la imagen de ruta, leídos de la cabecera.
+    """
+    with Image.open(ruta) as img:
+        return img.height, img.width
+
+def borrar_piramide(ruta):
+    patron = os.path.join(os.path.dirname(ruta_nivel(ruta, 1)), glob.escape(os.path.basename(ruta)) + '.*')
+    for nivel_ruta in glob.glob(patron):
+        if os.path.splitext(nivel_ruta)[1] in EXTENSIONES:
+            os.remove(nivel_ruta)
+
+def _abrir(ruta):
+    return np.load(ruta, mmap_mode='r') if ruta.endswith('.npy') else crudo.abrir(ruta)
+
+def _guardar(arr, destino):
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(destino))
+    try:
+        with os.fdopen(descriptor, 'wb') as archivo:
+            crudo.escribir(archivo, arr)
+        os.replace(temporal, destino)
+    except Exception:
+        os.remove(temporal)
+        raise
+    return destino
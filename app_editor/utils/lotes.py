@@ -0,0 +1,83 @@
+"""
+Procesamiento por lotes: aplica la misma receta a muchos archivos en paralelo.
+
+Cada archivo se procesa en un proceso del pool con acciones.procesar_archivo;
+un error en un archivo se informa y no detiene el resto del lote.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import acciones
+from . import salida as politica_salida
+
+EXTENSIONES = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+
+def listar_imagenes(entradas):
+    """
+    Expande directorios y rutas sueltas en la lista de imágenes a procesar.
+    """
+    rutas = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            for nombre in sorted(os.listdir(entrada)):
+                if nombre.lower().endswith(EXTENSIONES):
+                    rutas.append(os.path.join(entrada, nombre))
+        else:
+            rutas.append(entrada)
+    return rutas
+
+def destinos(rutas, directorio_salida, extension):
+    """
+    Ruta de salida de cada ruta en directorio_salida: su nombre sin extensión
+    más extension. Si dos entradas darían el mismo nombre (x.png y x.jpg, o
+    a/x.png y b/x.png) las siguientes llevan un contador (x-2.png, x-3.png...)
+    para que ningún resultado pise a otro. Los nombres se comparan sin
+    distinguir mayúsculas, como en los sistemas de archivos que no lo hacen.
+    """
+    usados = set()
+    salida = []
+    for ruta in rutas:
+        base = os.path.splitext(os.path.basename(ruta))[0]
+        nombre, contador = base + extension, 1
+        while nombre.lower() in usados:
+            contador += 1
+            nombre = f'{base}-{contador}{extension}'
+        usados.add(nombre.lower())
+        salida.append(os.path.join(directorio_salida, nombre))
+    return salida
+
+def procesar_lote(rutas, pasos, directorio_salida, procesos=None, megapixeles_bandas=16, progreso=None,
+                  salida=None):
+    """
+    Aplica la receta pasos a cada ruta y guarda los resultados en
+    directorio_salida con la política de salida (PNG si es None).
+
+    progreso(hechos, total, ruta, error) se llama al terminar cada archivo
+    (error es None si salió bien). Devuelve la lista de (ruta, destino, error).
+    """
+    acciones.validar_receta(pasos) # falla antes de arrancar el pool si la receta es inválida
+    parametros = {'operacion': 'receta', 'pasos': pasos, 'salida': salida}
+    extension = politica_salida.extension(salida)
+    os.makedirs(directorio_salida, exist_ok=True)
+
+    resultados = []
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(procesos, mp_context=contexto) as pool:
+        futuros = {}
+        for ruta, destino in zip(rutas, destinos(rutas, directorio_salida, extension)):
+            futuro = pool.submit(acciones.procesar_archivo, ruta, parametros, destino, megapixeles_bandas)
+            futuros[futuro] = (ruta, destino)
+        for hechos, futuro in enumerate(as_completed(futuros), start=1):
+            ruta, destino = futuros[futuro]
+            try:
+                futuro.result()
+                error = None
+            except Exception as excepcion:
+                error = f'{type(excepcion).__name__}: {excepcion}'
+                destino = None
+            resultados.append((ruta, destino, error))
+            if progreso is not None:
+                progreso(hechos, len(futuros), ruta, error)
+    return resultados
@@ -0,0 +1,154 @@
+"""
+Métricas del camino de edición en formato de texto de Prometheus.
+
+Cada petición medida lleva una Medicion (un previa.Cronometro con la acción)
+que marca el final de cada etapa: subida, caché (clave y búsqueda del
+resultado), decodificación, proceso, codificación y escritura en la caché.
+Con el camino por bandas el proceso y la codificación van intercalados y se
+miden juntos como 'bandas'. Al terminar, la medición se suma a un
+RegistroMetricas por proceso:
+
+- editor_peticiones_total{accion}: peticiones medidas
+- editor_etapa_segundos{accion, etapa}: histograma de la duración de cada etapa
+- editor_pico_memoria_bytes{accion}: histograma del pico de memoria de Python
+  y NumPy durante la petición (tracemalloc; solo con MEMORIA activa, porque
+  rastrear las reservas tiene un coste apreciable y el pico es del proceso,
+  así que incluye peticiones concurrentes)
+- editor_rss_maximo_bytes: RSS máximo del proceso (getrusage), en cada lectura
+
+Solo se mide la fracción MUESTREO de las peticiones; las demás reciben una
+medición inactiva cuyos marcar() no hacen nada, así que el código de las
+vistas no distingue un caso del otro.
+"""
+import bisect
+import random
+import sys
+import threading
+import tracemalloc
+
+from . import previa
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_BYTES = tuple(1 << bits for bits in range(20, 33, 2)) # 1 MiB .. 4 GiB
+
+
+class Medicion(previa.Cronometro):
+    """
+    Cronómetro de una petición con su acción y, opcionalmente, su pico de memoria.
+    """
+
+    def __init__(self, accion, activa=True, memoria=False):
+        super().__init__()
+        self.accion = accion
+        self.activa = activa
+        self.memoria = activa and memoria
+        self.pico_memoria = None
+        if self.memoria:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+    def marcar(self, etapa):
+        if self.activa:
+            super().marcar(etapa)
+
+    def terminar(self):
+        if self.memoria:
+            self.pico_memoria = tracemalloc.get_traced_memory()[1]
+
+
+class Histograma:
+    """
+    Histograma acumulativo con los buckets fijos de Prometheus.
+    """
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.conteos = [0] * (len(limites) + 1) # el último es +Inf
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.conteos[bisect.bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    def lineas(self, nombre, etiquetas):
+        acumulado = 0
+        for limite, conteo in zip(self.limites + ('+Inf',), self.conteos):
+            acumulado += conteo
+            yield f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}'
+        yield f'{nombre}_sum{{{etiquetas}}} {self.suma:.6f}'
+        yield f'{nombre}_count{{{etiquetas}}} {self.total}'
+
+
+def _etiqueta(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RegistroMetricas:
+    """
+    Contadores e histogramas por acción, seguros entre hilos.
+    """
+
+    def __init__(self, muestreo=1.0, memoria=False):
+        self.muestreo = muestreo
+        self.memoria = memoria
+        self.peticiones = {}
+        self.etapas = {} # (accion, etapa) -> Histograma
+        self.picos = {} # accion -> Histograma
+        self.candado = threading.Lock()
+
+    def iniciar(self, accion):
+        """
+        Medición para una petición de accion; inactiva si no entra en el muestreo.
+        """
+        activa = self.muestreo >= 1 or (self.muestreo > 0 and random.random() < self.muestreo)
+        return Medicion(accion or 'ninguna', activa, self.memoria)
+
+    def registrar(self, medicion):
+        if not medicion.activa:
+            return
+        medicion.terminar()
+        with self.candado:
+            self.peticiones[medicion.accion] = self.peticiones.get(medicion.accion, 0) + 1
+            for etapa, ms in medicion.etapas.items():
+                clave = (medicion.accion, etapa)
+                if clave not in self.etapas:
+                    self.etapas[clave] = Histograma(BUCKETS_SEGUNDOS)
+                self.etapas[clave].observar(ms / 1e3)
+            if medicion.pico_memoria is not None:
+                if medicion.accion not in self.picos:
+                    self.picos[medicion.accion] = Histograma(BUCKETS_BYTES)
+                self.picos[medicion.accion].observar(medicion.pico_memoria)
+
+    def texto(self):
+        """
+        Exposición en el formato de texto de Prometheus (versión 0.0.4).
+        """
+        lineas = ['# HELP editor_peticiones_total Peticiones de edición medidas.',
+                  '# TYPE editor_peticiones_total counter']
+        with self.candado:
+            for accion, total in sorted(self.peticiones.items()):
+                lineas.append(f'editor_peticiones_total{{accion="{_etiqueta(accion)}"}} {total}')
+            lineas += ['# HELP editor_etapa_segundos Duración de cada etapa de la petición.',
+                       '# TYPE editor_etapa_segundos histogram']
+            for (accion, etapa), histograma in sorted(self.etapas.items()):
+                lineas += histograma.lineas('editor_etapa_segundos',
+                                            f'accion="{_etiqueta(accion)}",etapa="{_etiqueta(etapa)}"')
+            lineas += ['# HELP editor_pico_memoria_bytes Pico de memoria trazada durante la petición.',
+                       '# TYPE editor_pico_memoria_bytes histogram']
+            for accion, histograma in sorted(self.picos.items()):
+                lineas += histograma.lineas('editor_pico_memoria_bytes', f'accion="{_etiqueta(accion)}"')
+        if resource is not None:
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            rss *= 1 if sys.platform == 'darwin' else 1024 # Linux lo da en KiB
+            lineas += ['# HELP editor_rss_maximo_bytes RSS máximo del proceso.',
+                       '# TYPE editor_rss_maximo_bytes gauge',
+                       f'editor_rss_maximo_bytes {rss}']
+        return '\n'.join(lineas) + '\n'
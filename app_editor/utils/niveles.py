@@ -0,0 +1,207 @@
+"""
+Ajustes automáticos de tono a partir del histograma: auto niveles,
+ecualización global y CLAHE por mosaicos.
+
+Los tres siguen el mismo esquema: una pasada por la imagen para contar
+niveles (np.bincount por bandas de filas, como histograma.contar) y una tabla
+de consulta de 256 entradas por canal que se aplica con imgPro8.aplicar_lut,
+sin aritmética flotante por píxel. CLAHE calcula una tabla por mosaico y mezcla las cuatro
+tablas vecinas de cada píxel con pesos bilineales en punto fijo.
+
+Con modo='luminancia' la tabla sale del histograma de la luminancia y se
+aplica igual a los tres canales (conserva aproximadamente el tono); con
+modo='canales' cada canal se ajusta con su propio histograma (corrige
+dominantes de color). Las imágenes uint8 de 2 dimensiones se tratan como
+grises y los canales a partir del cuarto (alfa) no se modifican.
+"""
+import numpy as np
+
+from . import histograma
+from . import imgPro8
+
+NIVELES = histograma.NIVELES
+MODOS = ('luminancia', 'canales')
+
+# Filas procesadas por bloque al interpolar las tablas de CLAHE
+FILAS_BLOQUE = 64
+# Mosaicos por lado de CLAHE como máximo (las tablas se calculan mosaico a mosaico)
+MOSAICOS_MAXIMOS = 64
+
+
+def _identidad():
+    return np.arange(NIVELES, dtype=np.uint8)
+
+def lut_auto_levels(conteos, bajo=0.5, alto=99.5):
+    """
+    Estira linealmente el rango entre los percentiles bajo y alto a [0, 255].
+    """
+    acumulado = np.cumsum(conteos)
+    total = acumulado[-1]
+    if total == 0:
+        return _identidad()
+    # primer nivel por encima del bajo % más oscuro y primero que alcanza el alto %
+    minimo = int(np.searchsorted(acumulado, total * bajo / 100, side='right'))
+    maximo = int(np.searchsorted(acumulado, total * alto / 100))
+    if maximo <= minimo:
+        return _identidad()
+    niveles = np.arange(NIVELES)
+    return np.clip(np.round((niveles - minimo) * 255 / (maximo - minimo)), 0, 255).astype(np.uint8)
+
+def lut_equalize(conteos):
+    """
+    Ecualización clásica: cada nivel pasa a su frecuencia acumulada, reescalada
+    para que el primer nivel presente quede en 0 y el último en 255.
+    """
+    acumulado = np.cumsum(conteos)
+    total = acumulado[-1]
+    presentes = np.flatnonzero(conteos)
+    if len(presentes) < 2:
+        return _identidad()
+    primero = acumulado[presentes[0]]
+    return np.clip(np.round((acumulado - primero) * 255 / (total - primero)), 0, 255).astype(np.uint8)
+
+def lut_clahe(conteos, limite=2.0):
+    """
+    Ecualización con el histograma recortado a limite veces la frecuencia
+    media; el exceso se reparte por igual entre todos los niveles, lo que
+    acota la pendiente de la tabla (y por tanto la amplificación del ruido).
+    """
+    total = conteos.sum()
+    if total == 0:
+        return _identidad()
+    tope = max(limite * total / NIVELES, 1)
+    recortado = np.minimum(conteos, tope).astype(np.float64)
+    recortado += (total - recortado.sum()) / NIVELES
+    acumulado = np.cumsum(recortado)
+    return np.clip(np.round(acumulado * 255 / acumulado[-1]), 0, 255).astype(np.uint8)
+
+
+def _validar(img, modo):
+    if img.dtype != np.uint8:
+        raise ValueError(f"Los ajustes por histograma son para imágenes uint8, no {img.dtype}.")
+    if modo not in MODOS:
+        raise ValueError(f"Modo desconocido: {modo}. Opciones: {', '.join(MODOS)}")
+
+def _color(img):
+    return 1 if img.ndim == 2 else min(img.shape[2], 3)
+
+def conteos(img, modo='canales', alto_banda=imgPro8.FILAS_BANDA):
+    """
+    Histogramas de la imagen en una pasada por bandas de filas: uno por canal
+    de color, o solo el de la luminancia con modo='luminancia'.
+    """
+    color = _color(img)
+    solo_luminancia = modo == 'luminancia' and color == 3
+    resultado = np.zeros((1 if solo_luminancia else color, NIVELES), dtype=np.int64)
+    for fila in range(0, img.shape[0], alto_banda):
+        banda = img[fila:fila + alto_banda]
+        if solo_luminancia:
+            resultado[0] += np.bincount(histograma.luminancia(banda).ravel(), minlength=NIVELES)
+        elif banda.ndim == 2:
+            resultado[0] += np.bincount(banda.ravel(), minlength=NIVELES)
+        else:
+            for canal in range(color):
+                resultado[canal] += np.bincount(banda[:, :, canal].ravel(), minlength=NIVELES)
+    return resultado
+
+def _tablas(img, modo, construir):
+    """
+    Tabla por canal de color (2D) construida con construir(conteos).
+    """
+    tablas = np.stack([construir(fila) for fila in conteos(img, modo)])
+    return np.tile(tablas, (_color(img), 1)) if len(tablas) < _color(img) else tablas
+
+def _aplicar(img, tablas):
+    if img.ndim == 2:
+        return imgPro8.aplicar_lut(img, tablas[0])
+    return imgPro8.aplicar_lut(img, tablas)
+
+def auto_levels(img, bajo=0.5, alto=99.5, modo='canales'):
+    """
+    Auto niveles: recorta el bajo % más oscuro y el (100 - alto) % más claro
+    y estira el resto a todo el rango.
+    """
+    _validar(img, modo)
+    return _aplicar(img, _tablas(img, modo, lambda c: lut_auto_levels(c, bajo, alto)))
+
+def equalize(img, modo='luminancia'):
+    """
+    Ecualización global del histograma.
+    """
+    _validar(img, modo)
+    return _aplicar(img, _tablas(img, modo, lut_equalize))
+
+
+def _luminancia(img):
+    if img.ndim == 2:
+        return img
+    if _color(img) < 3:
+        return img[:, :, 0]
+    gris = np.empty(img.shape[:2], dtype=np.uint8)
+    for fila in range(0, img.shape[0], imgPro8.FILAS_BANDA):
+        gris[fila:fila + imgPro8.FILAS_BANDA] = histograma.luminancia(img[fila:fila + imgPro8.FILAS_BANDA])
+    return gris
+
+def _vecinos(longitud, bordes):
+    """
+    Para cada coordenada: índice del mosaico cuyo centro queda antes, índice
+    del siguiente y peso del siguiente en punto fijo de 8 bits (0..256).
+    """
+    centros = (bordes[:-1] + bordes[1:] - 1) / 2
+    posiciones = np.arange(longitud)
+    anterior = np.clip(np.searchsorted(centros, posiciones, side='right') - 1, 0, len(centros) - 1)
+    siguiente = np.minimum(anterior + 1, len(centros) - 1)
+    distancia = np.where(siguiente > anterior, centros[siguiente] - centros[anterior], 1)
+    peso = np.clip((posiciones - centros[anterior]) / distancia, 0, 1)
+    return anterior, siguiente, np.round(peso * 256).astype(np.uint32)
+
+def clahe(img, mosaicos=8, limite=2.0, filas_bloque=FILAS_BLOQUE):
+    """
+    Ecualización adaptativa con contraste limitado (CLAHE).
+
+    La imagen se divide en mosaicos x mosaicos regiones; cada una tiene su
+    tabla (lut_clahe) calculada sobre la luminancia, y cada píxel mezcla las
+    tablas de los cuatro mosaicos cuyos centros lo rodean. La misma mezcla se
+    aplica a cada canal de color, como modo='luminancia'.
+    """
+    _validar(img, 'luminancia')
+    gris = _luminancia(img)
+    alto, ancho = gris.shape
+    filas_m, columnas_m = max(1, min(int(mosaicos), alto)), max(1, min(int(mosaicos), ancho))
+    bordes_y = np.linspace(0, alto, filas_m + 1).astype(int)
+    bordes_x = np.linspace(0, ancho, columnas_m + 1).astype(int)
+
+    tablas = np.empty((filas_m * columnas_m, NIVELES), dtype=np.uint32)
+    for i in range(filas_m):
+        for j in range(columnas_m):
+            mosaico = gris[bordes_y[i]:bordes_y[i + 1], bordes_x[j]:bordes_x[j + 1]]
+            tablas[i * columnas_m + j] = lut_clahe(np.bincount(mosaico.ravel(), minlength=NIVELES), limite)
+    tablas = tablas.ravel()
+
+    # desplazamiento de la tabla de cada mosaico dentro de tablas
+    y0, y1, wy = _vecinos(alto, bordes_y)
+    x0, x1, wx = _vecinos(ancho, bordes_x)
+    y0, y1 = y0 * columnas_m * NIVELES, y1 * columnas_m * NIVELES
+    x0, x1 = x0 * NIVELES, x1 * NIVELES
+
+    color = _color(img)
+    salida = np.copy(img)
+    canales = salida[:, :, np.newaxis] if img.ndim == 2 else salida[:, :, :color]
+    origen = img[:, :, np.newaxis] if img.ndim == 2 else img[:, :, :color]
+    wx = wx[:, np.newaxis]
+    for fila in range(0, alto, filas_bloque):
+        filas = slice(fila, fila + filas_bloque)
+        niveles = origen[filas].astype(np.uint32)
+        a, b = y0[filas, np.newaxis], y1[filas, np.newaxis]
+        arriba = tablas[(a + x0)[:, :, np.newaxis] + niveles] * (256 - wx)
+        arriba += tablas[(a + x1)[:, :, np.newaxis] + niveles] * wx
+        abajo = tablas[(b + x0)[:, :, np.newaxis] + niveles] * (256 - wx)
+        abajo += tablas[(b + x1)[:, :, np.newaxis] + niveles] * wx
+        peso = wy[filas, np.newaxis, np.newaxis]
+        arriba *= 256 - peso
+        abajo *= peso
+        arriba += abajo
+        arriba += 1 << 15
+        arriba >>= 16
+        canales[filas] = arriba
+    return salida
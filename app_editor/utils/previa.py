@@ -0,0 +1,113 @@
+"""
+Vista previa en vivo de las ediciones.
+
+Mientras el usuario mueve un slider no hace falta procesar la imagen a
+resolución completa: la operación se aplica sobre un proxy reducido del
+original (que se construye una vez por imagen y se guarda en caché) y el
+resultado se devuelve como un JPEG/WebP pequeño. La resolución completa solo se
+procesa al confirmar la acción.
+
+El proxy se reduce con un filtro de área (cada píxel es el promedio del bloque
+que cubre, ver remuestreo.reducir_area) en vez de tomar uno de cada n píxeles,
+que produce aliasing en bordes y texturas finas.
+"""
+import io
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+from PIL import Image
+
+from . import remuestreo
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = {'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+
+def construir_proxy(img, lado_maximo):
+    """
+    Versión reducida de img cuyo lado mayor no supera lado_maximo, de solo lectura.
+    """
+    return reducir(img, factor_proxy(img.shape, lado_maximo))
+
+def factor_proxy(forma, lado_maximo):
+    """
+    Factor de reducción entero del proxy de una imagen de forma (alto, ancho, ...).
+    """
+    return math.ceil(max(forma[:2]) / lado_maximo)
+
+def reducir(img, factor):
+    """
+    img reducida por factor con el filtro de área, de solo lectura.
+    """
+    proxy = remuestreo.reducir_area(img, factor) if factor > 1 else img
+    proxy.setflags(write=False)
+    return proxy
+
+def codificar(img, formato='JPEG', calidad=80):
+    """
+    Codifica la vista previa y devuelve los bytes.
+    """
+    buffer = io.BytesIO()
+    Image.fromarray(img).save(buffer, format=formato, quality=calidad)
+    return buffer.getvalue()
+
+
+class Cronometro:
+    """
+    Mide la duración de las etapas de una petición, en milisegundos.
+    """
+
+    def __init__(self):
+        self.etapas = {}
+        self.ultimo = time.perf_counter()
+
+    def marcar(self, etapa):
+        ahora = time.perf_counter()
+        self.etapas[etapa] = (ahora - self.ultimo) * 1e3
+        self.ultimo = ahora
+
+    def total(self):
+        return sum(self.etapas.values())
+
+    def server_timing(self):
+        """
+        Valor de la cabecera Server-Timing, visible en las herramientas del navegador.
+        """
+        return ', '.join(f'{etapa};dur={ms:.1f}' for etapa, ms in self.etapas.items())
+
+
+class Latencias:
+    """
+    Latencias recientes de la vista previa frente a un presupuesto en ms; las
+    vistas previas que se pasan del presupuesto se registran como advertencia.
+    """
+
+    def __init__(self, presupuesto_ms, muestras=500):
+        self.presupuesto_ms = presupuesto_ms
+        self.totales = deque(maxlen=muestras)
+        self.contadores = {'previas': 0, 'excedidas': 0}
+        self.candado = threading.Lock()
+
+    def registrar(self, cronometro):
+        total = cronometro.total()
+        with self.candado:
+            self.totales.append(total)
+            self.contadores['previas'] += 1
+            if total > self.presupuesto_ms:
+                self.contadores['excedidas'] += 1
+        if total > self.presupuesto_ms:
+            logger.warning("Vista previa de %.1f ms (presupuesto %d ms): %s",
+                           total, self.presupuesto_ms, cronometro.server_timing())
+
+    def estadisticas(self):
+        with self.candado:
+            datos = dict(self.contadores)
+            totales = sorted(self.totales)
+        datos['presupuesto_ms'] = self.presupuesto_ms
+        for p in (50, 95):
+            datos[f'p{p}_ms'] = round(totales[min(len(totales) - 1, len(totales) * p // 100)], 1) if totales else None
+        return datos
@@ -0,0 +1,333 @@
+"""
+Remuestreo: cambio de tamaño con factores arbitrarios y filtros de calidad.
+
+imgPro.lower_resolution tomaba uno de cada k píxeles (aliasing y solo factores
+enteros), el zoom era un np.kron comentado y fusion_images pasaba por
+Image.resize con el filtro por defecto convirtiendo a uint8 y de vuelta. Aquí
+se redimensiona con filtros separables (caja, bilineal y Lanczos de 3
+lóbulos): cada eje se procesa por separado con una tabla de coeficientes por
+posición de salida (las muestras que cubre el filtro y sus pesos), que se
+calcula una vez por tamaño. Cada tramo de posiciones de salida consecutivas
+se aplica como una multiplicación de matrices sobre la banda de entrada que
+cubre, así que el trabajo pesado lo hace BLAS y no un bucle por muestra.
+
+Sobre uint8 se calcula en float32 y cada pasada escribe uint8 redondeado y
+saturado (como PIL; la diferencia con Image.resize es de 1 o 2 niveles en
+pocos píxeles); sobre flotantes se calcula en el mismo tipo, sin recortar.
+Como PIL, los pesos de las matrices float32 son de punto fijo (múltiplos de
+2**-BITS_PESOS): con píxeles uint8 cada producto y cada suma parcial son
+exactos en float32, así que el resultado no depende del orden en que BLAS
+acumula y una banda de pocas filas da lo mismo que la imagen entera.
+Las reducciones por un factor entero con filtro de caja promedian bloques de
+factor x factor, y si el factor es potencia de dos lo hacen sumando vistas con
+paso 2 en vez de usar matrices.
+"""
+import math
+from functools import lru_cache
+
+import numpy as np
+
+FILTROS = ('nearest', 'box', 'bilinear', 'lanczos')
+
+# Filas procesadas por bloque en la pasada horizontal
+FILAS_BLOQUE = 128
+
+# Posiciones de salida por matriz de coeficientes
+SALIDAS_TRAMO = 16
+
+# Bloques de salida por banda al reducir por área, para acotar el acumulador uint32
+BLOQUES_BANDA = 64
+
+# Bits fraccionarios de los pesos en float32: 8 bits del píxel + 14 + los de
+# la suma de los pesos en valor absoluto (< 4) caben en los 24 de la mantisa
+BITS_PESOS = 14
+
+
+def _caja(x):
+    return ((x > -0.5) & (x <= 0.5)).astype(np.float64)
+
+def _triangulo(x):
+    return np.maximum(1 - np.abs(x), 0)
+
+def _lanczos(x):
+    return np.where(np.abs(x) < 3, np.sinc(x) * np.sinc(x / 3), 0)
+
+# filtro -> (función, soporte en muestras de la entrada sin escalar)
+NUCLEOS = {'box': (_caja, 0.5), 'bilinear': (_triangulo, 1.0), 'lanczos': (_lanczos, 3.0)}
+
+
+def _validar(filtro):
+    if filtro not in FILTROS:
+        raise ValueError(f"Filtro desconocido: {filtro}. Opciones: {', '.join(FILTROS)}")
+
+@lru_cache(maxsize=32)
+def coeficientes(entrada, salida, filtro):
+    """
+    Tabla de un eje: (indices, pesos), ambos de forma (salida, muestras).
+    La posición i de la salida es sum_k pesos[i, k] * entrada[indices[i, k]];
+    los pesos de cada fila suman 1. Al reducir, el filtro se ensancha en la
+    misma proporción para que actúe como antialias.
+    """
+    escala = entrada / salida
+    if filtro == 'nearest':
+        indices = np.minimum(((np.arange(salida) + 0.5) * escala).astype(np.intp), entrada - 1)[:, np.newaxis]
+        pesos = np.ones((salida, 1))
+    else:
+        funcion, soporte = NUCLEOS[filtro]
+        ensanche = max(escala, 1.0)
+        soporte *= ensanche
+        centros = (np.arange(salida) + 0.5) * escala
+        inicio = np.maximum(np.floor(centros - soporte + 0.5), 0).astype(np.intp)
+        fin = np.minimum(np.floor(centros + soporte + 0.5), entrada).astype(np.intp)
+        posiciones = inicio[:, np.newaxis] + np.arange(int((fin - inicio).max()))
+        pesos = funcion((posiciones - centros[:, np.newaxis] + 0.5) / ensanche)
+        pesos[posiciones >= fin[:, np.newaxis]] = 0
+        suma = pesos.sum(axis=1, keepdims=True)
+        pesos /= np.where(suma == 0, 1, suma)
+        indices = np.minimum(posiciones, entrada - 1) # las muestras sobrantes tienen peso 0
+    indices.setflags(write=False)
+    pesos.setflags(write=False)
+    return indices, pesos
+
+def tipo_calculo(dtype):
+    """
+    Tipo flotante de las matrices y del acumulado: float32 para uint8 y el
+    propio tipo para imágenes flotantes.
+    """
+    return np.dtype(np.float32) if np.dtype(dtype) == np.uint8 else np.dtype(dtype)
+
+@lru_cache(maxsize=32)
+def tramos(entrada, salida, filtro, canales=1, dtype=np.float32):
+    """
+    Los coeficientes de un eje como matrices densas por tramos de
+    SALIDAS_TRAMO posiciones de salida: lista de (inicio, fin, entrada_ini,
+    entrada_fin, matriz) donde matriz @ x[entrada_ini:entrada_fin] da las
+    posiciones [inicio, fin). Con canales > 1 cada peso ocupa la diagonal de
+    un bloque canales x canales (np.kron), para filas con los canales
+    intercalados.
+
+    Una matriz de unas decenas de columnas hace más operaciones que recorrer
+    solo las muestras del filtro, pero se resuelve con una multiplicación de
+    matrices (BLAS) en vez de una lectura indexada por muestra.
+    """
+    indices, pesos = coeficientes(entrada, salida, filtro)
+    resultado = []
+    for inicio in range(0, salida, SALIDAS_TRAMO):
+        fin = min(inicio + SALIDAS_TRAMO, salida)
+        entrada_ini, entrada_fin = int(indices[inicio:fin].min()), int(indices[inicio:fin].max()) + 1
+        matriz = np.zeros((fin - inicio, entrada_fin - entrada_ini))
+        filas = np.repeat(np.arange(fin - inicio), indices.shape[1])
+        np.add.at(matriz, (filas, (indices[inicio:fin] - entrada_ini).ravel()), pesos[inicio:fin].ravel())
+        if np.dtype(dtype) == np.float32:
+            matriz = _punto_fijo(matriz)
+        if canales > 1:
+            matriz = np.kron(matriz, np.eye(canales))
+        matriz = matriz.astype(dtype)
+        matriz.setflags(write=False)
+        resultado.append((inicio, fin, entrada_ini, entrada_fin, matriz))
+    return resultado
+
+def _punto_fijo(matriz):
+    """
+    Redondea los pesos a múltiplos de 2**-BITS_PESOS; lo que cada fila deja
+    de sumar por el redondeo se corrige en su peso mayor.
+    """
+    escala = 2.0 ** BITS_PESOS
+    enteros = np.round(matriz * escala)
+    filas = np.arange(len(enteros))
+    enteros[filas, np.argmax(enteros, axis=1)] += np.round(matriz.sum(axis=1) * escala) - enteros.sum(axis=1)
+    return enteros / escala
+
+def filas_origen(entrada, salida, filtro, fila_ini, fila_fin):
+    """
+    Filas de la entrada que lee pasada_filas para producir [fila_ini, fila_fin).
+    """
+    if fila_fin <= fila_ini:
+        return 0, 0
+    lista = tramos(entrada, salida, filtro)
+    return lista[fila_ini // SALIDAS_TRAMO][2], lista[(fila_fin - 1) // SALIDAS_TRAMO][3]
+
+def _escribir(resultado, destino):
+    if destino.dtype == np.uint8:
+        np.clip(resultado, 0, 255, out=resultado)
+        np.rint(resultado, out=resultado)
+    destino[...] = resultado
+
+def _plano(arreglo):
+    if not arreglo.flags.c_contiguous:
+        raise ValueError("La salida del remuestreo debe ser un arreglo contiguo.")
+    return arreglo.reshape(len(arreglo), -1)
+
+def pasada_filas(img, filtro, out, forma=None, fila_ini=0, desplazamiento=0):
+    """
+    Remuestrea el eje 0 de img y escribe las filas de out.
+
+    Por defecto img es la entrada completa y out la salida completa. Para
+    procesar por bandas, forma es (alto de la entrada, alto de la salida),
+    out recibe las filas de salida desde fila_ini y img contiene las filas de
+    la entrada desde desplazamiento (al menos las de filas_origen).
+    """
+    entrada, salida = forma or (len(img), len(out))
+    fila_fin = fila_ini + len(out)
+    if filtro == 'nearest':
+        indices = coeficientes(entrada, salida, filtro)[0][fila_ini:fila_fin, 0]
+        np.take(img, indices - desplazamiento, axis=0, out=out)
+        return out
+    dtype = tipo_calculo(img.dtype)
+    plano, destino = img.reshape(len(img), -1), _plano(out)
+    lista = tramos(entrada, salida, filtro, 1, dtype)
+    for inicio, fin, entrada_ini, entrada_fin, matriz in lista[fila_ini // SALIDAS_TRAMO:(fila_fin - 1) // SALIDAS_TRAMO + 1]:
+        a, b = max(inicio, fila_ini), min(fin, fila_fin)
+        bloque = plano[entrada_ini - desplazamiento:entrada_fin - desplazamiento].astype(dtype)
+        _escribir(matriz[a - inicio:b - inicio] @ bloque, destino[a - fila_ini:b - fila_ini])
+    return out
+
+def pasada_columnas(img, filtro, out):
+    """
+    Remuestrea el eje 1 de img (todas sus filas) y escribe en out.
+    """
+    entrada, salida = img.shape[1], out.shape[1]
+    if filtro == 'nearest':
+        np.take(img, coeficientes(entrada, salida, filtro)[0][:, 0], axis=1, out=out)
+        return out
+    dtype = tipo_calculo(img.dtype)
+    canales = 1 if img.ndim == 2 else img.shape[2]
+    lista = tramos(entrada, salida, filtro, canales, dtype)
+    destino = _plano(out)
+    for fila in range(0, len(img), FILAS_BLOQUE):
+        banda = img[fila:fila + FILAS_BLOQUE]
+        banda = banda.reshape(len(banda), -1).astype(dtype)
+        for inicio, fin, entrada_ini, entrada_fin, matriz in lista:
+            resultado = banda[:, entrada_ini * canales:entrada_fin * canales] @ matriz.T
+            _escribir(resultado, destino[fila:fila + FILAS_BLOQUE, inicio * canales:fin * canales])
+    return out
+
+def columnas_primero(alto_img, ancho_img, alto, ancho):
+    """
+    Orden de las pasadas: primero el eje que deja el intermedio más pequeño.
+    """
+    return alto_img * ancho <= alto * ancho_img
+
+def resize(img, alto, ancho, filtro='lanczos', out=None):
+    """
+    Redimensiona img (uint8 o flotante, 2D o con canales) a alto x ancho.
+    Si el cambio es una reducción por un factor entero con filtro de caja
+    usa reducir_area.
+    """
+    _validar(filtro)
+    alto_img, ancho_img = img.shape[:2]
+    if alto < 1 or ancho < 1:
+        raise ValueError("El tamaño de salida debe ser positivo.")
+    factor = alto_img // alto
+    if (filtro == 'box' and img.dtype == np.uint8 and factor > 1
+            and alto_img == alto * factor and ancho_img == ancho * factor):
+        resultado = reducir_area(img, factor)
+        if out is None:
+            return resultado
+        out[...] = resultado
+        return out
+    if out is None:
+        out = np.empty((alto, ancho) + img.shape[2:], dtype=img.dtype)
+    if (alto_img, ancho_img) == (alto, ancho):
+        out[...] = img
+    elif filtro == 'nearest':
+        filas = np.take(img, coeficientes(alto_img, alto, filtro)[0][:, 0], axis=0)
+        np.take(filas, coeficientes(ancho_img, ancho, filtro)[0][:, 0], axis=1, out=out)
+    elif ancho_img == ancho:
+        pasada_filas(img, filtro, out)
+    elif alto_img == alto:
+        pasada_columnas(img, filtro, out)
+    elif columnas_primero(alto_img, ancho_img, alto, ancho):
+        intermedio = np.empty((alto_img, ancho) + img.shape[2:], dtype=img.dtype)
+        pasada_filas(pasada_columnas(img, filtro, intermedio), filtro, out)
+    else:
+        intermedio = np.empty((alto, ancho_img) + img.shape[2:], dtype=img.dtype)
+        pasada_columnas(pasada_filas(img, filtro, intermedio), filtro, out)
+    return out
+
+def tamano_escalado(alto, ancho, escala):
+    """
+    Tamaño de salida al escalar por escala (al menos 1 x 1).
+    """
+    return (max(1, math.ceil(round(alto * escala, 6))), max(1, math.ceil(round(ancho * escala, 6))))
+
+def zoom(img, factor, filtro='bilinear'):
+    """
+    Amplía (o reduce, si factor < 1) la imagen por un factor real. Con
+    'nearest' y factor entero replica cada píxel factor x factor veces.
+    """
+    _validar(filtro)
+    if filtro == 'nearest' and float(factor).is_integer() and factor >= 1:
+        factor = int(factor)
+        return np.repeat(np.repeat(img, factor, axis=0), factor, axis=1)
+    return resize(img, *tamano_escalado(*img.shape[:2], factor), filtro=filtro)
+
+def lower_resolution(img, factor, filtro='box'):
+    """
+    Reduce la imagen en un factor (el tamaño de salida es el de
+    img[::factor, ::factor]). 'nearest' toma uno de cada factor píxeles como
+    la versión original; 'box' promedia cada bloque de factor x factor.
+    """
+    _validar(filtro)
+    if factor < 1:
+        raise ValueError("El factor de reducción debe ser al menos 1.")
+    if float(factor).is_integer():
+        factor = int(factor)
+        if filtro == 'nearest':
+            return img[::factor, ::factor].copy()
+        if filtro == 'box' and img.dtype == np.uint8:
+            return reducir_area(img, factor)
+    return resize(img, *tamano_escalado(*img.shape[:2], 1 / factor), filtro=filtro)
+
+
+def _potencia_de_dos(factor):
+    return factor > 1 and factor & (factor - 1) == 0
+
+def reducir_area(img, factor):
+    """
+    Reduce una imagen uint8 en un factor entero promediando cada bloque de
+    factor x factor píxeles (los bloques del borde pueden ser menores).
+    """
+    alto, ancho = img.shape[:2]
+    if _potencia_de_dos(factor) and alto % factor == 0 and ancho % factor == 0:
+        return _reducir_potencia(img, factor)
+    columnas = np.arange(0, ancho, factor)
+    ancho_bloques = np.diff(np.append(columnas, ancho))
+    salida = np.empty((len(range(0, alto, factor)), len(columnas)) + img.shape[2:], dtype=np.uint8)
+    filas_banda = factor * BLOQUES_BANDA
+    for fila in range(0, alto, filas_banda):
+        banda = img[fila:fila + filas_banda]
+        filas = np.arange(0, len(banda), factor)
+        alto_bloques = np.diff(np.append(filas, len(banda)))
+        suma = np.add.reduceat(banda, filas, axis=0, dtype=np.uint32)
+        suma = np.add.reduceat(suma, columnas, axis=1)
+        area = np.outer(alto_bloques, ancho_bloques).astype(np.uint32)
+        if suma.ndim == 3:
+            area = area[:, :, None]
+        suma += area // 2 # redondeo al entero más cercano
+        suma //= area
+        salida[fila // factor:fila // factor + len(filas)] = suma
+    return salida
+
+def _reducir_potencia(img, factor):
+    """
+    Camino rápido de reducir_area para factores potencia de dos que dividen
+    la imagen: cada nivel suma las cuatro vistas con paso 2 de la banda, sin
+    redondear entre niveles, y solo al final se divide entre factor².
+    """
+    niveles = factor.bit_length() - 1
+    tipo = np.uint16 if niveles <= 4 else np.uint32 # 255 * 4**4 cabe en 16 bits
+    salida = np.empty((img.shape[0] // factor, img.shape[1] // factor) + img.shape[2:], dtype=np.uint8)
+    filas_banda = factor * BLOQUES_BANDA
+    for fila in range(0, img.shape[0], filas_banda):
+        suma = img[fila:fila + filas_banda]
+        for _ in range(niveles):
+            mitad = suma[0::2, 0::2].astype(tipo)
+            mitad += suma[1::2, 0::2]
+            mitad += suma[0::2, 1::2]
+            mitad += suma[1::2, 1::2]
+            suma = mitad
+        suma += factor * factor // 2
+        suma >>= 2 * niveles
+        salida[fila // factor:fila // factor + len(suma)] = suma
+    return salida
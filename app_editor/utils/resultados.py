@@ -0,0 +1,320 @@
+"""
+Caché de resultados procesados direccionada por contenido.
+
+La clave de un resultado es el hash del contenido de la imagen original más
+los parámetros normalizados de la operación, así que la misma combinación
+(imagen, accion, parámetros) se sirve sin decodificar ni procesar de nuevo.
+
+Hay dos niveles:
+- disco: un archivo por resultado dentro de un directorio, con presupuesto
+  de bytes y desalojo LRU (la fecha de modificación se actualiza al acertar,
+  como mucho una vez cada INTERVALO_ACCESO segundos por resultado, así que
+  el orden LRU se comparte entre procesos sin escribir en el disco en cada
+  acierto)
+- memoria: los resultados más recientes del proceso, con su propio
+  presupuesto, para no tocar el disco en los aciertos calientes
+
+Cada resultado se guarda como clave + extensión del formato en que se
+codificó; la extensión por defecto es la primera de extensiones.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# Bytes leídos por iteración al calcular el hash del original
+BYTES_LECTURA = 1 << 20
+
+# Hashes de originales memorizados por proceso (LRU)
+MAXIMO_HASHES = 4096
+
+# Segundos entre dos actualizaciones de la fecha de un mismo resultado, y
+# resultados cuyo último acceso se recuerda (LRU)
+INTERVALO_ACCESO = 60
+MAXIMO_ACCESOS = 4096
+
+
+
+def normalizar(parametros):
+    """
+    Representación canónica de los parámetros de una operación: claves
+    ordenadas, números como float y tuplas como listas.
+    """
+    def canonico(valor):
+        if isinstance(valor, bool) or valor is None or isinstance(valor, str):
+            return valor
+        if isinstance(valor, (int, float)):
+            return float(valor)
+        if isinstance(valor, dict):
+            return {str(k): canonico(v) for k, v in valor.items()}
+        if isinstance(valor, (list, tuple)):
+            return [canonico(v) for v in valor]
+        return str(valor)
+    return json.dumps(canonico(parametros), sort_keys=True, separators=(',', ':'))
+
+
+class CacheResultados:
+    """
+    Caché de resultados en disco con nivel en memoria y desalojo LRU.
+    """
+
+    def __init__(self, directorio, bytes_disco, bytes_memoria, extensiones=('.png',)):
+        self.directorio = directorio
+        self.bytes_disco = bytes_disco
+        self.bytes_memoria = bytes_memoria
+        self.extensiones = tuple(extensiones)
+        self.memoria = OrderedDict() # clave -> bytes
+        self.ocupado_memoria = 0
+        self.ocupado_disco = None # se calcula al primer uso
+        self.hashes = OrderedDict() # (ruta, mtime, tamaño) -> hash del contenido
+        self.accesos = OrderedDict() # ruta -> time.monotonic() de la última actualización de su fecha
+        self.contadores = {'aciertos_memoria': 0, 'aciertos_disco': 0, 'fallos': 0,
+                           'desalojos_memoria': 0, 'desalojos_disco': 0}
+        self.candado = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def hash_contenido(self, ruta):
+        """
+        sha256 del archivo original, memorizado por ruta, fecha y tamaño
+        (como mucho MAXIMO_HASHES, los usados más recientemente).
+        """
+        info = os.stat(ruta)
+        firma = (ruta, info.st_mtime_ns, info.st_size)
+        with self.candado:
+            if firma in self.hashes:
+                self.hashes.move_to_end(firma)
+                return self.hashes[firma]
+        resumen = hashlib.sha256() # fuera del candado: puede leer cientos de MB
+        with open(ruta, 'rb') as archivo:
+            for bloque in iter(lambda: archivo.read(BYTES_LECTURA), b''):
+                resumen.update(bloque)
+        with self.candado:
+            self.hashes[firma] = resumen.hexdigest()
+            while len(self.hashes) > MAXIMO_HASHES:
+                self.hashes.popitem(last=False)
+        return resumen.hexdigest()
+
+    def clave(self, ruta, parametros):
+        """
+        Clave del resultado de aplicar la operación descrita por parametros
+        al archivo en ruta.
+        """
+        resumen = hashlib.sha256(self.hash_contenido(ruta).encode())
+        resumen.update(normalizar(parametros).encode())
+        return resumen.hexdigest()
+
+    def nombre(self, clave, extension=None):
+        return clave + (extension or self.extensiones[0])
+
+    def ruta(self, clave, extension=None):
+        return os.path.join(self.directorio, self.nombre(clave, extension))
+
+    def buscar(self, clave, extension=None):
+        """
+        Devuelve el nombre del archivo del resultado si está en caché, o None.
+        """
+        ruta = self.ruta(clave, extension)
+        ahora = time.monotonic()
+        with self.candado:
+            reciente = ruta in self.accesos and ahora - self.accesos[ruta] < INTERVALO_ACCESO
+        try:
+            if reciente:
+                os.stat(ruta) # solo comprueba que otro proceso no lo haya desalojado
+            else:
+                os.utime(ruta) # marca el acceso para el orden LRU en disco
+        except FileNotFoundError:
+            with self.candado:
+                if clave in self.memoria: # desalojado por otro proceso
+                    self.ocupado_memoria -= len(self.memoria.pop(clave))
+                self.accesos.pop(ruta, None)
+                self.contadores['fallos'] += 1
+            return None
+        with self.candado:
+            if not reciente:
+                self.accesos[ruta] = ahora
+                self.accesos.move_to_end(ruta)
+                while len(self.accesos) > MAXIMO_ACCESOS:
+                    self.accesos.popitem(last=False)
+            if clave in self.memoria:
+                self.memoria.move_to_end(clave)
+                self.contadores['aciertos_memoria'] += 1
+            else:
+                self.contadores['aciertos_disco'] += 1
+        return self.nombre(clave, extension)
+
+    def leer(self, clave, extension=None):
+        """
+        Devuelve los bytes del resultado (desde memoria si es posible) o None.
+        """
+        if self.buscar(clave, extension) is None:
+            return None
+        with self.candado:
+            if clave in self.memoria:
+                return self.memoria[clave]
+        try:
+            with open(self.ruta(clave, extension), 'rb') as archivo:
+                datos = archivo.read()
+        except FileNotFoundError:
+            return None
+        self._recordar(clave, datos)
+        return datos
+
+    def guardar(self, clave, archivo, extension=None):
+        """
+        Guarda el contenido de archivo (objeto con read o bytes) como resultado
+        de clave y devuelve su nombre.
+        """
+        if isinstance(archivo, (bytes, bytearray)):
+            datos = bytes(archivo)
+        else:
+            datos = None
+        temporal = tempfile.NamedTemporaryFile(dir=self.directorio, delete=False)
+        with temporal:
+            if datos is not None:
+                temporal.write(datos)
+            else:
+                shutil.copyfileobj(archivo, temporal)
+        tamano = os.path.getsize(temporal.name)
+        os.replace(temporal.name, self.ruta(clave, extension)) # escritura atómica
+        if datos is None and tamano <= self.bytes_memoria:
+            with open(self.ruta(clave, extension), 'rb') as guardado:
+                datos = guardado.read()
+        if datos is not None:
+            self._recordar(clave, datos)
+        with self.candado:
+            self._ocupado() # inicializa el conteo antes de sumar
+            self.ocupado_disco += tamano
+        self._desalojar_disco()
+        return self.nombre(clave, extension)
+
+    def adoptar(self, clave, ruta, extension=None):
+        """
+        Mueve a la caché un archivo ya escrito en su directorio (por ejemplo
+        por otro proceso) como resultado de clave y devuelve su nombre.
+        """
+        tamano = os.path.getsize(ruta)
+        os.replace(ruta, self.ruta(clave, extension))
+        with self.candado:
+            self._ocupado()
+            self.ocupado_disco += tamano
+        self._desalojar_disco()
+        return self.nombre(clave, extension)
+
+    @contextlib.contextmanager
+    def escribir(self, clave, extension=None):
+        """
+        Abre un archivo temporal en el directorio de la caché para que el
+        codificador escriba el resultado directamente ahí; al salir del bloque
+        sin errores se adopta como resultado de clave (si falla, se borra).
+        """
+        temporal = tempfile.NamedTemporaryFile(dir=self.directorio, suffix='.tmp', delete=False)
+        try:
+            with temporal:
+                yield temporal
+        except BaseException:
+            os.remove(temporal.name)
+            raise
+        self.adoptar(clave, temporal.name, extension)
+
+    def _recordar(self, clave, datos):
+        if len(datos) > self.bytes_memoria:
+            return
+        with self.candado:
+            if clave in self.memoria:
+                self.ocupado_memoria -= len(self.memoria.pop(clave))
+            self.memoria[clave] = datos
+            self.ocupado_memoria += len(datos)
+            while self.ocupado_memoria > self.bytes_memoria:
+                _, expulsado = self.memoria.popitem(last=False)
+                self.ocupado_memoria -= len(expulsado)
+                self.contadores['desalojos_memoria'] += 1
+
+    def _entradas(self):
+        entradas = []
+        with os.scandir(self.directorio) as iterador:
+            for entrada in iterador:
+                if entrada.is_file() and entrada.name.endswith(self.extensiones):
+                    info = entrada.stat()
+                    entradas.append((info.st_mtime_ns, info.st_size, entrada.path))
+        return entradas
+
+    def _ocupado(self):
+        if self.ocupado_disco is None:
+            self.ocupado_disco = sum(tamano for _, tamano, _ in self._entradas())
+        return self.ocupado_disco
+
+    def _desalojar_disco(self):
+        with self.candado:
+            if self._ocupado() <= self.bytes_disco:
+                return
+            # recalcula desde disco: otros procesos también escriben aquí
+            entradas = sorted(self._entradas())
+            self.ocupado_disco = sum(tamano for _, tamano, _ in entradas)
+            for _, tamano, ruta in entradas:
+                if self.ocupado_disco <= self.bytes_disco:
+                    break
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    continue
+                self.ocupado_disco -= tamano
+                self.contadores['desalojos_disco'] += 1
+                clave = os.path.splitext(os.path.basename(ruta))[0]
+                if clave in self.memoria:
+                    self.ocupado_memoria -= len(self.memoria.pop(clave))
+
+    def limpiar(self, antes=None, bytes_maximos=None, conservar=()):
+        """
+        Borra los resultados usados por última vez antes de la fecha antes
+        (segundos desde epoch) y después los menos usados hasta ocupar como
+        mucho bytes_maximos. Los nombres de conservar no se borran. También
+        borra los temporales huérfanos anteriores a antes. Devuelve
+        (archivos, bytes) borrados.
+        """
+        borrados = [0, 0]
+        def borrar(ruta, tamano):
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                return
+            borrados[0] += 1
+            borrados[1] += tamano
+            clave = os.path.splitext(os.path.basename(ruta))[0]
+            if clave in self.memoria:
+                self.ocupado_memoria -= len(self.memoria.pop(clave))
+
+        with self.candado:
+            if antes is not None:
+                with os.scandir(self.directorio) as iterador:
+                    for entrada in iterador:
+                        if entrada.is_file() and entrada.name.endswith('.tmp') and entrada.stat().st_mtime < antes:
+                            borrar(entrada.path, entrada.stat().st_size) # escritura interrumpida
+            entradas = sorted(self._entradas())
+            ocupado = sum(tamano for _, tamano, _ in entradas)
+            for mtime_ns, tamano, ruta in entradas:
+                viejo = antes is not None and mtime_ns / 1e9 < antes
+                if not viejo and (bytes_maximos is None or ocupado <= bytes_maximos):
+                    break # el resto es más reciente
+                if os.path.basename(ruta) in conservar:
+                    continue
+                borrar(ruta, tamano)
+                ocupado -= tamano
+            self.ocupado_disco = ocupado
+        return tuple(borrados)
+
+    def estadisticas(self):
+        with self.candado:
+            datos = dict(self.contadores)
+            datos.update({
+                'entradas_memoria': len(self.memoria),
+                'bytes_memoria': self.ocupado_memoria,
+                'bytes_disco': self._ocupado(),
+                'presupuesto_memoria': self.bytes_memoria,
+                'presupuesto_disco': self.bytes_disco,
+            })
+        return datos
@@ -0,0 +1,71 @@
+"""
+Políticas de codificación de los resultados.
+
+El despliegue fija el formato por defecto, los formatos que se pueden pedir y
+la calidad o el nivel de compresión por defecto (EDITOR_SALIDA en settings);
+cada petición puede elegir entre los formatos permitidos con los campos
+'formato', 'calidad' y 'compresion'. Los valores no permitidos o inválidos se
+ignoran y se usa la política del despliegue.
+
+La política normalizada es un diccionario serializable en JSON, por ejemplo
+{'formato': 'jpeg', 'calidad': 85}, que forma parte de los parámetros de la
+operación y por lo tanto de la clave de caché.
+
+'raw' entrega los píxeles sin comprimir en formato .npy (cabecera de NumPy
+con forma y tipo seguida de los bytes uint8), para clientes de la API que
+van a seguir procesando la imagen.
+"""
+
+# formato -> (formato de bloques/PIL, extensión, tipo de contenido)
+FORMATOS = {
+    'png': ('PNG', '.png', 'image/png'),
+    'jpeg': ('JPEG', '.jpg', 'image/jpeg'),
+    'webp': ('WEBP', '.webp', 'image/webp'),
+    'raw': ('NPY', '.npy', 'application/octet-stream'),
+}
+EXTENSIONES = tuple(extension for _, extension, _ in FORMATOS.values())
+
+# Política por defecto si no hay configuración (la salida original del editor)
+PNG = {'formato': 'png', 'compresion': 6}
+
+
+def _entero(valor, minimo, maximo):
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        return None
+    return valor if minimo <= valor <= maximo else None
+
+def politica(datos, config):
+    """
+    Política de salida para una petición: datos son los campos enviados
+    (un QueryDict o diccionario) y config es EDITOR_SALIDA.
+    """
+    formato = datos.get('formato') or config['FORMATO']
+    if formato not in config['FORMATOS'] or formato not in FORMATOS:
+        formato = config['FORMATO']
+    if formato in ('jpeg', 'webp'):
+        calidad = _entero(datos.get('calidad'), 1, 100)
+        return {'formato': formato, 'calidad': calidad or config['CALIDAD']}
+    if formato == 'png':
+        compresion = _entero(datos.get('compresion'), 0, 9)
+        return {'formato': formato, 'compresion': config['COMPRESION_PNG'] if compresion is None else compresion}
+    return {'formato': formato}
+
+def opciones(salida):
+    """
+    Devuelve (formato, opciones del codificador) para bloques.guardar.
+    """
+    salida = salida or PNG
+    formato = FORMATOS[salida['formato']][0]
+    if 'calidad' in salida:
+        return formato, {'quality': salida['calidad']}
+    if 'compresion' in salida:
+        return formato, {'compress_level': salida['compresion']}
+    return formato, {}
+
+def extension(salida):
+    return FORMATOS[(salida or PNG)['formato']][1]
+
+def tipo_contenido(salida):
+    return FORMATOS[(salida or PNG)['formato']][2]
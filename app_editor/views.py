@@ -1,78 +1,710 @@
 from django.shortcuts import render
-from django.core.files.storage import FileSystemStorage # Importa FileSystemStorage para manejar archivos
-from .utils import imgPro
-import numpy as np
-from PIL import Image
-from django.core.files.base import ContentFile # Importa ContentFile para manejar archivos en memoria
-from io import BytesIO # Importa BytesIO para manejar buffers en memoria
-import time
-from django.http import HttpResponse
-import uuid # Importa el módulo uuid para generar identificadores únicos
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage, default_storage # Importa FileSystemStorage para manejar archivos
+from django.shortcuts import get_object_or_404, redirect
+from . import almacenamiento
+from . import historial
+from . import subidas
+from . import trabajos
+from .models import Archivo, Trabajo
+from .utils import acciones
+from .utils import bloques
+from .utils import composicion
+from .utils import crudo
+from .utils import decodificadas
+from .utils import filtros
+from .utils import histograma
+from .utils import imgPro8
+from .utils import ingesta
+from .utils import metricas
+from .utils import niveles
+from .utils import previa
+from .utils import resultados
+from .utils import rotacion
+from .utils import salida
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from django.views.decorators.http import condition, require_POST, require_safe
+import json
+import math
+import os
+import uuid
 
 
 # Create your views here.
-def extract_layer(request, imagen_url, procesada_url, fs, capa, canal, tipo_grises=None):
+_cache_resultados = None
+
+def result_cache():
+   """
+   Caché de resultados del proceso, creada al primer uso con EDITOR_CACHE_RESULTADOS.
+   """
+   global _cache_resultados
+   if _cache_resultados is None:
+       config = settings.EDITOR_CACHE_RESULTADOS
+       _cache_resultados = resultados.CacheResultados(
+           FileSystemStorage().path(config['DIRECTORIO']), config['BYTES_DISCO'], config['BYTES_MEMORIA'],
+           salida.EXTENSIONES)
+   return _cache_resultados
+
+_cache_decodificadas = None
+
+def decoded_cache():
+   """
+   Caché de imágenes decodificadas del proceso, creada al primer uso con
+   EDITOR_CACHE_DECODIFICADAS_BYTES. Lo que no está en memoria se abre
+   desde su copia cruda (ver raw_cache) antes de decodificar el archivo.
+   """
+   global _cache_decodificadas
+   if _cache_decodificadas is None:
+       _cache_decodificadas = decodificadas.CacheDecodificadas(settings.EDITOR_CACHE_DECODIFICADAS_BYTES, decode_image)
+   return _cache_decodificadas
+
+def raw_cache():
+   """
+   Copias crudas en disco de las imágenes decodificadas, con EDITOR_CACHE_CRUDOS.
+   """
+   config = settings.EDITOR_CACHE_CRUDOS
+   return crudo.cache_proceso(FileSystemStorage().path(config['DIRECTORIO']), config['BYTES_DISCO'])
+
+_escritor_crudos = None
+
+def raw_writer():
+   """
+   Hilo que escribe las copias crudas de las imágenes recién decodificadas,
+   para que la petición que las decodificó no espere a la escritura.
+   """
+   global _escritor_crudos
+   if _escritor_crudos is None:
+       _escritor_crudos = ThreadPoolExecutor(1, thread_name_prefix='crudos')
+   return _escritor_crudos
+
+def decode_image(ruta):
+   return crudo.decodificar_en_cache(ruta, raw_cache(), ejecutor=raw_writer())
+
+_cache_proxies = None
+_latencias_previa = None
+
+def proxy_cache():
+   """
+   Caché de proxies reducidos para la vista previa, construidos desde un
+   nivel de la pirámide de la imagen (ver utils/ingesta.py) si hay alguno
+   que sirva, o desde la imagen decodificada (que queda en decoded_cache
+   para el render completo).
+   """
+   global _cache_proxies
+   if _cache_proxies is None:
+       config = settings.EDITOR_VISTA_PREVIA
+       _cache_proxies = decodificadas.CacheDecodificadas(config['BYTES_CACHE'], preview_proxy)
+   return _cache_proxies
+
+def preview_proxy(ruta):
+   lado = settings.EDITOR_VISTA_PREVIA['LADO']
+   factor = previa.factor_proxy(ingesta.dimensiones(ruta), lado)
+   nivel = ingesta.nivel_divisor(ruta, factor)
+   if nivel is None:
+       return previa.construir_proxy(decoded_cache().obtener(ruta), lado)
+   reducida, escala = nivel
+   return previa.reducir(reducida, factor // escala)
+
+_metricas = None
+
+def edit_metrics():
+   """
+   Registro de métricas por etapa del proceso, creado al primer uso con EDITOR_METRICAS.
+   """
+   global _metricas
+   if _metricas is None:
+       config = settings.EDITOR_METRICAS
+       _metricas = metricas.RegistroMetricas(config['MUESTREO'], config['MEMORIA'])
+   return _metricas
+
+def preview_latencies():
+   global _latencias_previa
+   if _latencias_previa is None:
+       _latencias_previa = previa.Latencias(settings.EDITOR_VISTA_PREVIA['PRESUPUESTO_MS'])
+   return _latencias_previa
+
+def process_image(request, imagen_url, procesada_url, fs, parametros):
+   """
+   Aplica la operación descrita por parametros a la imagen actual del
+   formulario. El resultado se guarda en la caché de resultados con una clave
+   derivada del contenido del original y de parametros, así que repetir la
+   misma operación sobre la misma imagen no vuelve a decodificar ni procesar.
+
+   El formato del resultado sale de los campos 'formato', 'calidad' y
+   'compresion' del formulario, dentro de lo que permite EDITOR_SALIDA.
+
+   Si el formulario trae 'asincrono' y el resultado no está en caché, la
+   operación se encola en el pool de procesos y procesada_url queda vacía;
+   request.trabajo guarda el trabajo para que la plantilla consulte su estado.
+
+   Con EDITOR_RESPUESTA_DIRECTA activa no se procesa nada aquí: procesada_url
+   apunta a stream_result, que codifica la imagen en su propia respuesta.
+
+   Si el formulario trae 'apilar', la operación se agrega al historial de la
+   sesión y se aplica sobre las ediciones anteriores (ver stack_edit); ese
+   camino siempre procesa en la petición.
+
+   Las etapas se marcan en request.medicion (ver edit_metrics), si la hay.
+   """
    ruta_original = request.POST.get('imagen_actual')  # ruta recibida del formulario
+   if ruta_original and request.POST.get('apilar'):
+       return stack_edit(request, ruta_original, fs, parametros)
+   if ruta_original and settings.EDITOR_RESPUESTA_DIRECTA['ACTIVA'] and not request.POST.get('asincrono'):
+       return [ruta_original, stream_url(request.POST)]
    if ruta_original:
-       # abrir la imagen original desde MEDIA_ROOT
-      
+       parametros = dict(parametros, salida=output_policy(request.POST))
        ruta_completa = fs.path(ruta_original.replace('/media/', '')) #convierte la url publica a una relativa
-       img = Image.open(ruta_completa).convert('RGB') # abre la imagen en disco en RGB
-       arr = np.array(img) / 255 # normalizada para uso correcto de la libreria
-      
-       # transformacion con la libreria
-       if canal == "rgb":
-           nueva = imgPro.extract_layer_rgb(arr, capa) #para RGB
-       elif canal == "cmy":
-           nueva = imgPro.extract_layer_cmy(arr, capa) #para CMY
-       elif capa is None and canal is None and tipo_grises is None:
-           nueva = imgPro.reverse(arr)
-       elif tipo_grises:
-           if tipo_grises == "average":
-               nueva = imgPro.average(arr)
-           elif tipo_grises == "luminosity":
-               nueva = imgPro.luminosity(arr)
-           elif tipo_grises == "midgray":
-               nueva = imgPro.midgray(arr)
-       else:
-           nueva = arr
-      
-       nueva = np.clip(nueva, 0, 1)
-
-       print("Tipo:", tipo_grises)
-       print("Shape de nueva:", nueva.shape)
-       print("Min:", np.min(nueva), "Max:", np.max(nueva), "Media:", np.mean(nueva))
-      
-       procesada = Image.fromarray((np.clip(nueva, 0, 1) * 255).astype(np.uint8), mode="RGB")
-       # procesada = Image.fromarray((nueva[:, :, 0] * 255).astype(np.uint8), mode="L")
-       # procesada = Image.fromarray((nueva * 255).astype(np.uint8))
-      
-       # guardar la imagen procesada en memoria temporal
-       buffer = BytesIO() # crea un buffer en memoria
-       procesada.save(buffer, format='PNG') # guarda la imagen procesada en png dentro del buffer
-       buffer.seek(0) # va al inicio del buffer para leer la imagen
-      
-       # guardar la imagen procesada en el sistema de archivos
-       nombre_resultado = f'{request.POST.get("accion")}_{ruta_original.split("/")[-1]}' # nombre para la nueva imagen
-       fs.save(nombre_resultado, ContentFile(buffer.read())) # lee los butes del buffer y los envuelve en un ContentFile para escribir en fisco con fs
-       buffer.close()
-      
-       imagen_url = ruta_original
-       procesada_url = fs.url(nombre_resultado)
+       cache = result_cache()
+       medicion = getattr(request, 'medicion', None)
+       clave = cache.clave(ruta_completa, parametros)
+       nombre_resultado = cache.buscar(clave, salida.extension(parametros['salida']))
+       if medicion is not None:
+           medicion.marcar('cache')
+       imagen_url = ruta_original  # Siempre apunta a la original para más operaciones
+       if nombre_resultado is None and request.POST.get('asincrono'):
+           request.trabajo = trabajos.cola(cache).encolar(ruta_completa, parametros, clave)
+           return [imagen_url, procesada_url]
+       if nombre_resultado is None:
+           nombre_resultado = render_to_cache(ruta_completa, parametros, clave, medicion)
       
+       # el nombre depende del contenido, así que no hace falta ?v= para evitar la caché del navegador
+       procesada_url = result_url(nombre_resultado)
    return [imagen_url, procesada_url]
 
-            
+def render_to_cache(ruta_completa, parametros, clave, medicion=None):
+   """
+   Decodifica (vía caché), procesa y codifica el resultado directamente en
+   la caché de resultados con clave y devuelve su nombre. medicion (opcional)
+   marca las etapas de decodificación, proceso, codificación y escritura.
+   """
+   arr = acciones.imagen_entrada(ruta_completa, parametros, decoded_cache().obtener) # uint8 RGB de solo lectura, se decodifica una vez por sesión
+   if medicion is not None:
+       medicion.marcar('decodificacion')
+   cache = result_cache()
+   extension = salida.extension(parametros.get('salida'))
+   with cache.escribir(clave, extension) as archivo:
+       acciones.codificar(arr, acciones.construir_operaciones(parametros), archivo,
+                          settings.EDITOR_MEGAPIXELES_POR_BANDAS, parametros.get('salida'), medicion,
+                          settings.EDITOR_HILOS_BANDAS)
+   if medicion is not None:
+       medicion.marcar('escritura')
+   return cache.nombre(clave, extension)
+
+def edit_history(request, ruta_original, fs):
+   """
+   Historial de ediciones de la imagen en la sesión del navegador.
+   """
+   if not request.session.session_key:
+       request.session.save() # la sesión solo tiene clave una vez guardada
+   return historial.obtener(request.session.session_key, fs.path(ruta_original.replace('/media/', '')))
+
+def stack_edit(request, ruta_original, fs, parametros):
+   """
+   Agrega la operación al historial de la imagen y muestra el resultado de
+   todas las ediciones hasta ese paso.
+   """
+   registro = historial.agregar(edit_history(request, ruta_original, fs), parametros)
+   return show_history(request, ruta_original, registro)
+
+def show_history(request, ruta_original, registro):
+   request.historial = registro
+   nombre_resultado = historial.renderizar(registro, result_cache(), output_policy(request.POST),
+                                           decoded_cache().obtener, getattr(request, 'medicion', None))
+   return [ruta_original, result_url(nombre_resultado)]
+
+# accion -> desplazamiento en el historial (ir_paso usa el campo 'paso')
+ACCIONES_HISTORIAL = {'deshacer': -1, 'rehacer': 1, 'ir_paso': None}
+
+def history_step(request, imagen_url, procesada_url, fs):
+   """
+   Deshace, rehace o salta a un paso del historial de la imagen actual.
+   """
+   if not imagen_url:
+       return [imagen_url, procesada_url]
+   registro = edit_history(request, imagen_url, fs)
+   desplazamiento = ACCIONES_HISTORIAL[request.POST.get('accion')]
+   if desplazamiento is None:
+       try:
+           posicion = int(request.POST.get('paso'))
+       except (TypeError, ValueError): # paso ausente o no numérico: se queda donde está
+           posicion = registro.posicion
+   else:
+       posicion = registro.posicion + desplazamiento
+   historial.mover(registro, posicion)
+   return show_history(request, imagen_url, registro)
+
+def stream_url(datos):
+   """
+   URL de stream_result para los campos de un formulario. Los campos se
+   ordenan para que la misma edición dé siempre la misma URL (y la caché del
+   navegador o de un CDN la reconozca).
+   """
+   campos = sorted((campo, valor) for campo, valores in datos.lists() for valor in valores # capa_url se repite
+                   if campo != 'csrfmiddlewaretoken')
+   return reverse('stream_result') + '?' + urlencode(campos)
+
+def stream_request(request):
+   """
+   (ruta del original, parametros, clave) de una petición a stream_result, o
+   None si no describe una operación. Se calcula una vez por petición.
+   """
+   if not hasattr(request, 'operacion_directa'):
+       request.operacion_directa = None
+       imagen_url = request.GET.get('imagen_actual')
+       try:
+           parametros = form_parameters(request.GET)
+       except ingesta.ImagenRechazada:
+           raise Http404('Capa no encontrada')
+       if imagen_url and parametros is not None:
+           ruta_completa = FileSystemStorage().path(imagen_url.replace('/media/', ''))
+           parametros['salida'] = output_policy(request.GET)
+           try:
+               clave = result_cache().clave(ruta_completa, parametros)
+           except (FileNotFoundError, IsADirectoryError):
+               raise Http404('Imagen no encontrada')
+           request.operacion_directa = (ruta_completa, parametros, clave)
+   return request.operacion_directa
+
+def stream_etag(request):
+   operacion = stream_request(request)
+   return operacion[2] if operacion else None
+
+def output_policy(datos):
+   return salida.politica(datos, settings.EDITOR_SALIDA)
+
+def result_url(nombre_resultado):
+   return FileSystemStorage().url(f'{settings.EDITOR_CACHE_RESULTADOS["DIRECTORIO"]}/{nombre_resultado}')
+
+def layer_parameters(capa, canal, tipo_grises=None):
+   return {'operacion': 'layer', 'capa': capa, 'canal': canal, 'tipo_grises': tipo_grises or None}
+
+def extract_layer(request, imagen_url, procesada_url, fs, capa, canal, tipo_grises=None):
+   parametros = layer_parameters(capa, canal, tipo_grises)
+   return process_image(request, imagen_url, procesada_url, fs, parametros)
+
+
+# Botones del panel de brillo y contraste, todos aplican la curva completa del formulario
+ACCIONES_CURVA = ('aplicar_brillo', 'aplicar_brillo_R', 'aplicar_brillo_G', 'aplicar_brillo_B',
+                  'aplicar_contraste_logaritmico', 'aplicar_contraste_exponencial')
+
+def curve_from_form(datos):
+   """
+   Construye una sola curva tonal con todos los sliders del panel de brillo y
+   contraste que no estén en su valor neutro (0).
+   """
+   curva = imgPro8.ToneCurve()
+   valor_brillo = float(datos.get('valor_brillo', '0'))
+   if valor_brillo:
+       curva.bright(valor_brillo)
+   for capa, campo in enumerate(('valor_r', 'valor_g', 'valor_b')):
+       valor = float(datos.get(campo, '0'))
+       if valor:
+           curva.bright_layer(valor, capa)
+   valor_log = float(datos.get('valor_logarithmic', '0'))
+   if valor_log:
+       curva.contrast_dark(valor_log)
+   valor_exp = float(datos.get('valor_exponential', '0'))
+   if valor_exp:
+       curva.contrast_light(valor_exp)
+   return curva
+
+def apply_curve(request, imagen_url, procesada_url, fs, curva):
+   parametros = {'operacion': 'curva', 'pasos': curva.pasos}
+   return process_image(request, imagen_url, procesada_url, fs, parametros)
+
+def rotation_parameters(datos):
+   """
+   Parámetros de la rotación. Un ángulo que no es un número finito vale 0 y
+   una interpolación desconocida usa bilinear.
+   """
+   angulo = form_number(datos.get('angulo')) or 0.0
+   interpolacion = datos.get('interpolacion')
+   if interpolacion not in rotacion.INTERPOLACIONES:
+       interpolacion = 'bilinear'
+   expandir = datos.get('recortar') is None # por defecto el lienzo crece para no perder las esquinas
+   return {'operacion': 'rotar', 'angulo': angulo, 'interpolacion': interpolacion, 'expandir': expandir}
+
+def rotate_image(request, imagen_url, procesada_url, fs):
+   parametros = rotation_parameters(request.POST)
+   return process_image(request, imagen_url, procesada_url, fs, parametros)
+
+# Ajustes automáticos por histograma: accion -> (operación, modo por defecto)
+ACCIONES_NIVELES = {
+   'auto_niveles': ('auto_niveles', 'canales'),
+   'ecualizar': ('ecualizar', 'luminancia'),
+   'clahe': ('clahe', 'luminancia'),
+}
+
+def levels_parameters(datos):
+   """
+   Parámetros de auto niveles, ecualización o CLAHE. Un modo desconocido usa
+   el de la operación; un valor que no es un número, el de por defecto, y uno
+   fuera de rango se lleva al límite más cercano.
+   """
+   operacion, modo = ACCIONES_NIVELES[datos.get('accion')]
+   if datos.get('modo_niveles') in niveles.MODOS:
+       modo = datos.get('modo_niveles')
+   if operacion == 'auto_niveles':
+       recorte = form_number(datos.get('recorte_niveles')) # % de píxeles que se saturan en cada extremo
+       recorte = 0.5 if recorte is None else min(max(recorte, 0), 49)
+       return {'operacion': operacion, 'bajo': recorte, 'alto': 100 - recorte, 'modo': modo}
+   if operacion == 'ecualizar':
+       return {'operacion': operacion, 'modo': modo}
+   mosaicos = form_number(datos.get('mosaicos_clahe'))
+   limite = form_number(datos.get('limite_clahe'))
+   mosaicos = 8 if mosaicos is None else min(max(round(mosaicos), 1), niveles.MOSAICOS_MAXIMOS)
+   return {'operacion': operacion, 'mosaicos': mosaicos, 'limite': 2.0 if limite is None else max(limite, 1)}
+
+def adjust_levels(request, imagen_url, procesada_url, fs):
+   parametros = levels_parameters(request.POST)
+   return process_image(request, imagen_url, procesada_url, fs, parametros)
+
+# Intensidad máxima aceptada desde el formulario (sigma o radio en píxeles)
+INTENSIDAD_FILTRO_MAXIMA = 25
+
+def form_number(valor):
+   """
+   Campo del formulario como float finito, o None si falta, no es un número
+   o es nan/inf.
+   """
+   try:
+       numero = float(valor)
+   except (TypeError, ValueError):
+       return None
+   return numero if math.isfinite(numero) else None
+
+def filter_parameters(datos):
+   """
+   Parámetros del panel de filtros. intensidad_filtro es sigma en el
+   desenfoque gaussiano y la máscara de enfoque, y el radio en el desenfoque
+   de caja y la mediana (como mucho filtros.RADIO_MEDIANA_MAXIMO); un filtro
+   desconocido se toma como gaussiano y un valor que no es un número, como el
+   de por defecto.
+   """
+   nombre = datos.get('filtro') if datos.get('filtro') in filtros.PARAMETROS else 'gaussian_blur'
+   parametros = {'operacion': 'filtro', 'filtro': nombre}
+   intensidad = form_number(datos.get('intensidad_filtro'))
+   if filtros.PARAMETROS[nombre] and intensidad is not None:
+       campo = filtros.PARAMETROS[nombre][0][0]
+       maximo = filtros.RADIO_MEDIANA_MAXIMO if nombre == 'median' else INTENSIDAD_FILTRO_MAXIMA
+       intensidad = min(intensidad, maximo)
+       parametros[campo] = max(1, round(intensidad)) if campo == 'radio' else max(intensidad, 0.1)
+   if nombre == 'unsharp_mask':
+       cantidad = form_number(datos.get('cantidad_filtro'))
+       parametros['cantidad'] = 1.0 if cantidad is None else cantidad
+   return parametros
+
+def apply_filter(request, imagen_url, procesada_url, fs):
+   parametros = filter_parameters(request.POST)
+   return process_image(request, imagen_url, procesada_url, fs, parametros)
+
+def uploaded_path(url, fs):
+   """
+   Ruta en el almacenamiento de la URL de /media/ de una imagen subida (con su
+   fila Archivo, así que pasó por la ingesta). Lanza ingesta.ImagenRechazada
+   si la URL no es de una subida o el archivo ya no existe.
+   """
+   nombre = url[len(settings.MEDIA_URL):] if isinstance(url, str) and url.startswith(settings.MEDIA_URL) else None
+   if not nombre or not Archivo.objects.filter(nombre=nombre).exists():
+       raise ingesta.ImagenRechazada(f'{url} no es una imagen subida.')
+   ruta = fs.path(nombre)
+   if not os.path.isfile(ruta):
+       raise ingesta.ImagenRechazada(f'{url} ya no está disponible; vuelve a subirla.')
+   return ruta
+
+def layer_sources(capas, fs):
+   """
+   Convierte las URLs de /media/ de las capas de una composición (imagen y
+   máscara) en rutas del almacenamiento y agrega el sha256 de cada archivo,
+   así que la clave de caché cambia si cambia el contenido de una capa. Solo
+   se aceptan imágenes subidas (ver uploaded_path).
+   """
+   cache = result_cache()
+   resueltas = []
+   for capa in composicion.validar_capas(capas):
+       capa = dict(capa, imagen=uploaded_path(capa['imagen'], fs))
+       capa['contenido'] = cache.hash_contenido(capa['imagen'])
+       if capa['mascara']:
+           capa['mascara'] = uploaded_path(capa['mascara'], fs)
+           capa['contenido_mascara'] = cache.hash_contenido(capa['mascara'])
+       resueltas.append(capa)
+   return resueltas
+
+def merge_parameters(datos):
+   """
+   Parámetros de la composición de las imágenes subidas (campos capa_url,
+   ya guardadas) sobre la imagen actual, o None si no hay capas. peso_fusion
+   es la opacidad de cada capa; con mezcla_fusion=promedio es su peso en la
+   media y la imagen actual pesa 1 - peso_fusion, como fusion_images_ecualized.
+   Lanza ingesta.ImagenRechazada si una capa no es una imagen subida.
+   """
+   urls = datos.getlist('capa_url')
+   if not urls:
+       return None
+   modo = datos.get('modo_fusion') if datos.get('modo_fusion') in composicion.MODOS else 'normal'
+   peso = form_number(datos.get('peso_fusion'))
+   peso = 0.5 if peso is None else min(max(peso, 0), 1)
+   mezcla = 'promedio' if datos.get('mezcla_fusion') == 'promedio' else 'capas'
+   capas = [{'imagen': url, 'peso': peso, 'modo': modo, 'mascara': datos.get('mascara_url') or None} for url in urls]
+   return {'operacion': 'componer', 'capas': layer_sources(capas, FileSystemStorage()), 'mezcla': mezcla,
+           'peso_base': 1 - peso if mezcla == 'promedio' else 1.0}
+
+def merge_images(request, imagen_url, procesada_url, fs):
+   """
+   Guarda las capas (campo capas, varios archivos) y la máscara subidas y las
+   compone sobre la imagen actual. Las URLs guardadas quedan en request.POST
+   como capa_url y mascara_url para que la respuesta directa las repita.
+   Una subida rechazada por la ingesta queda en request.error_subida.
+   """
+   datos = request.POST.copy()
+   try:
+       for capa in request.FILES.getlist('capas'):
+           datos.appendlist('capa_url', fs.url(subidas.guardar(fs, capa, piramide=False)))
+       if request.FILES.get('mascara'):
+           datos['mascara_url'] = fs.url(subidas.guardar(fs, request.FILES['mascara'], piramide=False))
+       parametros = merge_parameters(datos)
+   except ingesta.ImagenRechazada as error: # subida rechazada o capa_url que no es una subida
+       request.error_subida = str(error)
+       return [imagen_url, procesada_url]
+   request.POST = datos
+   if parametros is None:
+       return [imagen_url, procesada_url]
+   return process_image(request, imagen_url, procesada_url, fs, parametros)
+
+# accion -> (capa, canal) de las extracciones de capa
+ACCIONES_CAPA = {
+   'extract_R': (0, "rgb"), 'extract_G': (1, "rgb"), 'extract_B': (2, "rgb"),
+   'extract_C': (0, "cmy"), 'extract_M': (1, "cmy"), 'extract_Y': (2, "cmy"),
+}
+
+def form_parameters(datos):
+   """
+   Parámetros de la operación pedida por un formulario, o None si la acción no
+   procesa la imagen. Es la misma correspondencia que recorre index. Lanza
+   ingesta.ImagenRechazada si las capas de una composición no son subidas.
+   """
+   accion = datos.get('accion')
+   if accion in ACCIONES_CAPA:
+       return layer_parameters(*ACCIONES_CAPA[accion])
+   if accion == 'negativo':
+       return layer_parameters(None, None)
+   if accion == 'grayscale':
+       return layer_parameters(None, None, datos.get('tipo_grises'))
+   if accion == 'rotar':
+       return rotation_parameters(datos)
+   if accion in ACCIONES_CURVA:
+       return {'operacion': 'curva', 'pasos': curve_from_form(datos).pasos}
+   if accion in ACCIONES_NIVELES:
+       return levels_parameters(datos)
+   if accion == 'filtrar':
+       return filter_parameters(datos)
+   if accion == 'fusionar':
+       return merge_parameters(datos)
+   return None
+
+# acciones de index que no están en ACCIONES_CAPA, ACCIONES_CURVA, ACCIONES_NIVELES ni ACCIONES_HISTORIAL
+ACCIONES_SUELTAS = ('negativo', 'grayscale', 'rotar', 'filtrar', 'fusionar')
+
+def metrics_action(datos, archivos):
+   """
+   Etiqueta de acción de la medición de una petición: 'subir', una acción
+   conocida de index, None si no hay acción u 'otra' para cualquier otro
+   valor, para que el cliente no pueda crear series de métricas a voluntad.
+   """
+   if archivos.get('imagen'):
+       return 'subir'
+   accion = datos.get('accion')
+   if not accion:
+       return None
+   if (accion in ACCIONES_CAPA or accion in ACCIONES_CURVA or accion in ACCIONES_NIVELES
+           or accion in ACCIONES_HISTORIAL or accion in ACCIONES_SUELTAS):
+       return accion
+   return 'otra'
+
+_ejecutor_async = None
+
+def async_executor():
+   """
+   Hilos donde index_async ejecuta el trabajo de CPU; NumPy y los códecs de
+   PIL liberan el GIL, así que varias peticiones avanzan en paralelo.
+   """
+   global _ejecutor_async
+   if _ejecutor_async is None:
+       _ejecutor_async = ThreadPoolExecutor(settings.EDITOR_ASYNC_HILOS, thread_name_prefix='editor')
+   return _ejecutor_async
+
+async def index_async(request):
+   """
+   Variante asíncrona de index para el punto de entrada ASGI. Atiende el
+   formulario con la misma vista index (subidas, acciones, composición,
+   historial, 'apilar' y 'asincrono'), pero en un hilo de async_executor: la
+   lectura del formulario, los parámetros (una composición lee sus capas para
+   calcular el hash), el disco, la decodificación, el procesamiento, la
+   codificación y el render quedan fuera del bucle de eventos, que sigue
+   atendiendo otras subidas y ediciones mientras tanto.
+   """
+   return await asyncio.get_running_loop().run_in_executor(async_executor(), index_in_thread, request)
+
+def index_in_thread(request):
+   try:
+       return index(request)
+   finally:
+       connection.close() # la conexión es del hilo del ejecutor, fuera del ciclo de la petición
+
+@require_POST
+def preview(request):
+   """
+   Vista previa de la acción del formulario sobre el proxy reducido de la
+   imagen actual, como JPEG (o WebP con formato=webp). No pasa por la caché de
+   resultados ni escribe en disco; la cabecera Server-Timing detalla cada etapa.
+   """
+   try:
+       parametros = form_parameters(request.POST)
+   except ingesta.ImagenRechazada as error:
+       return JsonResponse({'error': str(error)}, status=400)
+   imagen_url = request.POST.get('imagen_actual')
+   if parametros is None or not imagen_url:
+       return JsonResponse({'error': 'Se necesitan imagen_actual y una accion que procese la imagen.'}, status=400)
+   config = settings.EDITOR_VISTA_PREVIA
+   formato = previa.FORMATOS.get(request.POST.get('formato', 'jpeg'), 'JPEG')
+
+   cronometro = previa.Cronometro()
+   try:
+       proxy = proxy_cache().obtener(FileSystemStorage().path(imagen_url.replace('/media/', '')))
+   except (FileNotFoundError, IsADirectoryError): # imagen_actual borrada (limpiar_media) o que no es un archivo
+       raise Http404('Imagen no encontrada')
+   cronometro.marcar('proxy')
+   img = bloques.procesar_completa(proxy, acciones.construir_operaciones(parametros))
+   cronometro.marcar('proceso')
+   datos = previa.codificar(img, formato, config['CALIDAD'])
+   cronometro.marcar('codificacion')
+   preview_latencies().registrar(cronometro)
+
+   respuesta = HttpResponse(datos, content_type=f'image/{formato.lower()}')
+   respuesta['Server-Timing'] = cronometro.server_timing()
+   respuesta['Cache-Control'] = 'no-store'
+   return respuesta
+
+@require_safe
+@condition(etag_func=stream_etag)
+def stream_result(request):
+   """
+   Procesa la imagen y envía el resultado codificado en la misma respuesta,
+   sin escribirlo en MEDIA_ROOT. Los campos son los del formulario (en la URL).
+
+   El ETag es la clave del resultado (hash del original y de los parámetros),
+   así que una petición condicional con If-None-Match recibe 304 sin decodificar
+   ni procesar. Si el resultado ya está en la caché de resultados se envía
+   desde ahí; si no, se codifica banda a banda a medida que se envía.
+   """
+   operacion = stream_request(request)
+   if operacion is None:
+       return JsonResponse({'error': 'Se necesitan imagen_actual y una accion que procese la imagen.'}, status=400)
+   ruta_completa, parametros, clave = operacion
+   tipo = salida.tipo_contenido(parametros['salida'])
+
+   datos = result_cache().leer(clave, salida.extension(parametros['salida']))
+   if datos is not None:
+       respuesta = HttpResponse(datos, content_type=tipo)
+   else:
+       formato, opciones = salida.opciones(parametros['salida'])
+       arr = acciones.imagen_entrada(ruta_completa, parametros, decoded_cache().obtener)
+       respuesta = StreamingHttpResponse(
+           bloques.trozos(arr, acciones.construir_operaciones(parametros), formato,
+                          hilos=settings.EDITOR_HILOS_BANDAS, **opciones), content_type=tipo)
+   patch_cache_control(respuesta, public=True, max_age=settings.EDITOR_RESPUESTA_DIRECTA['MAX_AGE'])
+   return respuesta
+
+def stats_request(request):
+   """
+   (ruta del original, operación, clave) de una petición a image_stats, o None
+   si falta la imagen. Sin 'accion' la operación es None (histograma del original).
+   """
+   if not hasattr(request, 'operacion_estadisticas'):
+       request.operacion_estadisticas = None
+       imagen_url = request.GET.get('imagen_actual')
+       if imagen_url:
+           ruta_completa = FileSystemStorage().path(imagen_url.replace('/media/', ''))
+           try:
+               parametros = form_parameters(request.GET)
+           except ingesta.ImagenRechazada:
+               raise Http404('Capa no encontrada')
+           try:
+               clave = result_cache().clave(ruta_completa, {'operacion': 'histograma', 'de': parametros})
+           except (FileNotFoundError, IsADirectoryError):
+               raise Http404('Imagen no encontrada')
+           request.operacion_estadisticas = (ruta_completa, parametros, clave)
+   return request.operacion_estadisticas
+
+def stats_etag(request):
+   operacion = stats_request(request)
+   return operacion[2] if operacion else None
+
+@require_safe
+@condition(etag_func=stats_etag)
+def image_stats(request):
+   """
+   Histogramas (r, g, b y luminancia) con mínimo, máximo, media, desviación
+   y percentiles de la imagen actual, o del resultado de la acción indicada
+   con los mismos campos del formulario, en JSON para que el navegador los dibuje.
+   """
+   operacion = stats_request(request)
+   if operacion is None:
+       return JsonResponse({'error': 'Se necesita imagen_actual.'}, status=400)
+   ruta_completa, parametros, _ = operacion
+   arr = decoded_cache().obtener(ruta_completa)
+   operaciones = acciones.construir_operaciones(parametros) if parametros is not None else []
+   respuesta = JsonResponse({'canales': histograma.estadisticas(arr, operaciones)})
+   patch_cache_control(respuesta, public=True, max_age=settings.EDITOR_RESPUESTA_DIRECTA['MAX_AGE'])
+   return respuesta
+
+def cache_stats(request):
+   """
+   Contadores de aciertos, fallos y desalojos de la caché de resultados, de
+   la caché de imágenes decodificadas (y de sus copias crudas) y de la de
+   proxies, más las latencias de la vista previa.
+   """
+   datos = result_cache().estadisticas()
+   datos['decodificadas'] = decoded_cache().estadisticas()
+   datos['crudos'] = raw_cache().estadisticas()
+   datos['proxies'] = proxy_cache().estadisticas()
+   datos['vista_previa'] = preview_latencies().estadisticas()
+   return JsonResponse(datos)
+
+@require_safe
+def metrics(request):
+   """
+   Métricas por acción y etapa en el formato de texto de Prometheus, solo
+   para las direcciones de EDITOR_METRICAS['IPS'].
+   """
+   if request.META.get('REMOTE_ADDR') not in settings.EDITOR_METRICAS['IPS']:
+       raise Http404()
+   return HttpResponse(edit_metrics().texto(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def index(request):
    imagen_url = request.POST.get('imagen_actual') if request.method == 'POST' else None # obtiene la imagen actual si es POST
    procesada_url = None
-   fs = FileSystemStorage()  # usa MEDIA_ROOT y MEDIA_URL automáticamente, están definidos en settings.py
+   fs = default_storage  # usa MEDIA_ROOT y MEDIA_URL automáticamente, están definidos en settings.py (STORAGES guarda por contenido)
+   request.medicion = edit_metrics().iniciar(metrics_action(request.POST, request.FILES))
+   if imagen_url:
+       almacenamiento.registrar_uso(imagen_url.replace('/media/', '')) # para limpiar_media, que borra lo no usado
   
    # subir una imagen
    if request.method == 'POST' and request.FILES.get('imagen'): # comprueba si contiene un archivo con clave imagen
        imagen = request.FILES['imagen'] # obtiene el archivo subido
-       nombre_archivo = fs.save(imagen.name, imagen) # guarda el archivo en el almacenamiento (MEDIA_ROOT) y devuelve el nombre de guardado
-       imagen_url = fs.url(nombre_archivo)  # genera /media/nombre.png
+       try:
+           nombre_archivo = subidas.guardar(fs, imagen) # valida la cabecera, guarda el archivo en el almacenamiento (MEDIA_ROOT) y devuelve el nombre de guardado
+           imagen_url = fs.url(nombre_archivo)  # genera /media/nombre.png
+       except ingesta.ImagenRechazada as error:
+           request.error_subida = str(error)
+       request.medicion.marcar('subida')
           
    #=====RGB=======
    # EXTRACT R
@@ -119,29 +751,143 @@ def index(request):
        imagen_url = result[0]
        procesada_url = result[1]
        
-   elif request.method == 'POST' and request.POST.get('accion') == 'aplicar_brillo':
-    ruta_original = request.POST.get('imagen_actual')
-    if ruta_original:
-        ruta_completa = fs.path(ruta_original.replace('/media/', ''))
-        img = Image.open(ruta_completa).convert('RGB')
-        arr = np.array(img) / 255.0
-        valor_brillo = float(request.POST.get('valor_brillo', '0'))
-        arr_mod = imgPro.bright(arr, valor_brillo)
-        arr_mod = np.clip(arr_mod, 0, 1)
-        procesada = Image.fromarray((arr_mod * 255).astype(np.uint8), mode="RGB")
-        buffer = BytesIO()
-        procesada.save(buffer, format='PNG')
-        buffer.seek(0)
-        # nombre_resultado = f'brillo_{ruta_original.split("/")[-1]}'
-        nombre_resultado = f'brillo_{uuid.uuid4().hex}_{ruta_original.split("/")[-1]}'
-        fs.save(nombre_resultado, ContentFile(buffer.read()))
-        buffer.close()
-        imagen_url = ruta_original  # Siempre apunta a la original para más operaciones
-        # procesada_url = fs.url(nombre_resultado)
-        procesada_url = fs.url(nombre_resultado) + '?v=' + str(int(time.time())) # Añade un query string para evitar caché
+   #=====ROTACION=======
+   elif request.method == 'POST' and request.POST.get('accion') == 'rotar':
+       result = rotate_image(request, imagen_url, procesada_url, fs)
+       imagen_url = result[0]
+       procesada_url = result[1]
+       
+   #=====BRILLO Y CONTRASTE=======
+   elif request.method == 'POST' and request.POST.get('accion') in ACCIONES_CURVA:
+       curva = curve_from_form(request.POST)
+       result = apply_curve(request, imagen_url, procesada_url, fs, curva)
+       imagen_url = result[0]
+       procesada_url = result[1]
+
+   #=====AJUSTES AUTOMATICOS=======
+   elif request.method == 'POST' and request.POST.get('accion') in ACCIONES_NIVELES:
+       result = adjust_levels(request, imagen_url, procesada_url, fs)
+       imagen_url = result[0]
+       procesada_url = result[1]
+
+   #=====FILTROS=======
+   elif request.method == 'POST' and request.POST.get('accion') == 'filtrar':
+       result = apply_filter(request, imagen_url, procesada_url, fs)
+       imagen_url = result[0]
+       procesada_url = result[1]
+
+   #=====FUSION DE IMAGENES=======
+   elif request.method == 'POST' and request.POST.get('accion') == 'fusionar':
+       result = merge_images(request, imagen_url, procesada_url, fs)
+       imagen_url = result[0]
+       procesada_url = result[1]
+
+   #=====HISTORIAL=======
+   elif request.method == 'POST' and request.POST.get('accion') in ACCIONES_HISTORIAL:
+       result = history_step(request, imagen_url, procesada_url, fs)
+       imagen_url = result[0]
+       procesada_url = result[1]
        
+   edit_metrics().registrar(request.medicion)
    context = {
        'imagen_url': imagen_url,
-       'procesada_url': procesada_url
+       'procesada_url': procesada_url,
+       'trabajo': getattr(request, 'trabajo', None), # trabajo en segundo plano, si se pidió 'asincrono'
+       'historial': getattr(request, 'historial', None), # ediciones apiladas, si se pidió 'apilar'
+       'error': getattr(request, 'error_subida', None) or subidas.rechazo(request), # subida rechazada por la ingesta
+       'radio_mediana_maximo': filtros.RADIO_MEDIANA_MAXIMO,
    }
    return render(request, 'index.html', context)
+
+def job_status(request, trabajo_id):
+   """
+   Estado de un trabajo en segundo plano, para que el navegador lo consulte.
+   """
+   trabajo = get_object_or_404(Trabajo, pk=trabajo_id)
+   return JsonResponse(job_json(trabajo))
+
+def job_json(trabajo):
+   return {
+       'id': str(trabajo.id),
+       'estado': trabajo.estado,
+       'procesada_url': result_url(trabajo.resultado) if trabajo.estado == Trabajo.TERMINADO else None,
+       'error': trabajo.error or None,
+   }
+
+@require_POST
+def batch(request):
+   """
+   Aplica una receta JSON (campo 'receta') a todas las imágenes subidas en el
+   campo 'imagenes'. Cada imagen es un trabajo del pool de procesos, así que
+   el lote se reparte entre los núcleos; el progreso se consulta en /lote/<id>/.
+   Las capas de los pasos fusion_images se indican con URLs de /media/.
+   """
+   fs = default_storage
+   try:
+       pasos = acciones.validar_receta(json.loads(request.POST.get('receta', '')))
+       for paso in pasos:
+           if paso['op'] == 'fusion_images':
+               paso['capas'] = layer_sources(paso['capas'], fs)
+   except (ValueError, OSError, SuspiciousFileOperation) as error: # incluye JSONDecodeError
+       return JsonResponse({'error': f'Receta inválida: {error}'}, status=400)
+   imagenes = request.FILES.getlist('imagenes')
+   cortadas = getattr(request, 'subidas_rechazadas', []) # descartadas por LimiteSubida mientras llegaban
+   if not imagenes and not cortadas:
+       return JsonResponse({'error': 'No se subió ninguna imagen en el campo imagenes.'}, status=400)
+
+   cache = result_cache()
+   parametros = {'operacion': 'receta', 'pasos': pasos, 'salida': output_policy(request.POST)}
+   lote = uuid.uuid4()
+   lista = []
+   for imagen in imagenes:
+       try:
+           ruta_completa = fs.path(subidas.guardar(fs, imagen))
+       except ingesta.ImagenRechazada as error: # queda como trabajo fallido, el resto del lote sigue
+           lista.append(dict(job_json(rejected_job(imagen.name, parametros, lote, str(error))), archivo=imagen.name))
+           continue
+       clave = cache.clave(ruta_completa, parametros)
+       nombre_resultado = cache.buscar(clave, salida.extension(parametros['salida']))
+       if nombre_resultado is None:
+           trabajo = trabajos.cola(cache).encolar(ruta_completa, parametros, clave, lote)
+       else:
+           trabajo = Trabajo.objects.create(ruta_original=ruta_completa, parametros=parametros, clave=clave,
+                                            lote=lote, estado=Trabajo.TERMINADO, resultado=nombre_resultado)
+       lista.append(dict(job_json(trabajo), archivo=imagen.name))
+   for nombre in cortadas:
+       lista.append(dict(job_json(rejected_job(nombre, parametros, lote, subidas.rechazo(request))), archivo=nombre))
+   return JsonResponse({'lote': str(lote), 'estado_url': reverse('batch_status', args=[lote]), 'trabajos': lista},
+                       status=202)
+
+def rejected_job(nombre, parametros, lote, error):
+   """
+   Trabajo fallido de un lote para una imagen que la ingesta rechazó.
+   """
+   return Trabajo.objects.create(ruta_original=nombre, parametros=parametros, clave='', lote=lote,
+                                 estado=Trabajo.ERROR, error=error)
+
+def batch_status(request, lote_id):
+   """
+   Progreso de un lote: cuántos trabajos terminaron, fallaron o siguen en curso.
+   """
+   lista = list(Trabajo.objects.filter(lote=lote_id).order_by('creado'))
+   if not lista:
+       raise Http404('Lote no encontrado')
+   estados = [trabajo.estado for trabajo in lista]
+   return JsonResponse({
+       'lote': str(lote_id),
+       'total': len(lista),
+       'terminados': estados.count(Trabajo.TERMINADO),
+       'errores': estados.count(Trabajo.ERROR),
+       'trabajos': [job_json(trabajo) for trabajo in lista],
+   })
+
+def job_result(request, trabajo_id):
+   """
+   Redirige a la imagen procesada de un trabajo terminado; 202 si sigue en curso.
+   """
+   trabajo = get_object_or_404(Trabajo, pk=trabajo_id)
+   if trabajo.estado == Trabajo.TERMINADO:
+       return redirect(result_url(trabajo.resultado))
+   if trabajo.estado == Trabajo.ERROR:
+       return JsonResponse({'estado': trabajo.estado, 'error': trabajo.error}, status=500)
+   return JsonResponse({'estado': trabajo.estado}, status=202)
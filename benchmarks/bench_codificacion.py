@@ -0,0 +1,79 @@
+"""
+Tabla de tiempo de codificación y bytes por formato de salida.
+
+Codifica tres imágenes sintéticas representativas (una foto con degradados
+suaves y grano, ruido puro y un gráfico de colores planos) con cada política
+de app_editor/utils/salida.py, a través de acciones.codificar como lo hacen
+las vistas, y muestra tiempo, tamaño y relación con los bytes sin comprimir.
+
+Uso:
+    python benchmarks/bench_codificacion.py [--ancho 4000] [--alto 3000] [--repeticiones 3]
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_editor.utils import acciones  # noqa: E402
+
+POLITICAS = [
+    {'formato': 'png', 'compresion': 1},
+    {'formato': 'png', 'compresion': 6},
+    {'formato': 'png', 'compresion': 9},
+    {'formato': 'jpeg', 'calidad': 75},
+    {'formato': 'jpeg', 'calidad': 90},
+    {'formato': 'webp', 'calidad': 80},
+    {'formato': 'raw'},
+]
+
+
+def imagenes(alto, ancho):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:alto, 0:ancho].astype(np.float32)
+    foto = np.stack((128 + 100 * np.sin(x / 400), 128 + 100 * np.cos(y / 300), 255 * x / ancho), axis=-1)
+    foto += rng.normal(0, 6, foto.shape)
+    grafico = np.zeros((alto, ancho, 3), dtype=np.uint8)
+    for _ in range(40):
+        y0, x0 = rng.integers(0, alto), rng.integers(0, ancho)
+        grafico[y0:y0 + alto // 4, x0:x0 + ancho // 4] = rng.integers(0, 256, 3)
+    return [
+        ('foto', np.clip(foto, 0, 255).astype(np.uint8)),
+        ('ruido', rng.integers(0, 256, (alto, ancho, 3), dtype=np.uint8)),
+        ('grafico', grafico),
+    ]
+
+def nombre(politica):
+    return ' '.join(str(valor) for valor in politica.values())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ancho', type=int, default=4000)
+    parser.add_argument('--alto', type=int, default=3000)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--megapixeles-bandas', type=float, default=16,
+                        help='umbral de codificación por bandas, como EDITOR_MEGAPIXELES_POR_BANDAS')
+    args = parser.parse_args()
+
+    print(f"Imágenes de {args.ancho}x{args.alto} ({args.ancho * args.alto / 1e6:.1f} MP)")
+    print(f"{'imagen':<10}{'salida':<14}{'ms':>9}{'MB/s':>8}{'KB':>10}{'ratio':>8}")
+    for nombre_imagen, img in imagenes(args.alto, args.ancho):
+        for politica in POLITICAS:
+            tiempos = []
+            for _ in range(args.repeticiones):
+                archivo = io.BytesIO()
+                inicio = time.perf_counter()
+                acciones.codificar(img, [], archivo, args.megapixeles_bandas, politica)
+                tiempos.append(time.perf_counter() - inicio)
+            t = min(tiempos)
+            tamano = len(archivo.getvalue())
+            print(f"{nombre_imagen:<10}{nombre(politica):<14}{t * 1e3:>9.0f}{img.nbytes / 2**20 / t:>8.0f}"
+                  f"{tamano / 1024:>10.0f}{img.nbytes / tamano:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
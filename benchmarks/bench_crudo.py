@@ -0,0 +1,92 @@
+"""
+Tiempo de reabrir una imagen intermedia según cómo está guardada.
+
+Guarda una imagen sintética como PNG (compresión 1 y 6), como .npy y en el
+formato crudo de app_editor/utils/crudo.py (por filas y por teselas) y mide
+abrirla como arreglo uint8 (decodificar el PNG; mapear el .npy o el crudo
+sin leer los píxeles), recorrerla entera una vez abierta y leer una región
+de 512x512 del centro. Los archivos se leen con la caché de páginas ya
+caliente, como los vuelve a abrir el servidor.
+
+Uso:
+    python benchmarks/bench_crudo.py [--ancho 6000] [--alto 4000] [--repeticiones 5] [--tesela 256]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_editor.utils import crudo, decodificadas  # noqa: E402
+
+
+def imagen(alto, ancho):
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 20, ancho, dtype=np.float32)
+    img = np.empty((alto, ancho, 3), dtype=np.uint8)
+    for fila in range(0, alto, 512):
+        filas = np.arange(fila, min(fila + 512, alto), dtype=np.float32)[:, np.newaxis, np.newaxis]
+        banda = 128 + 100 * np.sin(x[:, np.newaxis] + filas / 300 + np.arange(3, dtype=np.float32))
+        img[fila:fila + 512] = np.clip(banda + rng.normal(0, 6, banda.shape), 0, 255)
+    return img
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ancho', type=int, default=6000)
+    parser.add_argument('--alto', type=int, default=4000)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--tesela', type=int, default=256)
+    args = parser.parse_args()
+
+    img = imagen(args.alto, args.ancho)
+    y0, x0 = args.alto // 2 - 256, args.ancho // 2 - 256
+    with tempfile.TemporaryDirectory() as directorio:
+        rutas = {nombre: os.path.join(directorio, nombre) for nombre in
+                 ('png1.png', 'png6.png', 'npy.npy', 'crudo.raw', 'teselas.raw')}
+        Image.fromarray(img).save(rutas['png1.png'], compress_level=1)
+        Image.fromarray(img).save(rutas['png6.png'], compress_level=6)
+        np.save(rutas['npy.npy'], img)
+        with open(rutas['crudo.raw'], 'wb') as archivo:
+            crudo.escribir(archivo, img)
+        with open(rutas['teselas.raw'], 'wb') as archivo:
+            crudo.escribir(archivo, img, args.tesela)
+
+        abrir = {
+            'png1.png': decodificadas.decodificar,
+            'png6.png': decodificadas.decodificar,
+            'npy.npy': lambda ruta: np.load(ruta, mmap_mode='r'),
+            'crudo.raw': crudo.abrir,
+            'teselas.raw': crudo.abrir,
+        }
+        print(f"Imagen de {args.ancho}x{args.alto} ({args.ancho * args.alto / 1e6:.1f} MP)")
+        print(f"{'archivo':<14}{'MB':>8}{'abrir ms':>12}{'recorrer ms':>13}{'región ms':>11}")
+        for nombre, ruta in rutas.items():
+            funcion = abrir[nombre]
+            arr = funcion(ruta) # calienta la caché de páginas
+            assert np.array_equal(arr[::97, ::89], img[::97, ::89])
+            t_abrir = medir(lambda: funcion(ruta), args.repeticiones)
+            t_recorrer = medir(lambda: int(funcion(ruta).sum(dtype=np.uint64)), args.repeticiones)
+            if nombre == 'teselas.raw':
+                t_region = medir(lambda: crudo.region(ruta, y0, y0 + 512, x0, x0 + 512), args.repeticiones)
+            else:
+                t_region = medir(lambda: np.array(funcion(ruta)[y0:y0 + 512, x0:x0 + 512]), args.repeticiones)
+            print(f"{nombre:<14}{os.path.getsize(ruta) / 1e6:>8.1f}{t_abrir * 1e3:>12.3f}"
+                  f"{t_recorrer * 1e3:>13.1f}{t_region * 1e3:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
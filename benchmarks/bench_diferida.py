@@ -0,0 +1,84 @@
+"""
+Compara una edición de varios pasos ejecutada paso a paso (una copia completa
+por función de imgPro8) con la misma edición evaluada en diferido.
+
+Para cada receta mide el tiempo y el pico de memoria reservado por NumPy de
+los dos caminos y verifica que los resultados sean idénticos.
+
+Uso:
+    python benchmarks/bench_diferida.py [--ancho 6000] [--alto 4000] [--repeticiones 3]
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_editor.utils import imgPro8  # noqa: E402
+from app_editor.utils.diferida import ImagenDiferida  # noqa: E402
+
+# (nombre, pasos): cada paso es (método, argumentos), igual en imgPro8 y en ImagenDiferida
+RECETAS = [
+    ('tonos (5 pasos)', [('bright', (0.1,)), ('contrast_dark', (1.3,)), ('bright_layer', (-0.05, 2)),
+                         ('contrast_light', (0.9,)), ('reverse', ())]),
+    ('grises+tonos', [('luminosity', ()), ('bright', (0.1,)), ('contrast_dark', (1.5,)),
+                      ('reverse', ()), ('binarize', (0.5,))]),
+    ('tonos+recorte', [('bright', (0.1,)), ('midgray', ()), ('contrast_light', (0.8,)),
+                       ('crop', (1000, 1000, 3000, 2500)), ('reverse', ())]),
+    ('tonos+reduccion', [('average', ()), ('bright', (0.2,)), ('contrast_dark', (1.2,)),
+                         ('lower_resolution', (4, 'nearest')), ('reverse', ())]),
+]
+
+
+def paso_a_paso(img, pasos):
+    for nombre, argumentos in pasos:
+        img = getattr(imgPro8, nombre)(img, *argumentos)
+    if img.dtype == np.bool_:
+        img = img.astype(np.uint8) * 255
+    return img
+
+def diferido(img, pasos):
+    imagen = ImagenDiferida(img)
+    for nombre, argumentos in pasos:
+        imagen = getattr(imagen, nombre)(*argumentos)
+    return imagen.evaluar()
+
+def medir(camino, img, pasos, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = camino(img, pasos)
+        tiempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    camino(img, pasos)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, min(tiempos), pico
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ancho', type=int, default=6000)
+    parser.add_argument('--alto', type=int, default=4000)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (args.alto, args.ancho, 3), dtype=np.uint8)
+    img.setflags(write=False)
+
+    print(f"Imagen {args.ancho}x{args.alto} ({args.ancho * args.alto / 1e6:.1f} MP)")
+    print(f"{'receta':<18}{'pasos ms':>10}{'dif. ms':>10}{'x':>7}{'pasos MB':>10}{'dif. MB':>10}{'igual':>7}")
+    for nombre, pasos in RECETAS:
+        ref, t_p, m_p = medir(paso_a_paso, img, pasos, args.repeticiones)
+        res, t_d, m_d = medir(diferido, img, pasos, args.repeticiones)
+        igual = ref.shape == res.shape and bool(np.array_equal(ref, res))
+        print(f"{nombre:<18}{t_p * 1e3:>10.1f}{t_d * 1e3:>10.1f}{t_p / t_d:>7.1f}"
+              f"{m_p / 2**20:>10.1f}{m_d / 2**20:>10.1f}{'si' if igual else 'NO':>7}")
+
+
+if __name__ == '__main__':
+    main()
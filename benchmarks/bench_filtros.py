@@ -0,0 +1,88 @@
+"""
+Mide el rendimiento en megapíxeles por segundo de app_editor/utils/filtros.py.
+
+Para cada filtro y radio (sigma en el desenfoque gaussiano y la máscara de
+enfoque) mide filtros.filtrar con 1 hilo y con --hilos hilos, y el filtro
+equivalente de PIL.ImageFilter cuando existe, sobre la imagen ya convertida
+(sin contar la conversión). El desenfoque de caja usa sumas acumuladas, así
+que su tiempo no debería crecer con el radio.
+
+Uso:
+    python benchmarks/bench_filtros.py [--ancho 6000] [--alto 4000] [--repeticiones 3]
+        [--hilos 4] [--radios 1 2 5 10]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_editor.utils import filtros  # noqa: E402
+
+# filtro -> (usa radio, filtro de PIL para un radio o None)
+FILTROS = {
+    'gaussian_blur': (True, lambda radio: ImageFilter.GaussianBlur(radio)),
+    'unsharp_mask': (True, lambda radio: ImageFilter.UnsharpMask(radio, 100, 0)),
+    'box_blur': (True, lambda radio: ImageFilter.BoxBlur(radio)),
+    'median': (True, lambda radio: ImageFilter.MedianFilter(2 * radio + 1)),
+    'sobel': (False, None),
+    'laplacian': (False, None),
+}
+
+# La mediana de radios grandes tarda mucho más que el resto
+RADIO_MAXIMO_MEDIANA = 2
+
+
+def cronometrar(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+def imagen(alto, ancho):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:alto, 0:ancho].astype(np.float32)
+    foto = np.stack((128 + 100 * np.sin(x / 40), 128 + 100 * np.cos(y / 30), 255 * x / ancho), axis=-1)
+    foto += rng.normal(0, 6, foto.shape)
+    return np.clip(foto, 0, 255).astype(np.uint8)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ancho', type=int, default=6000)
+    parser.add_argument('--alto', type=int, default=4000)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--hilos', type=int, default=4)
+    parser.add_argument('--radios', type=float, nargs='+', default=[1, 2, 5, 10])
+    args = parser.parse_args()
+
+    img = imagen(args.alto, args.ancho)
+    pil = Image.fromarray(img)
+    megapixeles = args.alto * args.ancho / 1e6
+    print(f"Imagen {args.ancho}x{args.alto} ({megapixeles:.1f} MP), MP/s (más es mejor)")
+    print(f"{'filtro':<15}{'radio':>6}{'1 hilo':>9}{f'{args.hilos} hilos':>10}{'PIL':>9}")
+    for nombre, (usa_radio, filtro_pil) in FILTROS.items():
+        radios = args.radios if usa_radio else [None]
+        if nombre == 'median':
+            radios = [radio for radio in radios if radio <= RADIO_MAXIMO_MEDIANA]
+        for radio in radios:
+            parametros = {filtros.PARAMETROS[nombre][0][0]: radio} if usa_radio else {}
+            filtro = filtros.operacion(nombre, **parametros)
+            t_uno = cronometrar(lambda: filtros.filtrar(img, filtro), args.repeticiones)
+            t_hilos = cronometrar(lambda: filtros.filtrar(img, filtro, args.hilos), args.repeticiones)
+            columna_pil = '-'
+            if filtro_pil is not None:
+                t_pil = cronometrar(lambda: pil.filter(filtro_pil(int(radio) if nombre == 'median' else radio)),
+                                    args.repeticiones)
+                columna_pil = f'{megapixeles / t_pil:.1f}'
+            print(f"{nombre:<15}{'-' if radio is None else f'{radio:g}':>6}{megapixeles / t_uno:>9.1f}"
+                  f"{megapixeles / t_hilos:>10.1f}{columna_pil:>9}")
+
+
+if __name__ == '__main__':
+    main()
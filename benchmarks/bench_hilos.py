@@ -0,0 +1,110 @@
+"""
+Escalado con el número de hilos de las funciones de imgPro e imgPro8 y de
+una cadena de bloques repartidas por bandas de filas.
+
+Cada función puntual se mide aplicada a la imagen entera de una vez (la
+llamada original, un solo hilo) y con bloques.por_bandas de 1 a N hilos; la
+cadena (desenfoque gaussiano seguido de una curva de brillo, como la aplica
+el editor) se mide con bloques.ensamblar. Se comprueba que el resultado por
+bandas coincide con la llamada original y se muestra el tiempo y la
+aceleración respecto a un hilo. Los hilos solo aceleran si NumPy libera el
+GIL en la función y hay núcleos libres; el número de núcleos del equipo se
+muestra en la cabecera.
+
+Uso:
+    python benchmarks/bench_hilos.py [--megapixeles 24] [--hilos 1 2 4 8] [--repeticiones 3] [--alto-banda 256]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_editor.utils import bloques, filtros, imgPro, imgPro8  # noqa: E402
+
+# nombre -> (función, argumentos, trabaja sobre la imagen normalizada en float)
+FUNCIONES = {
+    'imgPro.luminosity': (imgPro.luminosity, (), True),
+    'imgPro.midgray': (imgPro.midgray, (), True),
+    'imgPro.extract_layer_cmy': (imgPro.extract_layer_cmy, (1,), True),
+    'imgPro.bright': (imgPro.bright, (0.2,), True),
+    'imgPro8.luminosity': (imgPro8.luminosity, (), False),
+    'imgPro8.midgray': (imgPro8.midgray, (), False),
+    'imgPro8.extract_layer_cmy': (imgPro8.extract_layer_cmy, (1,), False),
+    'imgPro8.bright': (imgPro8.bright, (0.2,), False),
+}
+
+
+def imagen(megapixeles):
+    ancho = int(round((megapixeles * 1e6 * 3 / 2) ** 0.5))
+    alto = int(round(megapixeles * 1e6 / ancho))
+    rng = np.random.default_rng(0)
+    img = np.empty((alto, ancho, 3), dtype=np.uint8)
+    for fila in range(0, alto, 512):
+        img[fila:fila + 512] = rng.integers(0, 256, (min(512, alto - fila), ancho, 3), dtype=np.uint8)
+    return img
+
+def hilos_por_defecto():
+    """
+    Potencias de dos hasta el número de núcleos, más ese número.
+    """
+    nucleos = os.cpu_count() or 1
+    return sorted({2 ** n for n in range(nucleos.bit_length()) if 2 ** n <= nucleos} | {nucleos})
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--megapixeles', type=float, default=24)
+    parser.add_argument('--hilos', type=int, nargs='+', default=hilos_por_defecto())
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--alto-banda', type=int, default=bloques.ALTO_BANDA)
+    args = parser.parse_args()
+
+    img = imagen(args.megapixeles)
+    normalizada = img / 255.0
+    print(f"Imagen de {img.shape[1]}x{img.shape[0]} ({args.megapixeles:g} MP), {os.cpu_count()} núcleos, "
+          f"bandas de {args.alto_banda} filas")
+    print(f"{'caso':<28}{'hilos':>7}{'ms':>10}{'acel.':>8}")
+
+    def informar(caso, hilos, segundos, base):
+        print(f"{caso:<28}{hilos:>7}{segundos * 1e3:>10.1f}{base / segundos:>8.2f}", flush=True)
+
+    for nombre, (funcion, argumentos, flotante) in FUNCIONES.items():
+        entrada = normalizada if flotante else img
+        base = medir(lambda: funcion(entrada, *argumentos), args.repeticiones)
+        informar(nombre, 'orig', base, base)
+        muestra = slice(0, None, 97) # se compara una muestra de filas para no duplicar la memoria
+        for hilos in args.hilos:
+            resultado = bloques.por_bandas(funcion, entrada, *argumentos, hilos=hilos, alto_banda=args.alto_banda)
+            if not np.allclose(resultado[muestra], funcion(entrada[muestra], *argumentos)):
+                raise AssertionError(f'{nombre} por bandas no coincide con la llamada original')
+            del resultado
+            segundos = medir(lambda: bloques.por_bandas(funcion, entrada, *argumentos, hilos=hilos,
+                                                         alto_banda=args.alto_banda), args.repeticiones)
+            informar(nombre, hilos, segundos, base)
+    del normalizada
+
+    cadena = [filtros.operacion('gaussian_blur', sigma=2), bloques.Puntual(imgPro8.bright, 0.2)]
+    esperado = bloques.procesar_completa(img, cadena)
+    base = medir(lambda: bloques.procesar_completa(img, cadena), args.repeticiones)
+    informar('cadena gaussiano+brillo', 'orig', base, base)
+    for hilos in args.hilos:
+        if not np.array_equal(bloques.ensamblar(img, cadena, args.alto_banda, hilos), esperado):
+            raise AssertionError('La cadena por bandas no coincide con la imagen completa')
+        segundos = medir(lambda: bloques.ensamblar(img, cadena, args.alto_banda, hilos), args.repeticiones)
+        informar('cadena gaussiano+brillo', hilos, segundos, base)
+
+
+if __name__ == '__main__':
+    main()
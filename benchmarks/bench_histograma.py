@@ -0,0 +1,76 @@
+"""
+Compara el histograma por niveles de imgPro.mhist (256 pasadas por canal)
+con el histograma de una pasada de app_editor/utils/histograma.py.
+
+El bucle original se conserva aquí como mhist_bucles (sin la parte de
+matplotlib) como referencia. Para los histogramas r, g, b y luminancia mide el
+bucle, np.bincount por canal y histograma.estadisticas (que además calcula
+media, desviación y percentiles por bandas), y verifica que los conteos
+coincidan.
+
+Uso:
+    python benchmarks/bench_histograma.py [--ancho 6000] [--alto 4000] [--repeticiones 3]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_editor.utils import histograma, imgPro8  # noqa: E402
+
+
+def mhist_bucles(RGB):
+    histograma = np.zeros(256)
+    for nivel in range(256):
+        histograma[nivel] = np.sum(RGB == nivel)
+    return histograma
+
+def canales(img):
+    return [img[:, :, 0], img[:, :, 1], img[:, :, 2], imgPro8.luminosity(img)[:, :, 0]]
+
+def por_bucles(img):
+    return np.array([mhist_bucles(canal) for canal in canales(img)])
+
+def por_canal(img):
+    return np.array([np.bincount(canal.ravel(), minlength=256) for canal in canales(img)])
+
+def una_pasada(img):
+    datos = histograma.estadisticas(img)
+    return np.array([datos[nombre]['histograma'] for nombre in ('r', 'g', 'b', 'luminancia')])
+
+CAMINOS = [('mhist (bucle)', por_bucles), ('bincount por canal', por_canal), ('histograma.estadisticas', una_pasada)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ancho', type=int, default=6000)
+    parser.add_argument('--alto', type=int, default=4000)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (args.alto, args.ancho, 3), dtype=np.uint8)
+
+    print(f"Imagen {args.ancho}x{args.alto} ({args.ancho * args.alto / 1e6:.1f} MP), canales r, g, b y luminancia")
+    print(f"{'camino':<26}{'ms':>10}{'x':>8}{'igual':>7}")
+    referencia = t_referencia = None
+    for nombre, camino in CAMINOS:
+        repeticiones = 1 if camino is por_bucles else args.repeticiones # el bucle tarda decenas de segundos
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            conteos = camino(img)
+            tiempos.append(time.perf_counter() - inicio)
+        t = min(tiempos)
+        if referencia is None:
+            referencia, t_referencia = conteos, t
+        igual = bool(np.array_equal(referencia, conteos))
+        print(f"{nombre:<26}{t * 1e3:>10.0f}{t_referencia / t:>8.1f}{'si' if igual else 'NO':>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Mide la latencia de la vista previa en vivo frente al render completo.
+
+Para cada tamaño de imagen mide la construcción del proxy (una vez por
+imagen), la vista previa de una curva de brillo y contraste sobre el proxy
+(proceso + JPEG/WebP) y el render a resolución completa tal como lo hace la
+vista al confirmar (proceso + PNG), y marca las vistas previas que se pasan
+del presupuesto.
+
+Uso:
+    python benchmarks/bench_previa.py [--megapixeles 2 12 24] [--lado 1024]
+        [--presupuesto 50] [--repeticiones 5]
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_editor.utils import acciones, bloques, imgPro8, previa  # noqa: E402
+
+
+def cronometrar(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return resultado, min(tiempos) * 1e3
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--megapixeles', type=float, nargs='+', default=[2, 12, 24])
+    parser.add_argument('--lado', type=int, default=1024, help='lado mayor del proxy')
+    parser.add_argument('--calidad', type=int, default=80)
+    parser.add_argument('--presupuesto', type=float, default=50, help='presupuesto de la vista previa en ms')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    curva = imgPro8.ToneCurve().bright(0.1).bright_layer(-0.05, 2).contrast_dark(1.5)
+    operaciones = [bloques.Curva(curva)]
+    rng = np.random.default_rng(0)
+
+    print(f"Proxy de lado {args.lado}, presupuesto {args.presupuesto:.0f} ms")
+    print(f"{'MP':>6}{'proxy ms':>10}{'jpeg ms':>9}{'webp ms':>9}{'jpeg KB':>9}{'completo ms':>13}{'x':>7}  presupuesto")
+    for mp in args.megapixeles:
+        alto = int((mp * 1e6 * 3 / 4) ** 0.5)
+        ancho = int(alto * 4 / 3)
+        img = rng.integers(0, 256, (alto, ancho, 3), dtype=np.uint8)
+
+        proxy, t_proxy = cronometrar(lambda: previa.construir_proxy(img, args.lado), 1)
+        jpeg, t_jpeg = cronometrar(lambda: previa.codificar(
+            bloques.procesar_completa(proxy, operaciones), 'JPEG', args.calidad), args.repeticiones)
+        _, t_webp = cronometrar(lambda: previa.codificar(
+            bloques.procesar_completa(proxy, operaciones), 'WEBP', args.calidad), args.repeticiones)
+        _, t_completo = cronometrar(lambda: acciones.codificar(
+            img, operaciones, io.BytesIO(), megapixeles_bandas=16), 1)
+        estado = 'ok' if t_jpeg <= args.presupuesto else 'EXCEDIDO'
+        print(f"{mp:>6.0f}{t_proxy:>10.1f}{t_jpeg:>9.1f}{t_webp:>9.1f}{len(jpeg) / 1024:>9.0f}"
+              f"{t_completo:>13.0f}{t_completo / t_jpeg:>7.0f}  {estado}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Compara app_editor/utils/remuestreo.py con Image.resize de PIL.
+
+Para cada filtro y escala mide remuestreo.resize sobre el arreglo uint8 y
+Image.resize con el filtro equivalente sobre la misma imagen ya convertida a
+PIL (sin contar la conversión), y muestra la diferencia máxima y media en
+niveles entre los dos resultados. Al final compara la reducción por
+potencias de dos (camino rápido de reducir_area) con la reducción por bloques
+general, con el submuestreo original img[::k, ::k] y con Image.reduce.
+
+Uso:
+    python benchmarks/bench_remuestreo.py [--ancho 6000] [--alto 4000] [--repeticiones 3]
+        [--escalas 0.5 0.25 0.37 1.5]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_editor.utils import remuestreo  # noqa: E402
+
+FILTROS_PIL = {
+    'nearest': Image.NEAREST,
+    'box': Image.BOX,
+    'bilinear': Image.BILINEAR,
+    'lanczos': Image.LANCZOS,
+}
+
+
+def cronometrar(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return resultado, min(tiempos) * 1e3
+
+def imagen(alto, ancho):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:alto, 0:ancho].astype(np.float32)
+    foto = np.stack((128 + 100 * np.sin(x / 40), 128 + 100 * np.cos(y / 30), 255 * x / ancho), axis=-1)
+    foto += rng.normal(0, 6, foto.shape)
+    return np.clip(foto, 0, 255).astype(np.uint8)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ancho', type=int, default=6000)
+    parser.add_argument('--alto', type=int, default=4000)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--escalas', type=float, nargs='+', default=[0.5, 0.25, 0.37, 1.5])
+    args = parser.parse_args()
+
+    img = imagen(args.alto, args.ancho)
+    pil = Image.fromarray(img)
+    print(f"Imagen {args.ancho}x{args.alto} ({args.ancho * args.alto / 1e6:.1f} MP)")
+    print(f"{'filtro':<10}{'escala':>7}{'salida':>12}{'ms':>8}{'PIL ms':>8}{'x':>6}{'dif max':>9}{'dif media':>11}")
+    for filtro, filtro_pil in FILTROS_PIL.items():
+        for escala in args.escalas:
+            alto, ancho = remuestreo.tamano_escalado(args.alto, args.ancho, escala)
+            remuestreo.resize(img[:64, :64], 8, 8, filtro) # calienta el caché de coeficientes de otro tamaño
+            propio, t_propio = cronometrar(lambda: remuestreo.resize(img, alto, ancho, filtro), args.repeticiones)
+            referencia, t_pil = cronometrar(lambda: np.asarray(pil.resize((ancho, alto), filtro_pil)),
+                                            args.repeticiones)
+            diferencia = np.abs(propio.astype(np.int16) - referencia)
+            print(f"{filtro:<10}{escala:>7.2f}{f'{ancho}x{alto}':>12}{t_propio:>8.0f}{t_pil:>8.0f}"
+                  f"{t_pil / t_propio:>6.2f}{diferencia.max():>9}{diferencia.mean():>11.4f}")
+
+    print()
+    print(f"{'reducción':<24}{'2x ms':>8}{'4x ms':>8}{'8x ms':>8}")
+    caminos = [
+        ('potencias de dos', remuestreo.reducir_area),
+        ('bloques (reduceat)', lambda img, factor: remuestreo.reducir_area(img[:, :-1], factor)),
+        ('img[::k, ::k]', lambda img, factor: img[::factor, ::factor].copy()),
+        ('Image.reduce', lambda img, factor: np.asarray(pil.reduce(factor))),
+    ]
+    for nombre, camino in caminos:
+        tiempos = [cronometrar(lambda: camino(img, factor), args.repeticiones)[1] for factor in (2, 4, 8)]
+        print(f"{nombre:<24}" + ''.join(f"{t:>8.0f}" for t in tiempos))
+
+
+if __name__ == '__main__':
+    main()
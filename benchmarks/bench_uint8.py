@@ -0,0 +1,79 @@
+"""
+Compara el camino flotante (imgPro) con el camino entero (imgPro8) sobre una
+imagen sintética de 24 megapíxeles.
+
+Para cada operación mide el tiempo total de la petición tal como lo hacen las
+vistas (normalizar, operar, recortar y desnormalizar en el caso flotante) y el
+pico de memoria reservado por NumPy, y verifica que ambos resultados difieran
+como máximo en 1 nivel.
+
+Uso:
+    python benchmarks/bench_uint8.py [--ancho 6000] [--alto 4000] [--repeticiones 3]
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_editor.utils import imgPro, imgPro8  # noqa: E402
+
+OPERACIONES = [
+    ('reverse', lambda m, a: m.reverse(a)),
+    ('extract_layer_cmy', lambda m, a: m.extract_layer_cmy(a, 1)),
+    ('average', lambda m, a: m.average(a)),
+    ('luminosity', lambda m, a: m.luminosity(a)),
+    ('midgray', lambda m, a: m.midgray(a)),
+    ('bright', lambda m, a: m.bright(a, 0.2)),
+    ('contrast_dark', lambda m, a: m.contrast_dark(a, 1.5)),
+    ('contrast_light', lambda m, a: m.contrast_light(a, 0.8)),
+]
+
+
+def camino_flotante(operacion, img):
+    arr = img / 255
+    nueva = np.clip(operacion(imgPro, arr), 0, 1)
+    return (nueva * 255).astype(np.uint8)
+
+def camino_entero(operacion, img):
+    return operacion(imgPro8, img)
+
+def medir(camino, operacion, img, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = camino(operacion, img)
+        tiempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    camino(operacion, img)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, min(tiempos), pico
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ancho', type=int, default=6000)
+    parser.add_argument('--alto', type=int, default=4000)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (args.alto, args.ancho, 3), dtype=np.uint8)
+    mp = args.ancho * args.alto / 1e6
+
+    print(f"Imagen {args.ancho}x{args.alto} ({mp:.1f} MP)")
+    print(f"{'operacion':<20}{'float ms':>10}{'uint8 ms':>10}{'x':>7}{'float MB':>10}{'uint8 MB':>10}{'dif':>5}")
+    for nombre, operacion in OPERACIONES:
+        ref, t_f, m_f = medir(camino_flotante, operacion, img, args.repeticiones)
+        res, t_i, m_i = medir(camino_entero, operacion, img, args.repeticiones)
+        dif = int(np.max(np.abs(ref.astype(np.int16) - res.astype(np.int16))))
+        print(f"{nombre:<20}{t_f * 1e3:>10.1f}{t_i * 1e3:>10.1f}{t_f / t_i:>7.1f}"
+              f"{m_f / 2**20:>10.1f}{m_i / 2**20:>10.1f}{dif:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Prueba de carga del editor: compara peticiones por segundo y latencias
+(p50/p99) de la vista síncrona (WSGI) y la asíncrona (ASGI) bajo concurrencia.
+
+Levantar los dos servidores con el mismo número de procesos, por ejemplo:
+    gunicorn editor.wsgi -w 1 --threads 8 -b 127.0.0.1:8000
+    uvicorn editor.asgi:application --workers 1 --port 8001
+
+y ejecutar:
+    python benchmarks/carga.py http://127.0.0.1:8000/ http://127.0.0.1:8001/async/ \
+        [--concurrencia 32] [--peticiones 400] [--lado 2000]
+
+Cada petición pide un brillo distinto para que la caché de resultados no
+responda sin procesar. Solo usa la biblioteca estándar y NumPy/PIL para
+generar la imagen de prueba.
+"""
+import argparse
+import http.cookiejar
+import io
+import random
+import re
+import statistics
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+
+class Sesion:
+    """
+    Cliente HTTP mínimo con cookies y token CSRF de Django.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.cookies = http.cookiejar.CookieJar()
+        self.abridor = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        self.abridor.open(url).read()
+        self.token = next(c.value for c in self.cookies if c.name == 'csrftoken')
+
+    def _post(self, cuerpo, tipo):
+        peticion = urllib.request.Request(self.url, data=cuerpo, method='POST', headers={
+            'Content-Type': tipo, 'X-CSRFToken': self.token, 'Referer': self.url})
+        with self.abridor.open(peticion) as respuesta:
+            return respuesta.read().decode()
+
+    def subir(self, datos_png):
+        limite = uuid.uuid4().hex
+        cuerpo = (f'--{limite}\r\nContent-Disposition: form-data; name="imagen"; filename="carga.png"\r\n'
+                  f'Content-Type: image/png\r\n\r\n').encode() + datos_png + f'\r\n--{limite}--\r\n'.encode()
+        html = self._post(cuerpo, f'multipart/form-data; boundary={limite}')
+        return re.search(r'name="imagen_actual" value="([^"]+)"', html).group(1)
+
+    def editar(self, campos):
+        return self._post(urllib.parse.urlencode(campos).encode(), 'application/x-www-form-urlencoded')
+
+
+def imagen_prueba(lado):
+    rng = np.random.default_rng(0)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (lado, lado, 3), dtype=np.uint8)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+def medir(url, datos_png, concurrencia, peticiones):
+    sesion = Sesion(url)
+    imagen_actual = sesion.subir(datos_png)
+
+    def una(_):
+        campos = {'imagen_actual': imagen_actual, 'accion': 'aplicar_brillo',
+                  'valor_brillo': f'{random.uniform(-0.5, 0.5):.4f}'}
+        inicio = time.perf_counter()
+        try:
+            sesion.editar(campos)
+            return time.perf_counter() - inicio, True
+        except OSError:
+            return time.perf_counter() - inicio, False
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(concurrencia) as pool:
+        resultados = list(pool.map(una, range(peticiones)))
+    total = time.perf_counter() - inicio
+    latencias = [t for t, ok in resultados if ok]
+    return {
+        'rps': len(latencias) / total,
+        'p50': percentil(latencias, 50) if latencias else float('nan'),
+        'p99': percentil(latencias, 99) if latencias else float('nan'),
+        'media': statistics.mean(latencias) if latencias else float('nan'),
+        'errores': len(resultados) - len(latencias),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('urls', nargs='+', help='URLs de las vistas a comparar (p. ej. / en WSGI y /async/ en ASGI)')
+    parser.add_argument('--concurrencia', type=int, default=32)
+    parser.add_argument('--peticiones', type=int, default=400)
+    parser.add_argument('--lado', type=int, default=2000, help='lado en píxeles de la imagen de prueba')
+    args = parser.parse_args()
+
+    datos_png = imagen_prueba(args.lado)
+    print(f"{args.peticiones} peticiones, concurrencia {args.concurrencia}, imagen {args.lado}x{args.lado}")
+    print(f"{'url':<40}{'req/s':>8}{'p50 ms':>10}{'p99 ms':>10}{'errores':>9}")
+    for url in args.urls:
+        r = medir(url, datos_png, args.concurrencia, args.peticiones)
+        print(f"{url:<40}{r['rps']:>8.1f}{r['p50'] * 1e3:>10.0f}{r['p99'] * 1e3:>10.0f}{r['errores']:>9}")
+
+
+if __name__ == '__main__':
+    main()
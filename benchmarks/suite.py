@@ -0,0 +1,321 @@
+"""
+Suite de rendimiento reproducible: cada función de imgPro (y su versión
+entera de imgPro8 cuando existe) y el camino HTTP completo de views.index.
+
+Genera imágenes sintéticas deterministas de 1, 12 y 24 MP (100 MP con
+--megapixeles 100; el camino flotante de imgPro necesita varios GB a ese
+tamaño), mide cada caso --repeticiones veces y guarda en JSON la latencia
+(media y percentiles 50/90/99), el rendimiento en MP/s y el pico de RSS del
+caso. El camino HTTP pasa por el cliente de pruebas de Django: sube la imagen
+y aplica cada acción del formulario, con la caché de resultados vacía: el
+almacenamiento y la caché van por contenido, así que cada repetición sube una
+imagen distinta (cambia un píxel) y ninguna acción encuentra su resultado. La
+base de datos es una copia temporal migrada, no el db.sqlite3 del proyecto.
+
+Con --base se comparan los resultados con una ejecución guardada y se marcan
+como regresión los casos cuyo p50 empeora más de --tolerancia; el programa
+termina con código 1 si hay alguna. --actual compara dos archivos sin medir.
+
+El pico de RSS de cada caso se mide reiniciando VmHWM (/proc/self/clear_refs,
+Linux); en otros sistemas se informa el máximo del proceso hasta ese momento.
+
+Uso:
+    python benchmarks/suite.py [--megapixeles 1 12 24] [--repeticiones 5] [--casos bright rotarImg ...]
+        [--sin-http] [--salida resultados.json] [--base base.json] [--tolerancia 0.1] [--actual otro.json]
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import matplotlib
+matplotlib.use('Agg') # mhist llama a plt.show; sin ventana, solo se mide el dibujo
+
+import numpy as np
+from PIL import Image
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+from app_editor.utils import imgPro, imgPro8  # noqa: E402
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+PERCENTILES = (50, 90, 99)
+
+
+def _gris(img):
+    return img[:, :, 0]
+
+def _mhist(img):
+    import matplotlib.pyplot as plt
+    imgPro.mhist(_gris(img))
+    plt.close('all')
+
+def _recorte(img):
+    alto, ancho = img.shape[:2]
+    return ancho // 4, alto // 4, 3 * ancho // 4, 3 * alto // 4
+
+# nombre -> función(imagen normalizada float64, segunda imagen normalizada)
+CASOS_IMGPRO = {
+    'extract_layer_rgb': lambda img, otra: imgPro.extract_layer_rgb(img, 0),
+    'extract_layer_cmy': lambda img, otra: imgPro.extract_layer_cmy(img, 0),
+    'reverse': lambda img, otra: imgPro.reverse(img),
+    'average': lambda img, otra: imgPro.average(img),
+    'luminosity': lambda img, otra: imgPro.luminosity(img),
+    'midgray': lambda img, otra: imgPro.midgray(img),
+    'bright': lambda img, otra: imgPro.bright(img, 0.2),
+    'bright_layer': lambda img, otra: imgPro.bright_layer(img, 0.2, 1),
+    'contrast_dark': lambda img, otra: imgPro.contrast_dark(img, 0.8),
+    'contrast_light': lambda img, otra: imgPro.contrast_light(img, 0.8),
+    'binarize': lambda img, otra: imgPro.binarize(img, 0.5),
+    'crop': lambda img, otra: imgPro.crop(img, *_recorte(img)),
+    'trasnslation': lambda img, otra: imgPro.trasnslation(img, 120, 80),
+    'lower_resolution': lambda img, otra: imgPro.lower_resolution(img, 2),
+    'zoom': lambda img, otra: imgPro.zoom(img, 1.5),
+    'rotarImg': lambda img, otra: imgPro.rotarImg(img, 30),
+    'fusion_images': lambda img, otra: imgPro.fusion_images(img, otra),
+    'fusion_images_ecualized': lambda img, otra: imgPro.fusion_images_ecualized(img, otra, 0.3),
+}
+
+# funciones de imgPro que esperan niveles 0-255 -> función(imagen uint8)
+CASOS_IMGPRO_NIVELES = {
+    'mhist': _mhist,
+}
+
+# nombre -> función(imagen uint8), versiones enteras de imgPro8
+CASOS_IMGPRO8 = {
+    'extract_layer_cmy': lambda img: imgPro8.extract_layer_cmy(img, 0),
+    'reverse': imgPro8.reverse,
+    'average': imgPro8.average,
+    'luminosity': imgPro8.luminosity,
+    'midgray': imgPro8.midgray,
+    'bright': lambda img: imgPro8.bright(img, 0.2),
+    'bright_layer': lambda img: imgPro8.bright_layer(img, 0.2, 1),
+    'contrast_dark': lambda img: imgPro8.contrast_dark(img, 0.8),
+    'contrast_light': lambda img: imgPro8.contrast_light(img, 0.8),
+    'binarize': lambda img: imgPro8.binarize(img, 0.5),
+    'crop': lambda img: imgPro8.crop(img, *_recorte(img)),
+}
+
+# acción del formulario -> campos adicionales
+ACCIONES_HTTP = {
+    'extract_R': {},
+    'extract_C': {},
+    'negativo': {},
+    'grayscale': {'tipo_grises': 'luminosity'},
+    'aplicar_brillo': {'valor_brillo': '0.2'},
+    'rotar': {'angulo': '30'},
+    'ecualizar': {},
+    'filtrar': {'filtro': 'gaussian_blur', 'intensidad_filtro': '2'},
+}
+
+
+def imagen(megapixeles, semilla=0):
+    """
+    Imagen uint8 RGB 3:2 de unos megapixeles, con degradados y ruido (no se
+    comprime como un color plano ni como ruido puro).
+    """
+    ancho = int(round((megapixeles * 1e6 * 3 / 2) ** 0.5))
+    alto = int(round(megapixeles * 1e6 / ancho))
+    rng = np.random.default_rng(semilla)
+    x = np.linspace(0, 1, ancho, dtype=np.float32)
+    y = np.linspace(0, 1, alto, dtype=np.float32)[:, np.newaxis]
+    img = np.empty((alto, ancho, 3), dtype=np.uint8)
+    for canal, (fx, fy) in enumerate(((7, 3), (4, 9), (11, 5))):
+        for fila in range(0, alto, 512): # por bandas para no reservar la imagen en float
+            banda = 128 + 90 * np.sin(fx * x + fy * y[fila:fila + 512] + canal)
+            banda += rng.normal(0, 8, banda.shape).astype(np.float32)
+            img[fila:fila + 512, :, canal] = np.clip(banda, 0, 255)
+    return img
+
+def reiniciar_pico():
+    try:
+        with open('/proc/self/clear_refs', 'w') as archivo:
+            archivo.write('5') # reinicia VmHWM
+    except OSError:
+        pass
+
+def pico_rss():
+    try:
+        with open('/proc/self/status') as archivo:
+            for linea in archivo:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+def resumen(caso, megapixeles, tiempos, pico):
+    ordenados = sorted(tiempos)
+    datos = {'caso': caso, 'megapixeles': megapixeles, 'repeticiones': len(tiempos),
+             'media_ms': round(sum(tiempos) / len(tiempos) * 1e3, 3)}
+    for p in PERCENTILES: # rango más cercano
+        datos[f'p{p}_ms'] = round(ordenados[min(len(ordenados) - 1, int(np.ceil(len(ordenados) * p / 100)) - 1)] * 1e3, 3)
+    datos['mp_s'] = round(megapixeles / (datos['p50_ms'] / 1e3), 2) if datos['p50_ms'] else None
+    datos['pico_rss_bytes'] = pico
+    return datos
+
+def medir(caso, megapixeles, funcion, repeticiones):
+    tiempos = []
+    reiniciar_pico()
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return resumen(caso, megapixeles, tiempos, pico_rss())
+
+def medir_funciones(megapixeles, repeticiones, casos, informar):
+    img = imagen(megapixeles)
+    otra = imagen(megapixeles * 0.8, semilla=1) # fusion_images redimensiona
+    normalizada, otra_normalizada = img / 255.0, otra / 255.0
+    otra_igual = imagen(megapixeles, semilla=1) / 255.0
+    for nombre, funcion in CASOS_IMGPRO.items():
+        if casos and nombre not in casos:
+            continue
+        segunda = otra_igual if nombre == 'fusion_images_ecualized' else otra_normalizada
+        informar(medir(f'imgPro.{nombre}', megapixeles, lambda: funcion(normalizada, segunda), repeticiones))
+    del normalizada, otra_normalizada, otra_igual
+    for nombre, funcion in CASOS_IMGPRO_NIVELES.items():
+        if casos and nombre not in casos:
+            continue
+        informar(medir(f'imgPro.{nombre}', megapixeles, lambda: funcion(img), repeticiones))
+    for nombre, funcion in CASOS_IMGPRO8.items():
+        if casos and nombre not in casos:
+            continue
+        informar(medir(f'imgPro8.{nombre}', megapixeles, lambda: funcion(img), repeticiones))
+
+def preparar_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'editor.settings')
+    os.chdir(RAIZ) # TEMPLATES usa la ruta relativa 'templates', como con manage.py
+    import django
+    from django.conf import settings
+    # base de datos temporal con las migraciones aplicadas, como hace el ejecutor de pruebas
+    descriptor, base = tempfile.mkstemp(prefix='suite_db_', suffix='.sqlite3')
+    os.close(descriptor)
+    settings.DATABASES['default'] = dict(settings.DATABASES['default'], NAME=base)
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    from django.test.utils import setup_test_environment
+    setup_test_environment() # permite el host testserver y no aplica CSRF
+    settings.MEDIA_ROOT = tempfile.mkdtemp(prefix='suite_media_')
+    settings.EDITOR_RESPUESTA_DIRECTA = dict(settings.EDITOR_RESPUESTA_DIRECTA, ACTIVA=False)
+    from django.test import Client
+    return Client()
+
+def medir_http(cliente, megapixeles, repeticiones, casos, informar):
+    img = imagen(megapixeles)
+    tiempos = {'subir': []}
+    picos = {}
+    for repeticion in range(repeticiones):
+        # un píxel distinto por repetición: otro contenido, otra clave en la caché de resultados
+        img[0, 0] = (repeticion & 255, (repeticion >> 8) & 255, (repeticion >> 16) & 255)
+        archivo = io.BytesIO()
+        Image.fromarray(img).save(archivo, 'PNG', compress_level=1)
+        archivo.seek(0)
+        archivo.name = f'suite_{megapixeles}mp_{repeticion}.png'
+        reiniciar_pico()
+        inicio = time.perf_counter()
+        respuesta = cliente.post('/', {'imagen': archivo})
+        tiempos['subir'].append(time.perf_counter() - inicio)
+        picos['subir'] = max(picos.get('subir') or 0, pico_rss() or 0)
+        imagen_url = respuesta.context['imagen_url']
+        for accion, campos in ACCIONES_HTTP.items():
+            if casos and accion not in casos:
+                continue
+            reiniciar_pico()
+            inicio = time.perf_counter()
+            respuesta = cliente.post('/', dict(campos, imagen_actual=imagen_url, accion=accion))
+            tiempos.setdefault(accion, []).append(time.perf_counter() - inicio)
+            if respuesta.status_code != 200 or not respuesta.context['procesada_url']:
+                raise RuntimeError(f'La acción {accion} no devolvió un resultado ({respuesta.status_code}).')
+            picos[accion] = max(picos.get(accion) or 0, pico_rss() or 0)
+    for accion, lista in tiempos.items():
+        informar(resumen(f'http.{accion}', megapixeles, lista, picos.get(accion)))
+
+def entorno():
+    return {
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'plataforma': platform.platform(),
+        'procesador': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+def comparar(base, actual, tolerancia):
+    """
+    Imprime la comparación caso a caso y devuelve las regresiones.
+    """
+    anteriores = {(r['caso'], r['megapixeles']): r for r in base['resultados']}
+    regresiones = []
+    print(f"{'caso':<34}{'MP':>6}{'base p50':>11}{'p50':>10}{'cambio':>9}")
+    for resultado in actual['resultados']:
+        clave = (resultado['caso'], resultado['megapixeles'])
+        if clave not in anteriores:
+            continue
+        antes, ahora = anteriores[clave]['p50_ms'], resultado['p50_ms']
+        cambio = ahora / antes - 1 if antes else 0
+        marca = ''
+        if cambio > tolerancia:
+            marca = '  REGRESION'
+            regresiones.append(clave)
+        print(f"{resultado['caso']:<34}{resultado['megapixeles']:>6g}{antes:>11.1f}{ahora:>10.1f}{cambio:>+9.1%}{marca}")
+    return regresiones
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--megapixeles', type=float, nargs='+', default=[1, 12, 24])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--casos', nargs='+', help='solo estas funciones o acciones (por nombre, sin prefijo)')
+    parser.add_argument('--sin-http', action='store_true', help='no medir el camino HTTP')
+    parser.add_argument('--salida', help='archivo JSON donde guardar los resultados')
+    parser.add_argument('--base', help='resultados JSON de referencia con los que comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.10, help='empeoramiento del p50 tolerado (0.10 = 10 %%)')
+    parser.add_argument('--actual', help='compara este archivo con --base en vez de medir')
+    args = parser.parse_args()
+
+    if args.actual:
+        if not args.base:
+            parser.error('--actual necesita --base')
+        with open(args.base) as base, open(args.actual) as actual:
+            sys.exit(1 if comparar(json.load(base), json.load(actual), args.tolerancia) else 0)
+
+    resultados = []
+
+    def informar(resultado):
+        resultados.append(resultado)
+        print(f"{resultado['caso']:<34}{resultado['megapixeles']:>6g} MP  p50 {resultado['p50_ms']:>9.1f} ms"
+              f"  p99 {resultado['p99_ms']:>9.1f} ms  {resultado['mp_s'] or 0:>8.1f} MP/s"
+              f"  pico {(resultado['pico_rss_bytes'] or 0) / 2 ** 20:>7.0f} MiB", flush=True)
+
+    cliente = None if args.sin_http else preparar_django()
+    for megapixeles in args.megapixeles:
+        medir_funciones(megapixeles, args.repeticiones, args.casos, informar)
+        if cliente is not None:
+            medir_http(cliente, megapixeles, args.repeticiones, args.casos, informar)
+
+    datos = {'entorno': entorno(), 'repeticiones': args.repeticiones, 'resultados': resultados}
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            json.dump(datos, archivo, indent=2)
+        print(f'Resultados guardados en {args.salida}')
+    if args.base:
+        with open(args.base) as base:
+            sys.exit(1 if comparar(json.load(base), datos, args.tolerancia) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -122,7 +123,127 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-import os
 # Donde se guardarán los archivos subidos
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Las subidas se guardan por contenido (app_editor/almacenamiento.py): la
+# misma imagen subida dos veces es un solo archivo. 'manage.py limpiar_media'
+# borra lo que lleva tiempo sin usarse.
+STORAGES = {
+    'default': {
+        'BACKEND': 'app_editor.almacenamiento.AlmacenContenido',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Imágenes con al menos estos megapíxeles se procesan por bandas de filas
+# (app_editor/utils/bloques.py) para que la memoria no crezca con la imagen
+EDITOR_MEGAPIXELES_POR_BANDAS = 16
+
+# Hilos entre los que cada petición (o trabajo del pool) reparte las bandas de
+# filas de una cadena por bloques; 1 procesa las bandas en el mismo hilo. Se
+# multiplica por las peticiones simultáneas y los procesos de EDITOR_TRABAJOS,
+# así que no conviene pasar de los núcleos de la máquina.
+EDITOR_HILOS_BANDAS = min(8, os.cpu_count() or 1)
+
+# Caché de resultados procesados (app_editor/utils/resultados.py): directorio
+# dentro de MEDIA_ROOT y presupuestos en bytes del disco y de la memoria del proceso
+EDITOR_CACHE_RESULTADOS = {
+    'DIRECTORIO': 'resultados',
+    'BYTES_DISCO': 1024 * 1024 * 1024,
+    'BYTES_MEMORIA': 64 * 1024 * 1024,
+}
+
+# Presupuesto en bytes de la caché por proceso de imágenes decodificadas
+# (app_editor/utils/decodificadas.py)
+EDITOR_CACHE_DECODIFICADAS_BYTES = 512 * 1024 * 1024
+
+# Copias crudas (app_editor/utils/crudo.py) de las imágenes decodificadas,
+# compartidas por todos los procesos mediante mmap: directorio dentro de
+# MEDIA_ROOT y presupuesto en bytes del disco (3 bytes por píxel, unos 72 MB
+# por imagen de 24 MP)
+EDITOR_CACHE_CRUDOS = {
+    'DIRECTORIO': 'crudos',
+    'BYTES_DISCO': 2 * 1024 * 1024 * 1024,
+}
+
+# Procesos del pool que ejecuta las operaciones pedidas con 'asincrono'
+# (app_editor/trabajos.py)
+EDITOR_TRABAJOS = {
+    'PROCESOS': 2,
+}
+
+# Hilos donde la vista asíncrona (/async/, servida con ASGI) ejecuta el
+# procesamiento de imágenes fuera del bucle de eventos
+EDITOR_ASYNC_HILOS = 4
+
+# Vista previa en vivo (app_editor/utils/previa.py): lado mayor del proxy
+# reducido, calidad JPEG/WebP, presupuesto de latencia por vista previa y
+# bytes de la caché de proxies por proceso
+EDITOR_VISTA_PREVIA = {
+    'LADO': 1024,
+    'CALIDAD': 80,
+    'PRESUPUESTO_MS': 50,
+    'BYTES_CACHE': 128 * 1024 * 1024,
+}
+
+# Política de codificación de los resultados (app_editor/utils/salida.py):
+# formato por defecto, formatos que cada petición puede pedir con el campo
+# 'formato', calidad por defecto de JPEG/WebP y nivel de compresión de PNG
+# (0-9; los niveles bajos codifican mucho más rápido a cambio de más bytes)
+EDITOR_SALIDA = {
+    'FORMATO': 'png',
+    'FORMATOS': ('png', 'jpeg', 'webp', 'raw'),
+    'CALIDAD': 90,
+    'COMPRESION_PNG': 6,
+}
+
+# Respuesta directa: con ACTIVA las acciones del formulario no se procesan en
+# el POST, la imagen procesada se pide a /resultado/ y se codifica en esa
+# misma respuesta sin escribirla en MEDIA_ROOT. MAX_AGE son los segundos de
+# Cache-Control; el ETag (hash del original y los parámetros) permite
+# revalidar con 304 sin volver a procesar.
+EDITOR_RESPUESTA_DIRECTA = {
+    'ACTIVA': False,
+    'MAX_AGE': 3600,
+}
+
+# Métricas por etapa del camino de edición (app_editor/utils/metricas.py),
+# expuestas en /metricas/ para Prometheus solo a las IPS indicadas. MUESTREO
+# es la fracción de peticiones que se miden (0 desactiva la medición) y
+# MEMORIA activa el pico de memoria por petición con tracemalloc, que
+# ralentiza las reservas de memoria mientras está activo.
+EDITOR_METRICAS = {
+    'MUESTREO': 1.0,
+    'MEMORIA': False,
+    'IPS': ('127.0.0.1', '::1'),
+}
+
+# Historial de ediciones apiladas por sesión (app_editor/historial.py):
+# directorio de los puntos de control dentro de MEDIA_ROOT, pasos como
+# máximo entre un punto de control y el siguiente al reconstruir, pasos que
+# se conservan por imagen y bytes de puntos de control por sesión
+EDITOR_HISTORIAL = {
+    'DIRECTORIO': 'historial',
+    'PASOS_ENTRE_PUNTOS': 4,
+    'PASOS_MAXIMOS': 50,
+    'BYTES_SESION': 512 * 1024 * 1024,
+}
+
+# Ingesta de las imágenes subidas (app_editor/subidas.py): bytes máximos por
+# archivo (la subida se corta en cuanto los supera), píxeles máximos (se leen
+# de la cabecera, sin decodificar) y factores de la pirámide de versiones
+# reducidas que se precalcula al subir para la vista previa
+EDITOR_INGESTA = {
+    'BYTES_MAXIMOS': 200 * 1024 * 1024,
+    'PIXELES_MAXIMOS': 100_000_000,
+    'NIVELES': (2, 4, 8),
+}
+FILE_UPLOAD_HANDLERS = [
+    'app_editor.subidas.LimiteSubida',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]